@@ -1,89 +1,62 @@
 import os
 import copy
-import requests
+import json
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import hopsworks as hs
-
-# ===================== 站点清单 =====================
-# 可保留瑞典站 se-0001（无标签），并新增香港屯门站（有 CSV 标签）
-stations = [
-    {
-        "city": "SE_City_1",
-        "station_id": "se-0001",
-        "lat": 62.99,
-        "lon": 17.64,
-        "timezone": "Europe/Stockholm",
-        "sensor_csv": None,  # 无标签
-    },
-    {
-        "city": "HongKong",
-        "station_id": "hk-tuen-mun",
-        "lat": 22.394984,
-        "lon": 113.973140,
-        "timezone": "Asia/Hong_Kong",
-        "sensor_csv": r"D:\ID2223\tuen-mun-air-quality.csv",
-    },
-    {
-        "city": "HongKong",
-        "station_id": "hk-yuen-long",
-        "lat": 22.446221,          # 新站：元朗
-        "lon": 114.035288,
-        "timezone": "Asia/Hong_Kong",
-        "sensor_csv": r"D:\ID2223\yuen-long-air-quality.csv",  # 你的新CSV
-    },
-    {
-        "city": "HongKong",
-        "station_id": "hk-tsuen-wan",
-        "lat": 22.37167,
-        "lon": 114.11347,
-        "timezone": "Asia/Hong_Kong",
-        "sensor_csv": r"D:\ID2223\tsuen-wan-air-quality.csv",  # 你的新CSV
-    },
-    {
-        "city": "HongKong",
-        "station_id": "hk-Kwai-Chung",
-        "lat": 22.35104,
-        "lon": 114.13080,
-        "timezone": "Asia/Hong_Kong",
-        "sensor_csv": r"D:\ID2223\kwai-chung-air-quality.csv",  # 你的新CSV
-    },
-    {
-        "city": "HongKong",
-        "station_id": "hk-tung-chung",
-        "lat": 22.28924,
-        "lon": 113.94137,
-        "timezone": "Asia/Hong_Kong",
-        "sensor_csv": r"D:\ID2223\tung-chung-air-quality.csv",  # 你的新CSV
-    },
-]
+
+from airquality import fetch, hourly as hourly_fg, openmeteo, station_history
+from airquality.daily_agg import aggregate_daily
+from airquality.feature_store import get_feature_store
+from airquality.stations import stations
 
 # 回填/预测窗口（可用环境变量覆盖）
 DEFAULT_PAST_DAYS = int(os.getenv("PAST_DAYS", "14"))
 DEFAULT_FORECAST_DAYS = int(os.getenv("FORECAST_DAYS", "7"))  # 建议 6
 
+# 增量回填：记录每个 (city, station_id) 已写入的最新 date（高水位），之后只抓/只写增量窗口
+# FULL_BACKFILL=1 忽略水位，按旧逻辑全量回填
+STATE_PATH = os.getenv("BACKFILL_STATE", os.path.join(".state", "backfill_watermark.json"))
+FULL_BACKFILL = os.getenv("FULL_BACKFILL", "0") == "1"
+
+WEATHER_FG = ("weather_daily_forecast", 2)
+LABEL_FG = ("air_quality_daily", 2)
+HOURLY_FG = hourly_fg.HOURLY_FG
+
+# 同时写小时粒度特征组（不聚合的原始小时表，行数约为日度的 24 倍）；WRITE_HOURLY=0 关闭
+WRITE_HOURLY = os.getenv("WRITE_HOURLY", "1") != "0"
+
 # Open-Meteo 变量
 aq_vars = "pm2_5,pm10,ozone,nitrogen_dioxide,carbon_monoxide,sulphur_dioxide,us_aqi"
 wx_vars = "temperature_2m,relative_humidity_2m,dew_point_2m,wind_speed_10m,wind_direction_10m,precipitation,pressure_msl,visibility"
 
+AQ_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+WX_URL = "https://api.open-meteo.com/v1/forecast"
+
+# 并发抓取：站点 × 接口 同时发出；FETCH_WORKERS=1 即退化为串行
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+
+
+def _has_hourly(payload):
+    return isinstance(payload, dict) and "hourly" in payload
+
 
-def _fetch_openmeteo(url, params, name):
+def _fetch_openmeteo(url, params, name, session=None):
     """取 JSON；若没有 hourly，自动降级参数重试，仍失败就抛出带 reason 的错误"""
-    r = requests.get(url, params=params, timeout=60)
-    j = r.json()
+    # fetch.get_json：共享连接池 + 按接口限流 + 网络错误 / 429 / 5xx 指数退避重试
+    http = session or fetch.get_session()
+    j = fetch.get_json(url, params, session=http, timeout=60, accept=_has_hourly, label=name)
     if "hourly" in j:
         return j
 
     p = copy.deepcopy(params)
     p.pop("past_days", None)
-    r = requests.get(url, params=p, timeout=60)
-    j = r.json()
+    j = fetch.get_json(url, p, session=http, timeout=60, accept=_has_hourly, label=name)
     if "hourly" in j:
         return j
 
     p2 = copy.deepcopy(p)
     p2["hourly"] = "pm2_5" if name == "air" else "temperature_2m"
-    r = requests.get(url, params=p2, timeout=60)
-    j = r.json()
+    j = fetch.get_json(url, p2, session=http, timeout=60, accept=_has_hourly, label=name)
     if "hourly" in j:
         return j
 
@@ -97,23 +70,19 @@ def _hourly_to_df(payload, cols):
     return df
 
 
-def fetch_openmeteo_daily(lat, lon, tz, past_days=14, forecast_days=7):
-    aq = _fetch_openmeteo(
-        "https://air-quality-api.open-meteo.com/v1/air-quality",
-        {
-            "latitude": lat, "longitude": lon, "timezone": tz,
-            "hourly": aq_vars, "past_days": past_days, "forecast_days": forecast_days,
-        },
-        name="air",
-    )
-    wx = _fetch_openmeteo(
-        "https://api.open-meteo.com/v1/forecast",
-        {
-            "latitude": lat, "longitude": lon, "timezone": tz,
-            "hourly": wx_vars, "past_days": past_days, "forecast_days": forecast_days,
-        },
-        name="wx",
-    )
+def _endpoint_requests(lat, lon, tz, past_days, forecast_days):
+    """一个站点需要的 (name, url, params) 列表：空气质量 + 天气"""
+    base = {
+        "latitude": lat, "longitude": lon, "timezone": tz,
+        "past_days": past_days, "forecast_days": forecast_days,
+    }
+    return [
+        ("air", AQ_URL, {**base, "hourly": aq_vars}),
+        ("wx", WX_URL, {**base, "hourly": wx_vars}),
+    ]
+
+
+def _merge_hourly(aq, wx):
     hourly = _hourly_to_df(aq, aq_vars).merge(
         _hourly_to_df(wx, wx_vars), on="time", how="inner"
     )
@@ -121,85 +90,225 @@ def fetch_openmeteo_daily(lat, lon, tz, past_days=14, forecast_days=7):
     return hourly
 
 
-def read_sensor_daily(csv_path, city, station_id):
-    raw = pd.read_csv(csv_path, encoding="utf-8", encoding_errors="ignore")
-    raw.columns = [str(c).strip() for c in raw.columns]
-    lower_map = {c.lower(): c for c in raw.columns}
-
-    time_keys = [k for k in lower_map if k in ["time", "timestamp", "datetime", "date", "日期", "时间"]]
-    pm_keys = [k for k in lower_map if k in ["pm2.5", "pm2_5", "pm25", "pm 2.5", "pm-2.5", "pm₂.₅", "pm₂.5"]]
-    if not time_keys or not pm_keys:
-        raise ValueError(f"[{station_id}] 找不到时间/PM2.5 列。列名(规范化后)={list(lower_map.keys())}")
-
-    tcol = lower_map[time_keys[0]]
-    pcol = lower_map[pm_keys[0]]
-
-    df = raw[[tcol, pcol]].copy()
-    df[tcol] = pd.to_datetime(df[tcol], errors="coerce")
-    df[pcol] = pd.to_numeric(df[pcol], errors="coerce")
-    df = df.dropna(subset=[tcol, pcol])
-
-    df["date"] = df[tcol].dt.tz_localize(None).dt.normalize()
-    out = (
-        df.groupby("date", as_index=False)[pcol]
-          .mean()
-          .rename(columns={pcol: "pm2_5"})
-    )
-    out["city"] = city
-    out["station_id"] = station_id
-    return out[["city", "station_id", "date", "pm2_5"]]
+def fetch_openmeteo_daily(lat, lon, tz, past_days=14, forecast_days=7, session=None):
+    payloads = {
+        name: _fetch_openmeteo(url, params, name=name, session=session)
+        for name, url, params in _endpoint_requests(lat, lon, tz, past_days, forecast_days)
+    }
+    return _merge_hourly(payloads["air"], payloads["wx"])
+
+
+def _batch_groups(jobs):
+    """
+    按 timezone 分组：同组站点每个接口只发一个多坐标请求。
+    组内 past_days 取最大值（多抓的旧行会被水位过滤掉）。
+    返回 [(name, url, params, [station, ...]), ...]，params 不含经纬度。
+    """
+    by_tz = {}
+    for st, past_days in jobs:
+        by_tz.setdefault(st["timezone"], []).append((st, past_days))
+    groups = []
+    for tz, members in by_tz.items():
+        past_days = max(p for _, p in members)
+        for name, url, params in _endpoint_requests(None, None, tz, past_days, DEFAULT_FORECAST_DAYS):
+            base = {k: v for k, v in params.items() if k not in ("latitude", "longitude")}
+            groups.append((name, url, base, [st for st, _ in members]))
+    return groups
+
+
+def _fetch_group(name, url, params, members, session):
+    """一组站点一次请求；整批失败或某站点没有 hourly 时，对这些站点逐个走原来的降级重试"""
+    coords = [(st["lat"], st["lon"]) for st in members]
+    try:
+        payloads = openmeteo.get_many(url, params, coords, session=session, timeout=60, label=name)
+    except Exception as e:
+        print(f"[warn] batched {name} request failed ({type(e).__name__}: {e}); falling back to per-station calls")
+        payloads = [None] * len(members)
+
+    out = {}
+    for st, payload in zip(members, payloads):
+        if not _has_hourly(payload):
+            payload = _fetch_openmeteo(url, {**params, "latitude": st["lat"], "longitude": st["lon"]}, name, session)
+        out[(st["station_id"], name)] = payload
+    return out
+
+
+def fetch_openmeteo_many(jobs, max_workers=None):
+    """
+    并发抓取多个站点的小时数据。
+    jobs: [(station_dict, past_days), ...]
+    返回 {station_id: hourly_df}。
+    OPENMETEO_BATCH=1（默认）：同 timezone 的站点每个接口一个多坐标请求（请求数 O(1)，URL 过长时自动分批）；
+    OPENMETEO_BATCH=0：逐站点 × 接口并发请求，结果与逐站调用 fetch_openmeteo_daily 一致。
+    任一请求失败会在收集结果时抛出（与串行版本行为一致）。
+    """
+    max_workers = max(1, max_workers or FETCH_WORKERS)
+    session = fetch.get_session()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        payloads = {}
+        if openmeteo.BATCH:
+            futures = [pool.submit(_fetch_group, *g, session) for g in _batch_groups(jobs)]
+            for f in futures:
+                payloads.update(f.result())
+        else:
+            futures = {}
+            for st, past_days in jobs:
+                for name, url, params in _endpoint_requests(
+                    st["lat"], st["lon"], st["timezone"], past_days, DEFAULT_FORECAST_DAYS
+                ):
+                    futures[(st["station_id"], name)] = pool.submit(
+                        _fetch_openmeteo, url, params, name, session
+                    )
+            payloads = {k: f.result() for k, f in futures.items()}
+
+    out = {}
+    for st, _ in jobs:
+        sid = st["station_id"]
+        out[sid] = _merge_hourly(payloads[(sid, "air")], payloads[(sid, "wx")])
+    return out
 
 
-def build_weather_features_for_station(st):
-    """根据标签最新日期，自动放大 past_days；确保天气覆盖标签"""
+def read_sensor_daily(csv_path, city, station_id):
+    """
+    站点日度标签 [city, station_id, date, pm2_5]。
+    读 station_history 列式数据集（全部污染物都在里面，这里只取 PM2.5 作标签）；
+    CSV 未导入或已变化（mtime / size）时先导入该站点，之后不再解析原始 CSV。
+    """
+    df = station_history.load_station({"city": city, "station_id": station_id, "sensor_csv": csv_path})
+    out = df.dropna(subset=["pm2_5"])[["city", "station_id", "date", "pm2_5"]]
+    return out.astype({"pm2_5": "float64"}).reset_index(drop=True)
+
+
+# ===================== 高水位状态 =====================
+def load_watermarks(path=STATE_PATH):
+    if FULL_BACKFILL or not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_watermarks(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _fg_key(fg):
+    name, version = fg
+    return f"{name}_v{version}"
+
+
+def get_watermark(state, fg, city, station_id):
+    v = state.get(_fg_key(fg), {}).get(f"{city}|{station_id}")
+    return pd.Timestamp(v) if v else None
+
+
+def filter_new_rows(df, state, fg):
+    """只保留 date 严格大于该站水位的行"""
+    bucket = state.get(_fg_key(fg))
+    if df.empty or not bucket:
+        return df
+    wm = pd.to_datetime((df["city"].astype(str) + "|" + df["station_id"].astype(str)).map(bucket))
+    return df[wm.isna() | (pd.to_datetime(df["date"]) > wm)]
+
+
+def advance_watermarks(state, fg, df, upto=None):
+    """
+    用已成功写入的行推进水位。
+    upto: {station_id: Timestamp} 上限——天气表里今天及以后是预报，会被后续运行覆盖，
+    因此天气水位只推进到“昨天”。
+    """
+    if df.empty:
+        return state
+    bucket = state.setdefault(_fg_key(fg), {})
+    for (city, sid), g in df.groupby(["city", "station_id"]):
+        d = pd.to_datetime(g["date"]).max()
+        if upto and sid in upto:
+            d = min(d, upto[sid])
+        old = bucket.get(f"{city}|{sid}")
+        if old is None or d > pd.Timestamp(old):
+            bucket[f"{city}|{sid}"] = d.strftime("%Y-%m-%d")
+    return state
+
+
+def _today(st):
+    return pd.Timestamp.now(tz=st["timezone"]).normalize().tz_localize(None)
+
+
+def _want_past_days(st, state=None):
+    """根据标签最新日期，自动放大 past_days；确保天气覆盖标签。有水位时只取增量窗口。"""
+    wm = get_watermark(state or {}, WEATHER_FG, st["city"], st["station_id"])
+    if wm is not None:
+        # 从水位当天开始重取（覆盖当天可能不完整的小时数据），至少 1 天
+        want_past = max(1, min(360, int((_today(st) - wm).days)))
+        print(f"[info] {st['station_id']} watermark={wm.date()}, past_days -> {want_past} (incremental)")
+        return want_past
+
     want_past = DEFAULT_PAST_DAYS
     if st.get("sensor_csv"):
         try:
             lbl = read_sensor_daily(st["sensor_csv"], st["city"], st["station_id"])
             if not lbl.empty:
                 max_label_date = pd.to_datetime(lbl["date"]).max()
-                today = pd.Timestamp.now(tz=st["timezone"]).normalize().tz_localize(None)
+                today = _today(st)
                 need_days = max(0, int((today - max_label_date).days) + 1)
                 want_past = max(DEFAULT_PAST_DAYS, min(360, need_days))
                 print(f"[info] {st['station_id']} label max={max_label_date.date()}, past_days -> {want_past}")
         except Exception as e:
             print(f"[warn] read labels failed for {st['station_id']}: {e}")
+    return want_past
 
+
+def build_weather_features_for_station(st):
     hourly = fetch_openmeteo_daily(
         lat=st["lat"], lon=st["lon"], tz=st["timezone"],
-        past_days=want_past, forecast_days=DEFAULT_FORECAST_DAYS,
+        past_days=_want_past_days(st), forecast_days=DEFAULT_FORECAST_DAYS,
     )
+    return _daily_from_hourly(hourly, st)
+
+
+def build_weather_features_all(stations_list, max_workers=None, state=None, keep_hourly=False):
+    """
+    所有站点 × 接口并发抓取，拼接小时表后一次性聚合为日度特征。
+    keep_hourly=True 时返回 (日度表, 小时表)，小时表即写入小时 FG 的格式（见 airquality/hourly.py）。
+    """
+    jobs = [(st, _want_past_days(st, state)) for st in stations_list]
+    hourly_by_station = fetch_openmeteo_many(jobs, max_workers=max_workers)
+    hourly = pd.concat(
+        [_tag_station(hourly_by_station[st["station_id"]], st) for st in stations_list],
+        ignore_index=True,
+    )
+    daily = aggregate_daily(hourly)
+    if keep_hourly:
+        return daily, hourly_fg.to_hourly_frame(hourly)
+    return daily
+
+
+def _tag_station(hourly, st):
     hourly["city"] = st["city"]
     hourly["station_id"] = st["station_id"]
+    return hourly
 
-    daily = hourly.groupby(["city", "station_id", "date"], as_index=False).agg(
-        pm2_5_mean=("pm2_5", "mean"),
-        pm2_5_max=("pm2_5", "max"),
-        pm10_mean=("pm10", "mean"),
-        ozone_mean=("ozone", "mean"),
-        nitrogen_dioxide_mean=("nitrogen_dioxide", "mean"),
-        carbon_monoxide_mean=("carbon_monoxide", "mean"),
-        sulphur_dioxide_mean=("sulphur_dioxide", "mean"),
-        us_aqi_mean=("us_aqi", "mean"),
-        temperature_2m_mean=("temperature_2m", "mean"),
-        relative_humidity_2m_mean=("relative_humidity_2m", "mean"),
-        dew_point_2m_mean=("dew_point_2m", "mean"),
-        wind_speed_10m_mean=("wind_speed_10m", "mean"),
-        wind_direction_10m_mean=("wind_direction_10m", "mean"),
-        precipitation_sum=("precipitation", "sum"),
-        pressure_msl_mean=("pressure_msl", "mean"),
-        visibility_mean=("visibility", "mean"),
-    )
-    return daily
+
+def _daily_from_hourly(hourly, st):
+    return aggregate_daily(_tag_station(hourly, st))
 
 
-def main():
-    weather_all, labels_all = [], []
+def main(fs=None):
+    """抓取 + 写入；返回本次写入的 (weather_df, sensor_df)。fs 可由调用方传入（run_pipeline 共用一次登录）"""
+    labels_all = []
+    state = load_watermarks()
+    if state:
+        print(f"[info] incremental mode, watermarks from {STATE_PATH}")
 
     for st in stations:
         print(f"[features] {st['city']} / {st['station_id']} @ ({st['lat']}, {st['lon']})")
-        weather_all.append(build_weather_features_for_station(st))
+    weather_df, hourly_df = build_weather_features_all(stations, state=state, keep_hourly=True)
 
+    for st in stations:
         if st.get("sensor_csv"):
             print(f"[labels]   from {st['sensor_csv']}")
             try:
@@ -209,46 +318,67 @@ def main():
         else:
             print(f"[skip]     no sensor_csv for {st['station_id']}")
 
-    weather_df = pd.concat(weather_all, ignore_index=True)
     sensor_df = pd.concat(labels_all, ignore_index=True) if labels_all else pd.DataFrame()
 
     weather_df["date"] = pd.to_datetime(weather_df["date"])
     if not sensor_df.empty:
         sensor_df["date"] = pd.to_datetime(sensor_df["date"])
 
-    project = hs.login(api_key_value=os.environ["HOPSWORKS_API_KEY"],
-                       project=os.getenv("HOPSWORKS_PROJECT", None))
-    fs = project.get_feature_store()
+    # 只写水位之后的新行
+    weather_df = filter_new_rows(weather_df.drop_duplicates(["city", "station_id", "date"]), state, WEATHER_FG)
+    hourly_df = filter_new_rows(hourly_df, state, HOURLY_FG)
+    if not sensor_df.empty:
+        sensor_df = filter_new_rows(sensor_df.drop_duplicates(["city", "station_id", "date"]), state, LABEL_FG)
+
+    fs = fs or get_feature_store()
 
     weather_fg = fs.get_or_create_feature_group(
-        name="weather_daily_forecast",
-        version=2,
+        name=WEATHER_FG[0],
+        version=WEATHER_FG[1],
         description="Open-Meteo daily features (multi-station)",
         primary_key=["city", "station_id"],
         event_time="date",
         online_enabled=False,
     )
     aq_fg = fs.get_or_create_feature_group(
-        name="air_quality_daily",
-        version=2,
+        name=LABEL_FG[0],
+        version=LABEL_FG[1],
         description="Daily PM2.5 label (multi-station)",
         primary_key=["city", "station_id"],
         event_time="date",
         online_enabled=False,
     )
 
-    weather_fg.insert(weather_df.drop_duplicates(["city", "station_id", "date"]),
-                      write_options={"wait_for_job": True})
+    if not weather_df.empty:
+        weather_fg.insert(weather_df, write_options={"wait_for_job": True})
+        yesterday = {st["station_id"]: _today(st) - pd.Timedelta(days=1) for st in stations}
+        save_watermarks(advance_watermarks(state, WEATHER_FG, weather_df, upto=yesterday))
     print("[ok] inserted weather rows:", len(weather_df))
 
+    if WRITE_HOURLY and not hourly_df.empty:
+        hourly_fg_handle = fs.get_or_create_feature_group(
+            name=HOURLY_FG[0],
+            version=HOURLY_FG[1],
+            description="Open-Meteo hourly weather + air-quality features (multi-station)",
+            primary_key=["city", "station_id"],
+            event_time="time",
+            online_enabled=False,
+        )
+        hourly_fg_handle.insert(hourly_df, write_options={"wait_for_job": True})
+        # 与日度天气表相同：今天及以后是预报，水位只推进到昨天
+        yesterday = {st["station_id"]: _today(st) - pd.Timedelta(days=1) for st in stations}
+        save_watermarks(advance_watermarks(state, HOURLY_FG, hourly_df, upto=yesterday))
+        print("[ok] inserted hourly rows:", len(hourly_df))
+
     if not sensor_df.empty:
-        aq_fg.insert(sensor_df.drop_duplicates(["city", "station_id", "date"]),
-                     write_options={"wait_for_job": True})
+        aq_fg.insert(sensor_df, write_options={"wait_for_job": True})
+        save_watermarks(advance_watermarks(state, LABEL_FG, sensor_df))
         print("[ok] inserted label rows:", len(sensor_df))
     else:
-        print("[info] no labels inserted (only features)")
+        print("[info] no labels inserted (only features / no new label rows)")
 
     print("[done] multi-station backfill finished.")
+    return weather_df, sensor_df
 
 
 if __name__ == "__main__":
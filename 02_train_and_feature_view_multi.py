@@ -2,12 +2,12 @@
 # 读取 v2 的标签/天气表；自动选择 join 键；做逐站点重叠诊断；每站点训练随机森林
 
 import os
-import joblib
 import numpy as np
 import pandas as pd
-import hopsworks as hs
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_absolute_error
+
+from airquality import pooled_model, spatial, train_scheduler, training_cache
+from airquality.feature_store import get_feature_store
+from airquality.stations import stations
 
 # ============ 配置：可选，仅训练这些站点(留 None 表示全部) ============
 STATION_WHITELIST = {
@@ -22,129 +22,195 @@ STATION_WHITELIST = {
 }
 MIN_TRAIN_ROWS = 10  # 单站最小训练样本行数
 
-# ---------- 1) 登录 ----------
-project = hs.login(
-    api_key_value=os.environ["HOPSWORKS_API_KEY"],
-    project=os.getenv("HOPSWORKS_PROJECT", None)
-)
-fs = project.get_feature_store()
-
-# ---------- 2) 取 v2 的 Feature Groups ----------
-fg_aq = fs.get_feature_group("air_quality_daily", version=2)        # PK=["city","station_id"], event_time="date"
-fg_w  = fs.get_feature_group("weather_daily_forecast", version=2)   # PK=["city","station_id"], event_time="date"
-
-# ---------- 3) 读 FG ----------
-aq_df = fg_aq.read()     # 标签
-w_df  = fg_w.read()      # 天气特征
-
-# 转时间类型
-aq_df["date"] = pd.to_datetime(aq_df["date"])
-w_df["date"]  = pd.to_datetime(w_df["date"])
-
-# 可选白名单过滤（只保留关注的站点）
-if STATION_WHITELIST:
-    aq_df = aq_df[aq_df["station_id"].isin(STATION_WHITELIST)]
-    w_df  = w_df[w_df["station_id"].isin(STATION_WHITELIST)]
-
-# 诊断信息（整体）
-print("\n[label] per-station date range:")
-print(aq_df.groupby("station_id")["date"].agg(["min", "max", "count"]))
-print("\n[weather] per-station date range:")
-print(w_df.groupby("station_id")["date"].agg(["min", "max", "count"]))
-print("\n[diag] aq_df cols:", list(aq_df.columns))
-print("[diag] w_df  cols:", list(w_df.columns))
-
-# ---------- 4) 动态选择 join 键并合并 ----------
-aq_cols = set(aq_df.columns)
-w_cols  = set(w_df.columns)
-
-candidate_keys = ["city", "station_id", "date"]
-join_keys = [k for k in candidate_keys if (k in aq_cols and k in w_cols)]
-
-must_have = {"station_id", "date"}
-if not must_have.issubset(set(join_keys)):
-    missing = must_have - set(join_keys)
-    raise SystemExit(f"[error] 右表缺少必须连接键：{missing}。"
-                     f"当前 join_keys={join_keys}；请检查天气表是否包含 station_id 与 date。")
-
-print(f"[info] join on keys: {join_keys}")
-
-# 合并
-df = aq_df.merge(
-    w_df,
-    on=join_keys,
-    how="inner",
-    suffixes=("", "_wx")
-)
-
-# 若合并后没有 city，则从标签补回
-if "city" not in df.columns and "city" in aq_df.columns:
-    df = df.merge(
-        aq_df[["station_id", "date", "city"]].drop_duplicates(),
-        on=["station_id", "date"],
-        how="left"
-    )
-
-# 清洗
-dedup_keys = [k for k in ["city", "station_id", "date"] if k in df.columns]
-df = (
-    df.dropna()
-      .drop_duplicates(dedup_keys)
-      .sort_values("date")
-)
-
-# 逐站点重叠诊断（看每站最终可训练行数，以及合并前后时间交集）
-print("\n[overlap] per-station rows after merge:")
-if len(df):
-    print(df.groupby("station_id")["date"].agg(["min", "max", "count"]))
-else:
-    print("(empty)")
-
-print("[info] total training rows:", len(df))
-if len(df) == 0:
-    raise SystemExit(
-        "[warn] 合并后没有可训练的数据。\n"
-        "通常是标签与天气的日期区间没有重叠：\n"
-        "请在 01 中加大 PAST_DAYS（或用我给你的 01 自动按标签最新日期扩窗），\n"
-        "或者更新 CSV 到最近日期，然后重跑 01 与本脚本。"
+# per_station：每站一个森林（默认）；pooled：所有站点一个混合模型；both：两者都训
+MODEL_MODE = os.getenv("MODEL_MODE", "per_station").lower()
+
+
+def load_training_frame(fs=None):
+    """
+    读标签/天气 FG、join、清洗；返回按 date 排序的训练表。
+    两个 FG 的提交 / 最大日期都没变时直接读本地快照（airquality/training_cache.py），不再重读 FG 和 join。
+    """
+    fs = fs or get_feature_store()
+    fgs = [fs.get_feature_group("air_quality_daily", version=2), fs.get_feature_group("weather_daily_forecast", version=2)]
+    return training_cache.load_or_build(
+        "training_frame", fgs,
+        lambda: build_training_frame(*read_frames(fs)),
+        salt={"whitelist": sorted(STATION_WHITELIST or []),
+              "spatial": spatial.config() if spatial.ENABLED else None},
     )
 
-# ---------- 5) 训练：每站一个模型 ----------
-os.makedirs("models", exist_ok=True)
-results = []
-
-# 标签/标识列需要排除
-DROP_COLS = [c for c in ["pm2_5", "city", "station_id", "date"] if c in df.columns]
-
-for st_id, g in df.groupby("station_id"):
-    # 时间顺序切分：80% 训练，20% 验证
-    g = g.sort_values("date")
-    split = int(len(g) * 0.8)
-    tr, te = g.iloc[:split], g.iloc[split:]
-
-    num_cols = tr.select_dtypes(include=[np.number]).columns.tolist()
-    feat_cols = [c for c in num_cols if c not in DROP_COLS]
 
-    if len(tr) < MIN_TRAIN_ROWS or len(feat_cols) == 0:
-        print(f"[skip] {st_id} 样本不足或无有效特征（rows={len(tr)}, feats={len(feat_cols)}）")
-        continue
-
-    X_tr, y_tr = tr[feat_cols], tr["pm2_5"]
-    X_te, y_te = te[feat_cols], te["pm2_5"]
-
-    model = RandomForestRegressor(n_estimators=400, random_state=42)
-    model.fit(X_tr, y_tr)
-
-    pred = model.predict(X_te)
-    mae = float(mean_absolute_error(y_te, pred))
+def read_frames(fs=None):
+    """读标签 / 天气 FG（白名单下推），返回 (aq_df, w_df)"""
+    # ---------- 1) 登录（FEATURE_STORE=local 时使用本地 Parquet） ----------
+    fs = fs or get_feature_store()
+
+    # ---------- 2) 取 v2 的 Feature Groups ----------
+    fg_aq = fs.get_feature_group("air_quality_daily", version=2)        # PK=["city","station_id"], event_time="date"
+    fg_w  = fs.get_feature_group("weather_daily_forecast", version=2)   # PK=["city","station_id"], event_time="date"
+
+    # ---------- 3) 读 FG ----------
+    # 白名单下推到特征库；邻居特征要用到白名单外的站点（与 03 预测时一致），此时读全部站点
+    read_ids = sorted(STATION_WHITELIST) if STATION_WHITELIST and not spatial.ENABLED else None
+    aq_df = fg_aq.read(station_ids=read_ids)     # 标签
+    w_df  = fg_w.read(station_ids=read_ids)      # 天气特征
+    return aq_df, w_df
+
+
+def build_training_frame(aq_df, w_df):
+    """标签 + 天气 → 训练表（run_pipeline 直接传入内存中的两张表）"""
+    # 转时间类型（不改动调用方的 DataFrame）
+    aq_df = aq_df.assign(date=pd.to_datetime(aq_df["date"]))
+    w_df  = w_df.assign(date=pd.to_datetime(w_df["date"]))
+
+    # 可选：邻近站点的 IDW 天气 / PM2.5 滞后（SPATIAL_FEATURES=1，见 airquality/spatial.py）
+    # 在白名单过滤前用全部站点计算，与 03 预测时的邻居集合一致
+    if spatial.ENABLED:
+        w_df = add_spatial_features(w_df, aq_df)
+
+    # 可选白名单过滤（只保留关注的站点）
+    if STATION_WHITELIST:
+        aq_df = aq_df[aq_df["station_id"].isin(STATION_WHITELIST)]
+        w_df  = w_df[w_df["station_id"].isin(STATION_WHITELIST)]
+
+    # 诊断信息（整体）
+    print("\n[label] per-station date range:")
+    print(aq_df.groupby("station_id")["date"].agg(["min", "max", "count"]))
+    print("\n[weather] per-station date range:")
+    print(w_df.groupby("station_id")["date"].agg(["min", "max", "count"]))
+    print("\n[diag] aq_df cols:", list(aq_df.columns))
+    print("[diag] w_df  cols:", list(w_df.columns))
+
+    # ---------- 4) 动态选择 join 键并合并 ----------
+    aq_cols = set(aq_df.columns)
+    w_cols  = set(w_df.columns)
+
+    candidate_keys = ["city", "station_id", "date"]
+    join_keys = [k for k in candidate_keys if (k in aq_cols and k in w_cols)]
+
+    must_have = {"station_id", "date"}
+    if not must_have.issubset(set(join_keys)):
+        missing = must_have - set(join_keys)
+        raise SystemExit(f"[error] 右表缺少必须连接键：{missing}。"
+                         f"当前 join_keys={join_keys}；请检查天气表是否包含 station_id 与 date。")
+
+    print(f"[info] join on keys: {join_keys}")
+
+    # 合并
+    df = aq_df.merge(
+        w_df,
+        on=join_keys,
+        how="inner",
+        suffixes=("", "_wx")
+    )
 
-    joblib.dump({"model": model, "features": feat_cols}, f"models/{st_id}_rf.joblib")
-    results.append((st_id, len(g), len(feat_cols), mae))
-    print(f"[ok] {st_id}: rows={len(g)}, feats={len(feat_cols)}, MAE={mae:.2f} -> models/{st_id}_rf.joblib")
+    # 若合并后没有 city，则从标签补回
+    if "city" not in df.columns and "city" in aq_df.columns:
+        df = df.merge(
+            aq_df[["station_id", "date", "city"]].drop_duplicates(),
+            on=["station_id", "date"],
+            how="left"
+        )
+
+    # 清洗
+    dedup_keys = [k for k in ["city", "station_id", "date"] if k in df.columns]
+    df = (
+        df.dropna()
+          .drop_duplicates(dedup_keys)
+          .sort_values("date")
+    )
 
-if not results:
-    print("[warn] 没有任何站点完成训练。")
-else:
-    print("\n=== Summary ===")
-    for st_id, n, k, mae in results:
-        print(f"{st_id}: rows={n}, feats={k}, MAE={mae:.2f}")
+    # 逐站点重叠诊断（看每站最终可训练行数，以及合并前后时间交集）
+    print("\n[overlap] per-station rows after merge:")
+    if len(df):
+        print(df.groupby("station_id")["date"].agg(["min", "max", "count"]))
+    else:
+        print("(empty)")
+
+    print("[info] total training rows:", len(df))
+    if len(df) == 0:
+        raise SystemExit(
+            "[warn] 合并后没有可训练的数据。\n"
+            "通常是标签与天气的日期区间没有重叠：\n"
+            "请在 01 中加大 PAST_DAYS（或用我给你的 01 自动按标签最新日期扩窗），\n"
+            "或者更新 CSV 到最近日期，然后重跑 01 与本脚本。"
+        )
+    return df
+
+
+def add_spatial_features(w_df, aq_df):
+    """给天气表补邻居特征：邻居天气来自同一张天气表，邻居 PM2.5 滞后来自标签表"""
+    index = spatial.build_index(stations)
+    wcols = spatial.weather_columns(w_df)
+    out = spatial.add_features(w_df, index, wcols, labels=aq_df)
+    n_nbr = int((index["neighbors"] >= 0).sum(axis=1).max()) if len(index["neighbors"]) else 0
+    print(f"[info] spatial features: {len(spatial.feature_names(wcols))} column(s), up to {n_nbr} neighbor(s)/station")
+    return out
+
+
+def feature_columns(df):
+    # 标签/标识列需要排除
+    drop_cols = [c for c in ["pm2_5", "city", "station_id", "date"] if c in df.columns]
+    num_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    return [c for c in num_cols if c not in drop_cols]
+
+
+def train_pooled(df):
+    """所有站点一个模型（站点编号 + 经纬度作为特征）"""
+    feat_cols = feature_columns(df)
+    bundle, fit_s, maes = pooled_model.train_pooled(df, feat_cols, n_jobs=train_scheduler.TRAIN_CPUS)
+    path = pooled_model.save_pooled(bundle)
+    print(f"[ok] pooled: rows={len(df)}, feats={len(bundle['features'])}, fit={fit_s:.1f}s -> {path}")
+    for st_id, mae in sorted(maes.items()):
+        print(f"     {st_id}: MAE={mae:.2f}")
+
+
+def train(df):
+    """按 MODEL_MODE 训练并保存模型；返回 [(station_id, rows, feats, MAE)]"""
+    if MODEL_MODE in ("pooled", "both"):
+        train_pooled(df)
+        if MODEL_MODE == "pooled":
+            return []
+
+    # ---------- 5) 训练：每站一个模型（train_scheduler 分配进程 / 树级并行） ----------
+    os.makedirs("models", exist_ok=True)
+    tasks = []
+    tuned = train_scheduler.tuned_params()   # TUNED_PARAMS 指向 tune.py 的输出时按站点取参数
+
+    for st_id, g in df.groupby("station_id"):
+        # 时间顺序切分：80% 训练，20% 验证
+        g = g.sort_values("date")
+        split = int(len(g) * 0.8)
+        tr, te = g.iloc[:split], g.iloc[split:]
+
+        feat_cols = feature_columns(tr)
+
+        if len(tr) < MIN_TRAIN_ROWS or len(feat_cols) == 0:
+            print(f"[skip] {st_id} 样本不足或无有效特征（rows={len(tr)}, feats={len(feat_cols)}）")
+            continue
+
+        tasks.append(train_scheduler.make_task(st_id, tr, te, feat_cols, f"models/{st_id}_rf.joblib", rows=len(g),
+                                               params=train_scheduler.params_for(st_id, tuned)))
+
+    results = []
+    for r in train_scheduler.run(tasks):
+        results.append((r["station_id"], r["rows"], r["feats"], r["mae"]))
+        print(f"[ok] {r['station_id']}: rows={r['rows']}, feats={r['feats']}, MAE={r['mae']:.2f} "
+              f"-> {r['model_path']} ({r['fit_seconds']:.1f}s)")
+
+    if not results:
+        print("[warn] 没有任何站点完成训练。")
+    else:
+        print("\n=== Summary ===")
+        for st_id, n, k, mae in results:
+            print(f"{st_id}: rows={n}, feats={k}, MAE={mae:.2f}")
+    return results
+
+
+def main():
+    train(load_training_frame())
+
+
+if __name__ == "__main__":
+    main()
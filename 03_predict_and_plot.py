@@ -1,17 +1,23 @@
 # 03_predict_and_plot.py  —— 预测图从“今天”算起，严格 7 天；回测只到昨天；支持 AQI 色带风格
+# 批量模式：登录一次、特征组只读一次，各站点的预测 + 画图分发到进程池
+#   python 03_predict_and_plot.py                      # STATION_IDS 中的全部站点
+#   python 03_predict_and_plot.py hk-tung-chung        # 只跑指定站点
 import os
-import joblib
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
-import hopsworks as hs
-import matplotlib.pyplot as plt
-#import matplotlib.dates as mdates
+
+from airquality import forest_io, pooled_model, spatial
+from airquality.feature_store import get_feature_store
+from airquality.stations import stations
 
 # ========= 配置 =========
 CITY = "HongKong"
-STATION_ID = "hk-tung-chung"
-#STATION_ID = ["hk-tuen-mun", "hk-yuen-long", hk-tsuen-wan, hk-Kwai-Chung, hk-tung-chung]
-MODEL_PATH = f"models/{STATION_ID}_rf.joblib"
+STATION_IDS = ["hk-tuen-mun", "hk-yuen-long", "hk-tsuen-wan", "hk-Kwai-Chung", "hk-tung-chung"]
+MODEL_PATH = "models/{station_id}_rf.joblib"
+# per_station：优先逐站模型，没有时退回混合模型；pooled：只用 models/pooled_rf.joblib
+MODEL_MODE = os.getenv("MODEL_MODE", "per_station").lower()
 VERSION = 2
 
 # 过去用于对比的天数（回测图横向显示多少天）
@@ -23,108 +29,158 @@ FORECAST_DAYS = 7
 USE_AQI_BANDS = True
 
 OUTDIR = "outputs"
-os.makedirs(OUTDIR, exist_ok=True)
-
-# ========= 登录 Hopsworks =========
-project = hs.login(
-    api_key_value=os.environ["HOPSWORKS_API_KEY"],
-    project=os.getenv("HOPSWORKS_PROJECT", None),
-)
-fs = project.get_feature_store()
-
-fg_w = fs.get_feature_group("weather_daily_forecast", version=VERSION)
-fg_aq = fs.get_feature_group("air_quality_daily", version=VERSION)
-
-# ========= 读取天气（过去 + 未来） =========
-w_df = fg_w.read()
-# 统一成 tz-naive（去掉 UTC），方便和 pandas 比较
-w_df["date"] = pd.to_datetime(w_df["date"], utc=True).dt.tz_localize(None)
-w_df = w_df[w_df["station_id"] == STATION_ID].copy()
-
-today = pd.Timestamp.today(tz=None).normalize()
-start_date = today - pd.Timedelta(days=BACK_DAYS)
-# 多给两天冗余，后面再精确截 7 天
-end_date = today + pd.Timedelta(days=FORECAST_DAYS + 2)
-
-w_df = (
-    w_df[(w_df["date"] >= start_date) & (w_df["date"] <= end_date)]
-      .sort_values("date")
-      .drop_duplicates(["station_id", "date"])
-      .reset_index(drop=True)
-)
-if w_df.empty:
-    raise SystemExit(
-        f"[error] weather window 为空：{start_date.date()} ~ {end_date.date()}。\n"
-        f"请先用 01 扩大 PAST_DAYS/FORECAST_DAYS 后写入 v2。"
+
+# 进程数：0 = min(站点数, CPU 数)；1 = 在主进程里顺序执行
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", "0"))
+
+
+def prediction_window(today=None):
+    today = today if today is not None else pd.Timestamp.today(tz=None).normalize()
+    start_date = today - pd.Timedelta(days=BACK_DAYS)
+    # 多给两天冗余，后面再精确截 7 天
+    end_date = today + pd.Timedelta(days=FORECAST_DAYS + 2)
+    return today, start_date, end_date
+
+
+def read_inputs(fs, station_ids, today, start_date, end_date):
+    """一次读取所有站点的天气窗口与标签窗口（站点 + 日期下推到特征库）"""
+    fg_w = fs.get_feature_group("weather_daily_forecast", version=VERSION)
+    fg_aq = fs.get_feature_group("air_quality_daily", version=VERSION)
+
+    aq_start = start_date
+    if spatial.ENABLED:
+        # 邻居特征需要所有站点，以及窗口开始前 max(SPATIAL_LAGS) 天的标签
+        station_ids = None
+        aq_start = start_date - pd.Timedelta(days=max(spatial.LAGS or [0]))
+
+    w_all = fg_w.read(station_ids=station_ids, start=start_date, end=end_date)
+    # 统一成 tz-naive（去掉 UTC），方便和 pandas 比较
+    w_all["date"] = pd.to_datetime(w_all["date"], utc=True).dt.tz_localize(None)
+
+    aq_all = fg_aq.read(station_ids=station_ids, start=aq_start, end=today - pd.Timedelta(days=1))
+    aq_all["date"] = pd.to_datetime(aq_all["date"], utc=True).dt.tz_localize(None)
+    return add_spatial_features(w_all, aq_all), aq_all
+
+
+def add_spatial_features(w_all, aq_all):
+    """
+    SPATIAL_FEATURES=1 时给所有站点的天气窗口补邻居特征（同 02）。
+    未来日期的邻居标签还不存在：邻居 PM2.5 滞后沿用最近一天的值（持续性外推）。
+    """
+    if not spatial.ENABLED:
+        return w_all
+    w_all = w_all.sort_values(["station_id", "date"]).drop_duplicates(["station_id", "date"], keep="last")
+    return spatial.add_features(w_all, spatial.build_index(stations), spatial.weather_columns(w_all),
+                                labels=aq_all, fill_forward=True)
+
+
+def station_frames(station_id, w_all, aq_all, today, start_date, end_date):
+    w_df = w_all[w_all["station_id"] == station_id]
+    w_df = (
+        w_df[(w_df["date"] >= start_date) & (w_df["date"] <= end_date)]
+          .sort_values("date")
+          .drop_duplicates(["station_id", "date"])
+          .reset_index(drop=True)
+    )
+
+    aq_df = aq_all[(aq_all["station_id"] == station_id) & (aq_all["city"] == CITY)]
+    # 标签严格到昨天（< today），与回测一致
+    aq_df = aq_df[(aq_df["date"] >= start_date) & (aq_df["date"] <= today - pd.Timedelta(days=1))]
+    aq_df = (
+        aq_df[["date", "pm2_5"]]
+          .drop_duplicates("date")
+          .rename(columns={"pm2_5": "pm2_5_true"})
+    )
+    return w_df, aq_df
+
+
+_pooled_bundle = None
+
+
+def _model_exists(path):
+    return os.path.isfile(path) or os.path.isfile(forest_io.flat_path_for(path))
+
+
+def load_bundle(station_id):
+    """逐站模型优先；MODEL_MODE=pooled 或逐站文件不存在时用混合模型（每进程只加载一次）"""
+    global _pooled_bundle
+    path = MODEL_PATH.format(station_id=station_id)
+    if MODEL_MODE != "pooled" and _model_exists(path):
+        return forest_io.load_model_bundle(path)
+    if _pooled_bundle is None:
+        if not _model_exists(pooled_model.POOLED_MODEL_PATH):
+            raise RuntimeError(f"[error] {station_id} 找不到模型：{path} / {pooled_model.POOLED_MODEL_PATH}")
+        _pooled_bundle = forest_io.load_model_bundle(pooled_model.POOLED_MODEL_PATH)
+        print(f"[info] using pooled model {pooled_model.POOLED_MODEL_PATH}")
+    return _pooled_bundle
+
+
+def predict_station(station_id, w_df, aq_df, today):
+    """加载模型并预测；返回 (res, hind, future, mae)"""
+    if w_df.empty:
+        raise RuntimeError(
+            f"[error] {station_id} weather window 为空。\n"
+            f"请先用 01 扩大 PAST_DAYS/FORECAST_DAYS 后写入 v2。"
+        )
+
+    bundle = load_bundle(station_id)
+    model = bundle["model"]
+    feat_cols = bundle["features"]
+    if bundle.get("pooled"):
+        # 站点特征由 pooled_model 补上，这里只检查天气特征
+        feat_cols = [c for c in feat_cols if c not in pooled_model.STATION_FEATURES]
+
+    # 只保留当前窗口可用的特征
+    exist_feats = [c for c in feat_cols if c in w_df.columns]
+    if len(exist_feats) == 0:
+        raise RuntimeError(f"[error] {station_id} 预测特征在 weather 表中一个都找不到：{feat_cols}")
+    if len(exist_feats) < len(feat_cols):
+        miss = sorted(list(set(feat_cols) - set(exist_feats)))
+        print(f"[warn] {station_id} 当前窗口缺少特征：{miss}（将忽略）")
+
+    if bundle.get("pooled"):
+        if len(exist_feats) < len(feat_cols):
+            raise RuntimeError(f"[error] {station_id} 混合模型需要完整特征，缺少：{sorted(set(feat_cols) - set(exist_feats))}")
+        pred = pooled_model.predict_pooled(bundle, station_id, w_df[exist_feats])
+    else:
+        pred = model.predict(w_df[exist_feats])
+
+    # 合并预测与真值
+    res = (
+        pd.DataFrame({"date": w_df["date"].values, "pm2_5_pred": pred})
+          .merge(aq_df, on="date", how="left")
+          .sort_values("date")
+          .reset_index(drop=True)
+    )
+    res["city"] = CITY
+    res["station_id"] = station_id
+
+    # —— 切分 —— #
+    # 回测（hindcast）：到昨天为止
+    hind = res[res["date"] <= today - pd.Timedelta(days=1)].copy()
+    # 未来（forecast）：从今天开始，严格取 7 天
+    future = (
+        res[res["date"] >= today]
+          .sort_values("date")
+          .drop_duplicates("date")
+          .head(FORECAST_DAYS)
+          .copy()
     )
+    if len(future) < FORECAST_DAYS:
+        print(f"[warn] {station_id} 天气特征里只有 {len(future)} 天可用（少于 {FORECAST_DAYS} 天）。")
+
+    # 计算 MAE（仅用有真值的回测区间）
+    hind_with_truth = hind.dropna(subset=["pm2_5_true"])
+    if not hind_with_truth.empty:
+        mae = float(np.mean(np.abs(hind_with_truth["pm2_5_true"].to_numpy()
+                                   - hind_with_truth["pm2_5_pred"].to_numpy())))
+    else:
+        mae = np.nan
+
+    print(f"[info] {station_id} rows: hind={len(hind)} (truth={len(hind_with_truth)}), "
+          f"future={len(future)}, MAE={mae:.2f}")
+    return res, hind, future, mae
 
-# ========= 读取标签（仅用于回测对比与 MAE） =========
-aq_df = fg_aq.read()
-aq_df["date"] = pd.to_datetime(aq_df["date"], utc=True).dt.tz_localize(None)
-aq_df = aq_df[(aq_df["station_id"] == STATION_ID) & (aq_df["city"] == CITY)]
-# 标签严格到昨天（< today），与回测一致
-aq_df = aq_df[(aq_df["date"] >= start_date) & (aq_df["date"] <= today-pd.Timedelta(days=1))]
-aq_df = (
-    aq_df[["date", "pm2_5"]]
-      .drop_duplicates("date")
-      .rename(columns={"pm2_5": "pm2_5_true"})
-)
-
-# ========= 加载模型并预测 =========
-bundle = joblib.load(MODEL_PATH)
-model = bundle["model"]
-feat_cols = bundle["features"]
-
-# 只保留当前窗口可用的特征
-exist_feats = [c for c in feat_cols if c in w_df.columns]
-if len(exist_feats) == 0:
-    raise SystemExit(f"[error] 预测特征在 weather 表中一个都找不到：{feat_cols}")
-if len(exist_feats) < len(feat_cols):
-    miss = sorted(list(set(feat_cols) - set(exist_feats)))
-    print(f"[warn] 当前窗口缺少特征：{miss}（将忽略）")
-
-X = w_df[exist_feats]
-pred = model.predict(X)
-
-# 合并预测与真值
-res = (
-    pd.DataFrame({"date": w_df["date"].values, "pm2_5_pred": pred})
-      .merge(aq_df, on="date", how="left")
-      .sort_values("date")
-      .reset_index(drop=True)
-)
-res["city"] = CITY
-res["station_id"] = STATION_ID
-
-# —— 切分 —— #
-# 回测（hindcast）：到昨天为止
-hind = res[res["date"] <= today- pd.Timedelta(days=1)].copy()
-# 未来（forecast）：从今天开始，严格取 7 天
-future = (
-    res[res["date"] >= today]
-      .sort_values("date")
-      .drop_duplicates("date")
-      .head(FORECAST_DAYS)
-      .copy()
-)
-if len(future) < FORECAST_DAYS:
-    print(f"[warn] 天气特征里只有 {len(future)} 天可用（少于 {FORECAST_DAYS} 天）。")
-
-# 计算 MAE（仅用有真值的回测区间）
-hind_with_truth = hind.dropna(subset=["pm2_5_true"])
-if not hind_with_truth.empty:
-    mae = float(np.mean(np.abs(hind_with_truth["pm2_5_true"].to_numpy()
-                               - hind_with_truth["pm2_5_pred"].to_numpy())))
-else:
-    mae = np.nan
-
-print(f"[info] rows: hind={len(hind)} (truth={len(hind_with_truth)}), "
-      f"future={len(future)}, MAE={mae:.2f}")
-
-# ========= 导出 CSV =========
-csv_path = os.path.join(OUTDIR, f"{STATION_ID}_predictions.csv")
-res.to_csv(csv_path, index=False)
-print(f"[ok] saved CSV -> {csv_path}")
 
 # ========= 工具：添加 AQI 色带（可选） =========
 def add_aqi_bands(ax):
@@ -142,69 +198,131 @@ def add_aqi_bands(ax):
     ax.set_yscale("log")
     ax.set_ylim(0, 500)  # 让色带完整露出
 
-# ========= 绘制 hindcast（逐日横坐标 + 斜体标签）=========
-hind_fig = os.path.join(OUTDIR, f"{STATION_ID}_hindcast.png")
-plt.figure(figsize=(10, 8))
-ax = plt.gca()
-
-if USE_AQI_BANDS:
-    add_aqi_bands(ax)  # 会切到对数y轴
-    aqi_ticks = [50, 100, 150, 200, 300, 500]
-    ax.set_yticks(aqi_ticks)
-    ax.set_yticklabels([str(v) for v in aqi_ticks])
-    ax.set_ylim(10, 500)
-
-# 只画最近 BACK_DAYS 天
-hind_plot = hind.tail(BACK_DAYS).copy()
-
-# 有真值 -> 两条线；否则只有预测
-if not hind_with_truth.empty:
-    ax.plot(hind_plot["date"], hind_plot["pm2_5_true"],
-            label="True (pm2.5)", color="#1f77b4", linewidth=1.2, marker="o", markersize=4)
-ax.plot(hind_plot["date"], hind_plot["pm2_5_pred"],
-        label="Pred", color="#ff7f0e", linewidth=1.2, marker="o", markersize=4)
-
-# ---- 逐日刻度 + 倾斜标签 ----
-import matplotlib.dates as mdates
-xmin = hind_plot["date"].min().normalize()
-xmax = hind_plot["date"].max().normalize()
-day_ticks = pd.date_range(xmin, xmax, freq="D")          # 每天一个刻度
-ax.set_xticks(day_ticks)
-ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
-plt.setp(ax.get_xticklabels(), rotation=45, ha="right")  # 斜体显示
-
-# 其它装饰
-title = (f"{CITY} / {STATION_ID} - Hindcast (MAE={mae:.2f})"
-         if not np.isnan(mae) else f"{CITY} / {STATION_ID} - Hindcast")
-ax.set_title(title)
-#ax.axvline(today, color="gray", linestyle="--", linewidth=1)
-ax.set_xlabel("Date"); ax.set_ylabel("PM2.5")
-ax.legend(); ax.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig(hind_fig, dpi=150, bbox_inches="tight")
-plt.close()
-print(f"[ok] saved hindcast plot -> {hind_fig}")
-
-
-# ========= 绘制 Forecast（从今天起严格 7 天）=========
-forecast_fig = os.path.join(OUTDIR, f"{STATION_ID}_forecast.png")
-plt.figure(figsize=(10, 8))
-ax = plt.gca()
-
-if USE_AQI_BANDS:
-    add_aqi_bands(ax)
-    aqi_ticks = [50, 100, 150, 200, 300, 500]
-    ax.set_yticks(aqi_ticks)
-    ax.set_yticklabels([str(v) for v in aqi_ticks])
-    ax.set_ylim(10, 500)
-
-ax.plot(future["date"], future["pm2_5_pred"], label="Forecast Pred",
-        color="#d62728", marker="o", markersize=4, linewidth=1.2)
-#ax.axvline(today, color="gray", linestyle="--", linewidth=1)
-ax.set_title(f"{CITY}, {STATION_ID} - Next {FORECAST_DAYS} Days Forecast")
-ax.set_xlabel("Date"); ax.set_ylabel("PM2.5")
-ax.legend(); ax.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig(forecast_fig, dpi=150)
-plt.close()
-print(f"[ok] saved forecast plot -> {forecast_fig}")
+
+def _style_axes(ax):
+    if USE_AQI_BANDS:
+        add_aqi_bands(ax)  # 会切到对数y轴
+        aqi_ticks = [50, 100, 150, 200, 300, 500]
+        ax.set_yticks(aqi_ticks)
+        ax.set_yticklabels([str(v) for v in aqi_ticks])
+        ax.set_ylim(10, 500)
+
+
+def plot_station(station_id, hind, future, mae):
+    # matplotlib 只在真正画图时加载（预测失败的站点、只导 CSV 的调用都不付这个启动成本）
+    import matplotlib
+    matplotlib.use("Agg")  # 子进程里无界面画图
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    # ========= 绘制 hindcast（逐日横坐标 + 斜体标签）=========
+    hind_fig = os.path.join(OUTDIR, f"{station_id}_hindcast.png")
+    plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+    _style_axes(ax)
+
+    # 只画最近 BACK_DAYS 天
+    hind_plot = hind.tail(BACK_DAYS).copy()
+
+    # 有真值 -> 两条线；否则只有预测
+    if hind["pm2_5_true"].notna().any():
+        ax.plot(hind_plot["date"], hind_plot["pm2_5_true"],
+                label="True (pm2.5)", color="#1f77b4", linewidth=1.2, marker="o", markersize=4)
+    ax.plot(hind_plot["date"], hind_plot["pm2_5_pred"],
+            label="Pred", color="#ff7f0e", linewidth=1.2, marker="o", markersize=4)
+
+    # ---- 逐日刻度 + 倾斜标签 ----
+    if not hind_plot.empty:
+        xmin = hind_plot["date"].min().normalize()
+        xmax = hind_plot["date"].max().normalize()
+        day_ticks = pd.date_range(xmin, xmax, freq="D")          # 每天一个刻度
+        ax.set_xticks(day_ticks)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")  # 斜体显示
+
+    # 其它装饰
+    title = (f"{CITY} / {station_id} - Hindcast (MAE={mae:.2f})"
+             if not np.isnan(mae) else f"{CITY} / {station_id} - Hindcast")
+    ax.set_title(title)
+    ax.set_xlabel("Date"); ax.set_ylabel("PM2.5")
+    ax.legend(); ax.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(hind_fig, dpi=150, bbox_inches="tight")
+    plt.close()
+    print(f"[ok] saved hindcast plot -> {hind_fig}")
+
+    # ========= 绘制 Forecast（从今天起严格 7 天）=========
+    forecast_fig = os.path.join(OUTDIR, f"{station_id}_forecast.png")
+    plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+    _style_axes(ax)
+
+    ax.plot(future["date"], future["pm2_5_pred"], label="Forecast Pred",
+            color="#d62728", marker="o", markersize=4, linewidth=1.2)
+    ax.set_title(f"{CITY}, {station_id} - Next {FORECAST_DAYS} Days Forecast")
+    ax.set_xlabel("Date"); ax.set_ylabel("PM2.5")
+    ax.legend(); ax.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(forecast_fig, dpi=150)
+    plt.close()
+    print(f"[ok] saved forecast plot -> {forecast_fig}")
+
+
+def run_station(station_id, w_df, aq_df, today):
+    """单站点：预测 → CSV → 两张图（进程池 worker）"""
+    res, hind, future, mae = predict_station(station_id, w_df, aq_df, today)
+
+    # ========= 导出 CSV =========
+    csv_path = os.path.join(OUTDIR, f"{station_id}_predictions.csv")
+    res.to_csv(csv_path, index=False)
+    print(f"[ok] saved CSV -> {csv_path}")
+
+    plot_station(station_id, hind, future, mae)
+    return station_id, mae
+
+
+def main(station_ids=None):
+    station_ids = list(station_ids or STATION_IDS)
+    os.makedirs(OUTDIR, exist_ok=True)
+
+    # ========= 登录 Hopsworks（FEATURE_STORE=local 时使用本地 Parquet），只读一次 =========
+    fs = get_feature_store()
+    today, start_date, end_date = prediction_window()
+    w_all, aq_all = read_inputs(fs, station_ids, today, start_date, end_date)
+
+    jobs = {
+        sid: station_frames(sid, w_all, aq_all, today, start_date, end_date)
+        for sid in station_ids
+    }
+
+    workers = PREDICT_WORKERS or min(len(jobs), os.cpu_count() or 1)
+    done, failed = [], []
+    if workers <= 1:
+        for sid, (w_df, aq_df) in jobs.items():
+            try:
+                done.append(run_station(sid, w_df, aq_df, today))
+            except Exception as e:
+                failed.append((sid, e))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(run_station, sid, w_df, aq_df, today): sid
+                for sid, (w_df, aq_df) in jobs.items()
+            }
+            for fut in as_completed(futures):
+                try:
+                    done.append(fut.result())
+                except Exception as e:
+                    failed.append((futures[fut], e))
+
+    print("\n=== Summary ===")
+    for sid, mae in sorted(done):
+        print(f"{sid}: MAE={mae:.2f}")
+    for sid, e in failed:
+        print(f"[fail] {sid}: {e}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or None)
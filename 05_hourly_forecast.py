@@ -0,0 +1,90 @@
+# 05_hourly_forecast.py
+# 小时粒度预测：读小时 FG（weather_hourly_forecast，由 01 写入）→ 向量化滞后特征 → 跨站点模型 → 未来 24 小时
+#   python 05_hourly_forecast.py            # 训练 + 预测
+#   python 05_hourly_forecast.py train      # 只训练（保存 models/hourly_rf.joblib，MODEL_FORMAT=flat|both 另存 .aqf）
+#   python 05_hourly_forecast.py predict    # 只用已有模型预测
+# 所有站点的所有预测小时一次 predict；结果写到 outputs/hourly_predictions.csv
+
+import os
+import sys
+import time
+
+import pandas as pd
+
+from airquality import hourly
+from airquality.feature_store import get_feature_store
+from airquality.stations import stations
+
+STATION_IDS = ["hk-tuen-mun", "hk-yuen-long", "hk-tsuen-wan", "hk-Kwai-Chung", "hk-tung-chung"]
+OUTDIR = "outputs"
+
+
+def read_hourly(fs, station_ids, start=None):
+    fg = fs.get_feature_group(hourly.HOURLY_FG[0], version=hourly.HOURLY_FG[1])
+    # 两个后端都按小时 FG 的 event_time(time) 下推
+    df = fg.read(station_ids=station_ids, start=start)
+    print(f"[info] hourly rows read: {len(df)} ({df['station_id'].nunique() if len(df) else 0} stations)")
+    return df
+
+
+def _now_by_station(station_ids):
+    """各站点本地时间的当前整点（tz-naive，与 FG 的 time 一致）"""
+    tz = {st["station_id"]: st["timezone"] for st in stations}
+    return {
+        sid: pd.Timestamp.now(tz=tz.get(sid, "UTC")).floor("h").tz_localize(None)
+        for sid in station_ids
+    }
+
+
+def train(df):
+    # 只用已发生的小时训练：FG 里当前整点及以后的 pm2_5 是 Open-Meteo 的预报值
+    now = _now_by_station(df["station_id"].unique())
+    df = df[pd.to_datetime(df["time"]) < pd.to_datetime(df["station_id"].map(now))]
+    t0 = time.perf_counter()
+    frame = hourly.build_frame(df)
+    prep_s = time.perf_counter() - t0
+    bundle, fit_s, maes = hourly.train(frame)
+    written = hourly.save(bundle)
+    print(f"[ok] hourly model: {len(frame)} rows, features {prep_s:.2f}s, fit {fit_s:.2f}s -> {', '.join(written)}")
+    for sid, mae in sorted(maes.items()):
+        print(f"  {sid}: holdout MAE={mae:.2f}")
+    return bundle, maes
+
+
+def predict(df, bundle, station_ids):
+    now = _now_by_station(station_ids)
+    frame = hourly.forecast_frame(df, now, horizon=bundle.get("horizon"), lags=bundle.get("lags"))
+    if frame.empty:
+        raise SystemExit("[warn] 小时 FG 里没有未来小时的天气行，请先运行 01（WRITE_HOURLY=1）。")
+
+    t0 = time.perf_counter()
+    pred = hourly.predict(bundle, frame)
+    secs = time.perf_counter() - t0
+    print(f"[info] predicted {len(frame)} station-hours in {secs * 1e3:.1f}ms")
+
+    out = frame[["city", "station_id", "time"]].assign(predicted_pm2_5=pred)
+    os.makedirs(OUTDIR, exist_ok=True)
+    path = os.path.join(OUTDIR, "hourly_predictions.csv")
+    out.to_csv(path, index=False)
+    print(f"[ok] saved CSV -> {path}")
+    return out
+
+
+def main(mode=None):
+    mode = (mode or "all").lower()
+    if mode not in ("all", "train", "predict"):
+        raise SystemExit(f"[error] unknown mode: {mode} (all | train | predict)")
+
+    fs = get_feature_store()
+    if mode in ("all", "train"):
+        bundle, _ = train(read_hourly(fs, STATION_IDS))
+    else:
+        bundle = hourly.load()
+    if mode in ("all", "predict"):
+        # 预测只需最长滞后之前的历史
+        start = min(_now_by_station(STATION_IDS).values()) - pd.Timedelta(hours=max(bundle.get("lags") or hourly.HOURLY_LAGS) + 24)
+        predict(read_hourly(fs, STATION_IDS, start=start), bundle, STATION_IDS)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
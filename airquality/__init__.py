@@ -0,0 +1,4 @@
+# airquality/__init__.py
+# 各入口脚本（01–04、daily_pipeline、featureview、model_server…）共用的模块。
+# 包本身只依赖标准库 / numpy / pandas；hopsworks、sklearn、matplotlib、joblib、requests
+# 都在真正用到的函数里才 import，避免拖慢脚本启动（见 bench_startup.py）。
@@ -0,0 +1,145 @@
+# airquality/backtest.py
+# 滚动起点（walk-forward）回测：每个站点取最后 N 个连续的 horizon 天窗口作测试折，
+# 第 k 折用测试窗口之前的全部数据训练（扩展窗口），预测该窗口。
+#   - 每个站点只转换一次：按日期排序后的 X(float32, C 连续) / y / 日期数组；各折的训练 / 测试集都是数组切片（视图），
+#     不再逐折切 DataFrame；
+#   - refit="warm"：第一折训 n_estimators 棵树，之后每折 warm_start 追加 add_trees 棵新树（只在新训练集上训练新树，
+#     旧树保留），避免每折从头重训；refit="full"：每折重新训练完整森林（与 02 的训练方式一致）；
+#   - 站点之间进程池并行，CPU 预算分配同 train_scheduler.plan。
+# 配置：BACKTEST_FOLDS（默认 5）、BACKTEST_HORIZON_DAYS（默认 14）、BACKTEST_REFIT（warm | full）、BACKTEST_ADD_TREES（默认 50）
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import train_scheduler
+
+N_FOLDS = int(os.getenv("BACKTEST_FOLDS", "5"))
+HORIZON_DAYS = int(os.getenv("BACKTEST_HORIZON_DAYS", "14"))
+REFIT = os.getenv("BACKTEST_REFIT", "warm").lower()
+ADD_TREES = int(os.getenv("BACKTEST_ADD_TREES", "50"))
+MIN_TRAIN_ROWS = 10
+
+_DAY = np.int64(86400 * 10**9)
+
+
+def station_arrays(station_id, g, feat_cols):
+    """单站点 DataFrame -> 回测用的排序数组（只做一次）"""
+    g = g.sort_values("date", kind="mergesort")
+    return {
+        "station_id": station_id,
+        "days": pd.to_datetime(g["date"]).to_numpy(dtype="datetime64[ns]").astype(np.int64) // _DAY,
+        "X": np.ascontiguousarray(g[feat_cols].to_numpy(dtype=np.float32)),
+        "y": g["pm2_5"].to_numpy(dtype=np.float64),
+        "features": list(feat_cols),
+    }
+
+
+def folds(days, n_folds=None, horizon_days=None, min_train=MIN_TRAIN_ROWS):
+    """
+    days: 升序的日序号数组。返回 [(训练结束下标, 测试结束下标), ...]，测试集 = [训练结束, 测试结束)。
+    测试窗口按日期划分（缺日期不影响窗口边界）；训练行数不足或测试窗口为空的折跳过。
+    """
+    n_folds = N_FOLDS if n_folds is None else n_folds
+    horizon_days = HORIZON_DAYS if horizon_days is None else horizon_days
+    if not len(days):
+        return []
+    end = days[-1] + 1
+    out = []
+    for k in range(n_folds):
+        test_end = end - (n_folds - 1 - k) * horizon_days
+        test_start = test_end - horizon_days
+        tr_stop, te_stop = np.searchsorted(days, [test_start, test_end], side="left")
+        if tr_stop >= min_train and te_stop > tr_stop:
+            out.append((int(tr_stop), int(te_stop)))
+    return out
+
+
+def run_station(arrays, params=None, refit=None, add_trees=None, n_jobs=1, n_folds=None, horizon_days=None):
+    """单站点全部折；返回逐折指标 dict 列表（可在子进程里执行）"""
+    from sklearn.ensemble import RandomForestRegressor
+
+    params = dict(params or train_scheduler.RF_PARAMS)
+    refit = (refit or REFIT).lower()
+    add_trees = ADD_TREES if add_trees is None else add_trees
+    X, y, days = arrays["X"], arrays["y"], arrays["days"]
+
+    rows, model = [], None
+    for k, (tr_stop, te_stop) in enumerate(folds(days, n_folds, horizon_days)):
+        t0 = time.perf_counter()
+        if refit == "warm" and model is not None:
+            # 只训练新增的树；旧树保留（它们只见过更早的数据）
+            model.set_params(n_estimators=model.n_estimators + add_trees)
+        else:
+            model = RandomForestRegressor(**params, warm_start=(refit == "warm"), n_jobs=n_jobs)
+        model.fit(X[:tr_stop], y[:tr_stop])
+        fit_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        err = model.predict(X[tr_stop:te_stop]) - y[tr_stop:te_stop]
+        pred_s = time.perf_counter() - t0
+        rows.append({
+            "station_id": arrays["station_id"],
+            "fold": k,
+            "refit": refit,
+            "train_start": _date(days[0]),
+            "train_end": _date(days[tr_stop - 1]),
+            "test_start": _date(days[tr_stop]),
+            "test_end": _date(days[te_stop - 1]),
+            "n_train": tr_stop,
+            "n_test": te_stop - tr_stop,
+            "n_trees": model.n_estimators,
+            "fit_seconds": fit_s,
+            "predict_seconds": pred_s,
+            "mae": float(np.mean(np.abs(err))),
+            "rmse": float(np.sqrt(np.mean(err ** 2))),
+            "bias": float(np.mean(err)),
+        })
+    return rows
+
+
+def _date(day):
+    return pd.Timestamp(int(day) * int(_DAY)).date().isoformat()
+
+
+def run(station_frames, feat_cols, params=None, refit=None, add_trees=None, cpu_budget=None,
+        n_folds=None, horizon_days=None):
+    """
+    station_frames: {station_id: DataFrame}；feat_cols: 特征列。
+    返回逐折指标表（station_id, fold 排序）。
+    """
+    arrays = [station_arrays(sid, g, feat_cols) for sid, g in station_frames.items()]
+    workers, n_jobs = train_scheduler.plan(len(arrays), cpu_budget)
+    kwargs = dict(params=params, refit=refit, add_trees=add_trees, n_jobs=n_jobs,
+                  n_folds=n_folds, horizon_days=horizon_days)
+
+    rows = []
+    if workers <= 1:
+        for a in arrays:
+            rows += run_station(a, **kwargs)
+    else:
+        print(f"[info] backtesting {len(arrays)} station(s): processes={workers}, n_jobs/model={n_jobs}")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for r in [pool.submit(run_station, a, **kwargs) for a in arrays]:
+                rows += r.result()
+    cols = ["station_id", "fold", "refit", "train_start", "train_end", "test_start", "test_end",
+            "n_train", "n_test", "n_trees", "fit_seconds", "predict_seconds", "mae", "rmse", "bias"]
+    return pd.DataFrame(rows, columns=cols).sort_values(["refit", "station_id", "fold"]).reset_index(drop=True)
+
+
+def summarize(fold_df):
+    """逐站点汇总：折数、MAE 均值 / 标准差 / 最差折、总训练耗时"""
+    if fold_df.empty:
+        return fold_df
+    g = fold_df.groupby(["refit", "station_id"])
+    return pd.DataFrame({
+        "folds": g.size(),
+        "mae_mean": g["mae"].mean(),
+        "mae_std": g["mae"].std(),
+        "mae_worst": g["mae"].max(),
+        "rmse_mean": g["rmse"].mean(),
+        "fit_seconds": g["fit_seconds"].sum(),
+    }).reset_index()
@@ -0,0 +1,243 @@
+# airquality/dag.py
+# 极简的阶段 DAG 执行器：阶段之间直接传内存对象（DataFrame / dict），互不依赖的阶段并发执行，
+# 输入内容不变的阶段直接跳过（复用上次的结果）。
+#
+# 跳过规则：阶段的输入指纹 = 上游结果的内容哈希 + 声明的输入文件内容哈希 + salt（配置）。
+# 指纹与上次成功运行时相同、声明的输出文件都在、结果缓存可读 → 不执行，直接读缓存结果。
+# 指纹记在 .state/pipeline.json，结果缓存在 .cache/pipeline/<阶段>.pkl。
+# 进程池在线程里创建（其他阶段同时在跑 pandas / pyarrow），子进程用 forkserver 启动（没有则 spawn），
+# 不在持有锁的多线程进程里 fork；PROCESS_START_METHOD 可覆盖。
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+STATE_PATH = os.path.join(".state", "pipeline.json")
+CACHE_DIR = os.path.join(".cache", "pipeline")
+START_METHOD = os.getenv(
+    "PROCESS_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+
+def mp_context():
+    """线程里创建进程池时用的启动方式（见文件头）"""
+    return multiprocessing.get_context(START_METHOD)
+
+
+class Stage:
+    """
+    fn(inputs) -> 结果；inputs 为 {上游阶段名: 上游结果}。
+    cache=False：每次都执行（如抓数、读特征库）；process=True：在子进程里执行（fn 需可 pickle）。
+    files：参与指纹的输入文件（如模型）；outputs：跳过前必须存在的输出文件；salt：参与指纹的配置。
+    """
+
+    def __init__(self, name, fn, deps=(), cache=True, process=False, files=(), outputs=(), salt=None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.cache = cache
+        self.process = process
+        self.files = list(files)
+        self.outputs = list(outputs)
+        self.salt = salt
+
+
+# ===================== 内容哈希 =====================
+def _update(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(b"df")
+        h.update(json.dumps([list(map(str, obj.columns)), list(map(str, obj.dtypes))]).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b"series")
+        h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(b"nd" + str(obj.dtype).encode() + str(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for k in sorted(obj, key=str):
+            _update(h, str(k))
+            _update(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"seq%d" % len(obj))
+        for v in obj:
+            _update(h, v)
+    else:
+        h.update(repr(obj).encode("utf-8"))
+
+
+def content_hash(obj):
+    h = hashlib.sha256()
+    _update(h, obj)
+    return h.hexdigest()
+
+
+_file_hashes = {}   # (path, mtime_ns, size) -> sha256；同一次运行里多个阶段共用的模型文件只读一遍
+
+
+def file_hash(path, chunk=1 << 20):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    memo = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if memo not in _file_hashes:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk), b""):
+                h.update(block)
+        _file_hashes[memo] = h.hexdigest()
+    return _file_hashes[memo]
+
+
+# ===================== 执行 =====================
+def _load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_state(path, state):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _cache_path(cache_dir, name):
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    return os.path.join(cache_dir, f"{safe}.pkl")
+
+
+def resolve(stages, targets=None):
+    """targets 及其全部上游；检查未知依赖与环，返回拓扑序的阶段名"""
+    by_name = {s.name: s for s in stages}
+    order, seen, visiting = [], set(), set()
+
+    def visit(name):
+        if name in seen:
+            return
+        if name not in by_name:
+            raise KeyError(f"unknown stage: {name}")
+        if name in visiting:
+            raise ValueError(f"dependency cycle at stage {name}")
+        visiting.add(name)
+        for d in by_name[name].deps:
+            visit(d)
+        visiting.discard(name)
+        seen.add(name)
+        order.append(name)
+
+    for t in (targets or [s.name for s in stages]):
+        visit(t)
+    return order
+
+
+def run(stages, targets=None, force=False, workers=None, state_path=STATE_PATH, cache_dir=CACHE_DIR):
+    """
+    执行 DAG；返回 (results, report)。report 每行：stage, status(ran/skipped/failed/blocked), seconds, error。
+    某阶段失败只阻塞它的下游，其余分支照常执行。
+    """
+    by_name = {s.name: s for s in stages}
+    order = resolve(stages, targets)
+    state = _load_state(state_path)
+    lock = threading.Lock()
+    results, hashes, report = {}, {}, {}
+    proc_pool = None
+
+    def fingerprint(stage):
+        return content_hash([
+            stage.salt,
+            [(d, hashes[d]) for d in stage.deps],
+            [(p, file_hash(p)) for p in stage.files],
+        ])
+
+    def execute(stage, inputs):
+        nonlocal proc_pool
+        if stage.process:
+            with lock:
+                if proc_pool is None:
+                    proc_pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=mp_context())
+            return proc_pool.submit(stage.fn, inputs).result()
+        return stage.fn(inputs)
+
+    def run_stage(name):
+        stage = by_name[name]
+        inputs = {d: results[d] for d in stage.deps}
+        t0 = time.perf_counter()
+        key = fingerprint(stage) if stage.cache else None
+        cache_file = _cache_path(cache_dir, name)
+
+        prev = state.get(name, {})
+        if (not force and stage.cache and prev.get("input_hash") == key
+                and all(os.path.exists(p) for p in stage.outputs) and os.path.isfile(cache_file)):
+            try:
+                with open(cache_file, "rb") as f:
+                    result = pickle.load(f)
+                return result, prev.get("result_hash") or content_hash(result), "skipped", time.perf_counter() - t0
+            except Exception as e:
+                print(f"[warn] {name}: cached result unreadable ({e}), re-running")
+
+        result = execute(stage, inputs)
+        result_hash = content_hash(result)
+        if stage.cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = cache_file + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+            with lock:
+                state[name] = {"input_hash": key, "result_hash": result_hash, "finished_at": time.time()}
+                _save_state(state_path, state)
+        return result, result_hash, "ran", time.perf_counter() - t0
+
+    pending = list(order)
+    running = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, workers or len(order)))
+    try:
+        while pending or running:
+            for name in list(pending):
+                deps = by_name[name].deps
+                if any(report.get(d, {}).get("status") in ("failed", "blocked") for d in deps):
+                    bad = [d for d in deps if report.get(d, {}).get("status") in ("failed", "blocked")]
+                    report[name] = {"stage": name, "status": "blocked", "seconds": 0.0, "error": f"upstream {bad}"}
+                    print(f"[skip] {name}: blocked by {bad}")
+                    pending.remove(name)
+                elif all(d in results for d in deps):
+                    print(f"[info] stage {name} ...")
+                    running[pool.submit(run_stage, name)] = name
+                    pending.remove(name)
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    result, result_hash, status, secs = fut.result()
+                except Exception as e:
+                    report[name] = {"stage": name, "status": "failed", "seconds": 0.0, "error": f"{type(e).__name__}: {e}"}
+                    print(f"[fail] {name}: {type(e).__name__}: {e}")
+                    continue
+                results[name], hashes[name] = result, result_hash
+                report[name] = {"stage": name, "status": status, "seconds": secs, "error": ""}
+                tag = "skip" if status == "skipped" else "ok"
+                print(f"[{tag}] {name}: {status} ({secs:.2f}s)")
+    finally:
+        pool.shutdown(wait=True)
+        if proc_pool is not None:
+            proc_pool.shutdown(wait=True)
+
+    return results, pd.DataFrame([report[n] for n in order if n in report])
@@ -0,0 +1,341 @@
+# airquality/feature_store.py
+# 特征库抽象：同一套接口，两个实现
+#   - HopsworksFeatureStore：远端 Hopsworks（默认，行为与原脚本一致）
+#   - LocalFeatureStore：本地按 station_id 分区的 Parquet（离线开发 / 基准测试 / 测试替身）
+# 选择方式：FEATURE_STORE=hopsworks | local；本地目录 LOCAL_FEATURE_STORE_DIR（默认 .feature_store）
+
+import os
+import json
+import glob
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+BACKEND = os.getenv("FEATURE_STORE", "hopsworks").lower()
+LOCAL_DIR = os.getenv("LOCAL_FEATURE_STORE_DIR", ".feature_store")
+
+PARTITION_KEY = "station_id"
+
+
+def get_feature_store(backend=None):
+    backend = (backend or BACKEND).lower()
+    if backend == "local":
+        return LocalFeatureStore(LOCAL_DIR)
+    if backend == "hopsworks":
+        import hopsworks as hs
+        project = hs.login(
+            api_key_value=os.environ["HOPSWORKS_API_KEY"],
+            project=os.getenv("HOPSWORKS_PROJECT", None),
+        )
+        return HopsworksFeatureStore(project.get_feature_store())
+    raise ValueError(f"unknown FEATURE_STORE backend: {backend}")
+
+
+def _as_list(x):
+    if x is None:
+        return None
+    if isinstance(x, str):
+        return [x]
+    return list(x)
+
+
+def _naive(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_convert(None) if ts.tzinfo is not None else ts
+
+
+def apply_filters(df, station_ids=None, start=None, end=None, event_time="date"):
+    """按站点与 [start, end]（含端点）过滤；后端无法下推时的兜底"""
+    station_ids = _as_list(station_ids)
+    if station_ids is not None and "station_id" in df.columns:
+        df = df[df["station_id"].isin(station_ids)]
+    if (start is not None or end is not None) and event_time in df.columns:
+        t = pd.to_datetime(df[event_time], utc=True).dt.tz_localize(None)
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= t >= _naive(start)
+        if end is not None:
+            mask &= t <= _naive(end)
+        df = df[mask]
+    return df
+
+
+# ===================== Hopsworks =====================
+class HopsworksFeatureGroup:
+    def __init__(self, fg, event_time="date"):
+        self._fg = fg
+        self.name = fg.name
+        self.version = fg.version
+        self.event_time = event_time
+
+    def insert(self, df, write_options=None):
+        return self._fg.insert(df, write_options=write_options or {"wait_for_job": True})
+
+    def _condition(self, station_ids=None, start=None, end=None):
+        """拼 hsfs Filter：站点 isin + 日期区间，交给 Hopsworks 在服务端过滤"""
+        conds = []
+        if station_ids is not None:
+            conds.append(self._fg.get_feature("station_id").isin(_as_list(station_ids)))
+        if start is not None:
+            conds.append(self._fg.get_feature(self.event_time) >= _naive(start).to_pydatetime())
+        if end is not None:
+            conds.append(self._fg.get_feature(self.event_time) <= _naive(end).to_pydatetime())
+        cond = None
+        for c in conds:
+            cond = c if cond is None else (cond & c)
+        return cond
+
+    def read(self, station_ids=None, start=None, end=None, columns=None):
+        cond = self._condition(station_ids, start, end)
+        if cond is None and not columns:
+            return self._fg.read()
+
+        cols = None
+        if columns:
+            # 过滤列也要选上，服务端过滤后本地再做一次兜底
+            extra = [c for c in ("station_id", self.event_time) if c not in columns]
+            cols = list(columns) + extra
+        query = self._fg.select(cols) if cols else self._fg.select_all()
+        if cond is not None:
+            query = query.filter(cond)
+        df = apply_filters(query.read(), station_ids, start, end, self.event_time)
+        return df[list(columns)] if columns else df
+
+    def data_version(self):
+        """
+        不读全表判断数据是否变化，按代价从低到高取第一个可用的：
+          1) 最新提交（time-travel FG 的 commit_details，只取 1 条元数据）；
+          2) FG 统计信息里 event_time 列的 max / count（服务端在写入时计算）；
+          3) 兜底：读 event_time 一列求最大值与行数（整列扫描）。
+        都拿不到时返回的信息不足以做缓存键（见 training_cache）。
+        """
+        info = {"name": self.name, "version": self.version}
+        try:
+            details = self._fg.commit_details(limit=1) or {}
+        except Exception:  # 非 time-travel FG 没有提交记录
+            details = {}
+        if details:
+            commit = max(details)
+            meta = details[commit] or {}
+            info["commit"] = str(commit)
+            info["committed_on"] = meta.get("committedOn")
+            return info
+
+        stat = self._event_time_statistics()
+        if stat is not None:
+            info.update(stat)
+            return info
+
+        try:
+            t = pd.to_datetime(self._fg.select([self.event_time]).read()[self.event_time], utc=True)
+            info["max_event_time"] = str(t.max()) if len(t) else None
+            info["rows"] = int(len(t))
+        except Exception as e:
+            print(f"[warn] {self.name} v{self.version}: cannot read max {self.event_time}: {e}")
+        return info
+
+    def _event_time_statistics(self):
+        """最近一次统计里 event_time 列的 max / count；FG 未开统计或取不到时返回 None"""
+        try:
+            stats = self._fg.get_statistics()
+        except Exception:
+            return None
+        for fds in getattr(stats, "feature_descriptive_statistics", None) or []:
+            if getattr(fds, "feature_name", None) == self.event_time and getattr(fds, "max", None) is not None:
+                return {
+                    "max_event_time": str(fds.max),
+                    "rows": getattr(fds, "count", None),
+                    "statistics_time": str(getattr(stats, "computation_time", None)),
+                }
+        return None
+
+    def select(self, columns):
+        return self._fg.select(columns)
+
+    def select_all(self):
+        return self._fg.select_all()
+
+
+class HopsworksFeatureStore:
+    def __init__(self, fs):
+        self._fs = fs
+
+    def get_feature_group(self, name, version):
+        fg = self._fs.get_feature_group(name, version=version)
+        # 按 FG 自己的 event_time 下推日期 / 计算 data_version（小时 FG、WAQI 读数 FG 是 time，不是 date）
+        return HopsworksFeatureGroup(fg, event_time=getattr(fg, "event_time", None) or "date")
+
+    def get_or_create_feature_group(self, name, version, primary_key, event_time="date",
+                                    description="", online_enabled=False):
+        fg = self._fs.get_or_create_feature_group(
+            name=name,
+            version=version,
+            description=description,
+            primary_key=primary_key,
+            event_time=event_time,
+            online_enabled=online_enabled,
+        )
+        # 已存在的 FG 以创建时的 event_time 为准
+        return HopsworksFeatureGroup(fg, event_time=getattr(fg, "event_time", None) or event_time)
+
+    def join(self, label_fg, label_cols, feature_fg, on, view_name, view_version=1,
+             labels=None, description=""):
+        """label_fg[label_cols] 内连接 feature_fg 全部列；远端通过 Feature View 物化"""
+        query = label_fg.select(label_cols).join(feature_fg.select_all(), on=on)
+        fv = self._fs.get_or_create_feature_view(
+            name=view_name,
+            version=view_version,
+            labels=labels or [],
+            query=query,
+            description=description,
+        )
+        data = fv.get_training_data()
+        if isinstance(data, tuple):  # (X, y[, ...])
+            data = pd.concat([d for d in data[:2] if d is not None], axis=1)
+        return data
+
+
+# ===================== 本地 Parquet =====================
+class LocalFeatureGroup:
+    """
+    目录布局：<root>/<name>_v<version>/station_id=<sid>/data.parquet + _meta.json
+    insert 按 primary_key + event_time upsert（保留最新写入），每个分区写回一个文件。
+    """
+
+    def __init__(self, root, name, version, meta):
+        self.name = name
+        self.version = version
+        self.path = os.path.join(root, f"{name}_v{version}")
+        self.meta = meta
+        self.event_time = meta.get("event_time", "date")
+
+    # ---- 元数据 ----
+    @property
+    def primary_key(self):
+        return list(self.meta.get("primary_key", []))
+
+    def _save_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, "_meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(self.path, "_meta.json"))
+
+    def _partition_file(self, station_id):
+        return os.path.join(self.path, f"{PARTITION_KEY}={quote(str(station_id), safe='')}", "data.parquet")
+
+    def partitions(self):
+        out = {}
+        for d in glob.glob(os.path.join(self.path, f"{PARTITION_KEY}=*")):
+            f = os.path.join(d, "data.parquet")
+            if os.path.isfile(f):
+                out[unquote(os.path.basename(d).split("=", 1)[1])] = f
+        return out
+
+    # ---- 写 ----
+    def insert(self, df, write_options=None):
+        if df is None or df.empty:
+            return 0
+        if PARTITION_KEY not in df.columns:
+            raise ValueError(f"[{self.name}] local store needs a '{PARTITION_KEY}' column")
+        keys = [k for k in self.primary_key + [self.event_time] if k in df.columns]
+        df = df.copy()
+        if self.event_time in df.columns:
+            df[self.event_time] = pd.to_datetime(df[self.event_time], utc=True).dt.tz_localize(None)
+
+        for sid, part in df.groupby(PARTITION_KEY, sort=False):
+            path = self._partition_file(sid)
+            if os.path.isfile(path):
+                part = pd.concat([pd.read_parquet(path), part], ignore_index=True)
+            if keys:
+                part = part.drop_duplicates(keys, keep="last")
+            if self.event_time in part.columns:
+                part = part.sort_values(self.event_time, kind="mergesort")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            part.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+
+        self.meta["commits"] = int(self.meta.get("commits", 0)) + 1
+        self.meta["schema"] = {c: str(t) for c, t in part.dtypes.items()}
+        self._save_meta()
+        return len(df)
+
+    def data_version(self):
+        """提交次数（每次 insert +1）+ 最大 event_time + 行数；只读 event_time 一列"""
+        info = {"name": self.name, "version": self.version, "commit": int(self.meta.get("commits", 0))}
+        times = [pd.read_parquet(f, columns=[self.event_time])[self.event_time] for f in self.partitions().values()]
+        times = [t for t in times if len(t)]
+        t = pd.concat(times) if times else pd.Series([], dtype="datetime64[ns]")
+        info["max_event_time"] = str(t.max()) if len(t) else None
+        info["rows"] = int(len(t))
+        return info
+
+    # ---- 读（谓词下推：站点→分区裁剪，日期→Parquet 行组过滤）----
+    def read(self, station_ids=None, start=None, end=None, columns=None):
+        parts = self.partitions()
+        wanted = _as_list(station_ids)
+        if wanted is not None:
+            parts = {k: v for k, v in parts.items() if k in set(wanted)}
+
+        filters = []
+        if start is not None:
+            filters.append((self.event_time, ">=", _naive(start)))
+        if end is not None:
+            filters.append((self.event_time, "<=", _naive(end)))
+
+        frames = [
+            pd.read_parquet(f, columns=columns, filters=filters or None)
+            for _, f in sorted(parts.items())
+        ]
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            return self._empty_frame(columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def _empty_frame(self, columns=None):
+        """没有匹配行时返回带 FG 列与 dtype 的空表（与 Hopsworks 一致），而不是没有列的空表"""
+        files = list(self.partitions().values())
+        if files:
+            import pyarrow.parquet as pq
+            df = pq.read_schema(files[0]).empty_table().to_pandas()
+        else:
+            df = pd.DataFrame({c: pd.Series(dtype=t) for c, t in self.meta.get("schema", {}).items()})
+        return df.reindex(columns=list(columns)) if columns else df
+
+
+class LocalFeatureStore:
+    def __init__(self, root=LOCAL_DIR):
+        self.root = root
+
+    def _meta_path(self, name, version):
+        return os.path.join(self.root, f"{name}_v{version}", "_meta.json")
+
+    def get_feature_group(self, name, version):
+        path = self._meta_path(name, version)
+        if not os.path.isfile(path):
+            raise KeyError(f"feature group {name} v{version} not found in {self.root}")
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return LocalFeatureGroup(self.root, name, version, meta)
+
+    def get_or_create_feature_group(self, name, version, primary_key, event_time="date",
+                                    description="", online_enabled=False):
+        try:
+            return self.get_feature_group(name, version)
+        except KeyError:
+            fg = LocalFeatureGroup(self.root, name, version, {
+                "primary_key": list(primary_key),
+                "event_time": event_time,
+                "description": description,
+                "commits": 0,
+            })
+            fg._save_meta()
+            return fg
+
+    def join(self, label_fg, label_cols, feature_fg, on, view_name=None, view_version=1,
+             labels=None, description=""):
+        """与 featureview.py 的 Feature View 查询等价：label_fg[label_cols] INNER JOIN feature_fg"""
+        left = label_fg.read(columns=label_cols)
+        right = feature_fg.read()
+        return left.merge(right, on=on, how="inner", suffixes=("", "_wx"))
@@ -0,0 +1,129 @@
+# airquality/fetch.py
+# 抓取层：进程内共享的 keep-alive Session、按接口的并发上限、指数退避重试、每次调用的耗时记录。
+# 响应缓存仍由 http_cache 负责（命中缓存时不占用并发名额之外的任何网络资源）。
+#   FETCH_RETRIES（默认 3）、FETCH_BACKOFF（首次退避秒数，默认 0.5，之后翻倍并加抖动）
+#   FETCH_LIMIT_<名称>（如 FETCH_LIMIT_WAQI=1）覆盖某个接口的并发上限
+
+import os
+import time
+import random
+import threading
+
+import pandas as pd
+
+from . import http_cache
+
+RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+BACKOFF = float(os.getenv("FETCH_BACKOFF", "0.5"))
+POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "16"))
+
+# URL 前缀 -> (名称, 默认并发上限)；WAQI 免费 token 限流较严，给得小一些
+ENDPOINTS = {
+    "https://api.waqi.info/": ("waqi", 2),
+    "https://air-quality-api.open-meteo.com/": ("openmeteo_air", 4),
+    "https://api.open-meteo.com/": ("openmeteo_weather", 4),
+}
+DEFAULT_LIMIT = 4
+
+_session = None
+_session_lock = threading.Lock()
+_semaphores = {}
+_timings = []
+_timings_lock = threading.Lock()
+
+
+def get_session():
+    """进程内共享的 keep-alive 连接池（各线程复用同一个 Session）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+    return _session
+
+
+def endpoint_for(url):
+    for prefix, (name, limit) in ENDPOINTS.items():
+        if url.startswith(prefix):
+            return name, int(os.getenv(f"FETCH_LIMIT_{name.upper()}", limit))
+    return "other", DEFAULT_LIMIT
+
+
+def _semaphore(name, limit):
+    with _session_lock:
+        if name not in _semaphores:
+            _semaphores[name] = threading.BoundedSemaphore(max(1, limit))
+        return _semaphores[name]
+
+
+def _retryable(exc):
+    import requests
+    # 网络错误 / 超时 / 429 与 5xx（http_cache 对这些状态码抛 HTTPError）/ 响应不是 JSON
+    return isinstance(exc, (requests.RequestException, ValueError)) and not isinstance(exc, http_cache.CacheMiss)
+
+
+def get_json(url, params=None, session=None, timeout=60, accept=None, retries=None, label="", ttl=None):
+    """
+    带缓存、限流与重试的 GET → JSON；参数同 http_cache.get_json（ttl=None 用接口默认 TTL）。
+    label 只用于耗时记录（如站点 ID）。重试用尽后抛出最后一次的异常。
+    """
+    name, limit = endpoint_for(url)
+    retries = RETRIES if retries is None else retries
+    http = session or get_session()
+    t0 = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with _semaphore(name, limit):
+                payload = http_cache.get_json(url, params, session=http, timeout=timeout, ttl=ttl, accept=accept)
+            _record(name, label, attempt, t0, "ok")
+            return payload
+        except Exception as e:
+            if attempt > retries or not _retryable(e):
+                _record(name, label, attempt, t0, f"{type(e).__name__}: {e}")
+                raise
+            delay = BACKOFF * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+            print(f"[warn] {name} {label} attempt {attempt} failed ({type(e).__name__}); retry in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _record(endpoint, label, attempts, t0, status):
+    with _timings_lock:
+        _timings.append({
+            "endpoint": endpoint,
+            "label": label,
+            "attempts": attempts,
+            "seconds": time.perf_counter() - t0,
+            "status": status,
+        })
+
+
+def timings(reset=False):
+    """本进程内所有调用的耗时记录（DataFrame）"""
+    with _timings_lock:
+        df = pd.DataFrame(_timings, columns=["endpoint", "label", "attempts", "seconds", "status"])
+        if reset:
+            _timings.clear()
+    return df
+
+
+def summary(df=None):
+    """按接口汇总：调用数、失败数、重试次数、p50 / max 耗时"""
+    df = timings() if df is None else df
+    if df.empty:
+        return df
+    g = df.assign(failed=df["status"] != "ok", retries=df["attempts"] - 1).groupby("endpoint")
+    return pd.DataFrame({
+        "calls": g.size(),
+        "failed": g["failed"].sum(),
+        "retries": g["retries"].sum(),
+        "p50_s": g["seconds"].median(),
+        "max_s": g["seconds"].max(),
+    }).reset_index()
@@ -0,0 +1,269 @@
+# airquality/forest_io.py
+# 紧凑的森林模型格式（.aqf）：把 RandomForestRegressor 的所有树拍平成几段连续的 NumPy 数组，
+# 写进一个文件；加载时 mmap 整个文件，数组直接指向映射内存，不反序列化、不拷贝。
+#
+# 文件布局（小端）：
+#   b"AQFOREST" | uint32 格式版本 | uint32 头部长度 | JSON 头部 | 按 64 字节对齐的各数组
+# JSON 头部：features、n_trees、n_nodes、各数组的 dtype/offset/count，以及 bundle 里其余可 JSON 化的元数据。
+# MODEL_FORMAT=joblib（默认）| flat | both 控制训练脚本写哪种格式；加载时优先用不旧于 .joblib 的 .aqf。
+# 推理：所有树同时做向量化遍历（每一步处理所有 样本 × 树 中尚未到达叶子的路径），
+# 绕开 sklearn 逐棵树的 Python 分发；按 PREDICT_CHUNK 行分块，限制 (样本, 树) 临时数组的内存。
+# 小批量（每日 / 单站点）明显更快，几百行以上的大批量 sklearn 仍更快：加载 .joblib 时默认保留 sklearn 模型，
+# FLAT_PREDICT=1 时才编译成 FlatForest。
+
+import os
+import io
+import json
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b"AQFOREST"
+FORMAT_VERSION = 1
+ALIGN = 64
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "joblib").lower()
+FLAT_PREDICT = os.getenv("FLAT_PREDICT", "0") == "1"
+PREDICT_CHUNK = 256   # 每块样本数
+
+_ARRAYS = [
+    # 名称, dtype
+    ("tree_offsets", "<i8"),   # 每棵树第一个节点的全局下标，长度 n_trees + 1
+    ("feature", "<i4"),        # 分裂特征；叶子为 -2（与 sklearn TREE_UNDEFINED 一致）
+    ("threshold", "<f8"),
+    ("left", "<i4"),           # 全局下标；叶子为 -1
+    ("right", "<i4"),
+    ("value", "<f8"),          # 节点输出（单输出回归）
+    ("missing_left", "u1"),    # NaN 走左子树（sklearn >= 1.3）
+]
+
+
+class FlatForest:
+    """只依赖 NumPy 的森林推理对象，predict 结果与 sklearn 一致"""
+
+    def __init__(self, arrays, header, buffer=None):
+        self._buffer = buffer  # 持有 mmap，保证数组指向的内存有效
+        self.header = header
+        self.features = list(header["features"])
+        self.n_features_in_ = int(header["n_features"])
+        self.n_estimators = int(header["n_trees"])
+        for name, _ in _ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def _as_matrix(self, X):
+        if hasattr(X, "columns") and set(self.features).issubset(X.columns):
+            X = X[self.features]
+        # 与 sklearn 相同：先转 float32，比较时再提升到 float64
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X.shape}, model expects {self.n_features_in_} features")
+        return X.astype(np.float64)
+
+    def apply(self, X):
+        """每棵树的叶子全局下标，形状 (n_samples, n_trees)；所有树同时逐层下降"""
+        return self._apply(self._as_matrix(X))
+
+    def _apply(self, X):
+        n, n_trees = X.shape[0], self.n_estimators
+        node = np.tile(self.tree_offsets[:-1], n)            # (样本, 树) 按行展开
+        rows = np.repeat(np.arange(n), n_trees)
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while active.size:
+            nd = node[active]
+            x = X[rows[active], self.feature[nd]]
+            go_left = (x <= self.threshold[nd]) | (np.isnan(x) & (self.missing_left[nd] == 1))
+            nxt = np.where(go_left, self.left[nd], self.right[nd]).astype(np.int64)
+            node[active] = nxt
+            active = active[self.feature[nxt] >= 0]
+        return node.reshape(n, n_trees)
+
+    def predict(self, X):
+        X = self._as_matrix(X)
+        out = np.empty(X.shape[0])
+        for s in range(0, X.shape[0], PREDICT_CHUNK):
+            vals = self.value[self._apply(X[s:s + PREDICT_CHUNK])]
+            # cumsum 沿树方向顺序累加，与 sklearn 逐棵 += 的顺序一致，结果逐位相同
+            out[s:s + PREDICT_CHUNK] = np.cumsum(vals, axis=1)[:, -1] / self.n_estimators
+        return out
+
+
+# ===================== 转换 =====================
+def compile_forest(model, features=None, extra=None):
+    """内存中把 sklearn 森林编译为 FlatForest（不落盘）"""
+    arrays = flatten_forest(model)
+    if features is None:
+        features = getattr(model, "feature_names_in_", [])
+    return FlatForest(arrays, _header(model, arrays, features, extra))
+
+
+def flatten_forest(model):
+    """sklearn RandomForestRegressor → 扁平数组 dict"""
+    trees = [est.tree_ for est in model.estimators_]
+    if any(t.n_outputs != 1 for t in trees):
+        raise ValueError("only single-output regression forests are supported")
+
+    counts = np.array([t.node_count for t in trees], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def cat(get, dtype):
+        return np.concatenate([np.asarray(get(t)) for t in trees]).astype(dtype)
+
+    left = np.concatenate([
+        np.where(t.children_left >= 0, t.children_left + off, -1) for t, off in zip(trees, offsets[:-1])
+    ]).astype(np.int32)
+    right = np.concatenate([
+        np.where(t.children_right >= 0, t.children_right + off, -1) for t, off in zip(trees, offsets[:-1])
+    ]).astype(np.int32)
+
+    if hasattr(trees[0], "missing_go_to_left"):
+        missing_left = cat(lambda t: t.missing_go_to_left, np.uint8)
+    else:
+        missing_left = np.zeros(int(offsets[-1]), dtype=np.uint8)
+
+    return {
+        "tree_offsets": offsets,
+        "feature": cat(lambda t: t.feature, np.int32),
+        "threshold": cat(lambda t: t.threshold, np.float64),
+        "left": left,
+        "right": right,
+        "value": cat(lambda t: t.value[:, 0, 0], np.float64),
+        "missing_left": missing_left,
+    }
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _header(model, arrays, features, extra):
+    return {
+        "format_version": FORMAT_VERSION,
+        "features": list(features),
+        "n_features": int(model.n_features_in_),
+        "n_trees": len(model.estimators_),
+        "n_nodes": int(arrays["tree_offsets"][-1]),
+        "meta": _json_meta(extra),
+    }
+
+
+def _json_meta(extra):
+    """bundle 里除 model/features 外能 JSON 化的元数据"""
+    meta = {}
+    for k, v in (extra or {}).items():
+        try:
+            json.dumps(v)
+        except TypeError:
+            continue
+        meta[k] = v
+    return meta
+
+
+def save_forest(path, model, features, extra=None):
+    arrays = flatten_forest(model)
+    header = _header(model, arrays, features, extra)
+    header["arrays"] = {}
+    try:
+        import sklearn
+        header["sklearn_version"] = sklearn.__version__
+    except ImportError:
+        pass
+
+    # 先算各数组的偏移：头部长度依赖偏移的位数，迭代到稳定
+    offset_guess = 0
+    while True:
+        pos = offset_guess
+        for name, dtype in _ARRAYS:
+            a = arrays[name]
+            header["arrays"][name] = {"dtype": dtype, "offset": pos, "count": int(a.size)}
+            pos = _align(pos + a.size * np.dtype(dtype).itemsize)
+        head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data_start = _align(len(MAGIC) + 8 + len(head))
+        if data_start == offset_guess:
+            break
+        offset_guess = data_start
+
+    buf = io.BytesIO()
+    buf.write(MAGIC)
+    buf.write(struct.pack("<II", FORMAT_VERSION, len(head)))
+    buf.write(head)
+    for name, dtype in _ARRAYS:
+        spec = header["arrays"][name]
+        buf.write(b"\0" * (spec["offset"] - buf.tell()))
+        buf.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp, path)
+    return path
+
+
+def load_forest(path, use_mmap=True):
+    with open(path, "rb") as f:
+        if use_mmap:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path}: not an AQFOREST model file")
+    version, head_len = struct.unpack_from("<II", buf, len(MAGIC))
+    if version > FORMAT_VERSION:
+        raise ValueError(f"{path}: format version {version} is newer than supported ({FORMAT_VERSION})")
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(buf[start:start + head_len]).decode("utf-8"))
+
+    arrays = {}
+    for name, _ in _ARRAYS:
+        spec = header["arrays"][name]
+        arrays[name] = np.frombuffer(buf, dtype=np.dtype(spec["dtype"]), count=spec["count"], offset=spec["offset"])
+    return FlatForest(arrays, header, buffer=buf)
+
+
+# ===================== bundle 读写（与 joblib 的 {"model", "features", ...} 结构兼容）=====================
+def flat_path_for(joblib_path):
+    root, _ = os.path.splitext(joblib_path)
+    return root + ".aqf"
+
+
+def bundle_paths(path, fmt=None):
+    """按 MODEL_FORMAT 应写出的文件：joblib -> [.joblib]，flat -> [.aqf]，both -> 两者"""
+    fmt = (fmt or MODEL_FORMAT).lower()
+    paths = [path] if fmt in ("joblib", "both") else []
+    if fmt in ("flat", "both"):
+        paths.append(flat_path_for(path))
+    return paths
+
+
+def save_model_bundle(path, bundle, fmt=None):
+    """按 MODEL_FORMAT 写 .joblib / .aqf；path 为 .joblib 路径"""
+    fmt = (fmt or MODEL_FORMAT).lower()
+    extra = {k: v for k, v in bundle.items() if k not in ("model", "features")}
+    written = []
+    if fmt in ("joblib", "both"):
+        import joblib
+        joblib.dump(bundle, path)
+        written.append(path)
+    if fmt in ("flat", "both"):
+        written.append(save_forest(flat_path_for(path), bundle["model"], bundle["features"], extra))
+    return written
+
+
+def load_model_bundle(path, use_mmap=True):
+    """
+    path 为 .joblib 或 .aqf。存在对应的 .aqf 且不旧于 .joblib 时优先加载 .aqf（mmap，无拷贝）。
+    返回 {"model": ..., "features": [...], 其余元数据}。
+    """
+    flat = path if path.endswith(".aqf") else flat_path_for(path)
+    if os.path.isfile(flat) and (
+        not os.path.isfile(path) or path == flat or os.path.getmtime(flat) >= os.path.getmtime(path)
+    ):
+        forest = load_forest(flat, use_mmap=use_mmap)
+        return {**forest.header.get("meta", {}), "model": forest, "features": forest.features}
+    import joblib
+    bundle = joblib.load(path)
+    if FLAT_PREDICT and type(bundle.get("model")).__name__ == "RandomForestRegressor":
+        extra = {k: v for k, v in bundle.items() if k not in ("model", "features")}
+        bundle = {**bundle, "model": compile_forest(bundle["model"], bundle.get("features"), extra)}
+    return bundle
@@ -0,0 +1,146 @@
+# airquality/hourly.py
+# 小时粒度：特征组 weather_hourly_forecast（与日度表并列，01 写入）、向量化滞后特征、跨站点小时模型。
+# 行数是日度的 24 倍，因此：
+#   - 数值列统一 float32（特征库 / Parquet 列式存储体积减半，sklearn 训练时本来也转 float32，省一次拷贝）；
+#   - 滞后特征不用逐站 groupby.apply：lag_features 对 (站点, 小时) 键排序一次后 searchsorted，
+#     按“时间”而不是“行号”取值，缺小时的地方得到 NaN 而不会错位；
+#   - 所有站点共用一个模型（站点编号 / 经纬度作为特征，见 pooled_model），预测时所有站点的所有小时一次 predict。
+# 标签：站点 CSV 只有日度值，小时目标取 Open-Meteo 的小时 pm2_5（CAMS 模式值）。
+#   HOURLY_LAGS（默认 24,48,168 小时）最小值即直接预测的最远步长 HOURLY_HORIZON（默认 24 小时）。
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import forest_io, lag_features, pooled_model
+
+HOURLY_FG = ("weather_hourly_forecast", 1)
+KEYS = ["city", "station_id", "time"]
+TARGET = "pm2_5"
+
+WEATHER_COLS = [
+    "temperature_2m", "relative_humidity_2m", "dew_point_2m", "wind_speed_10m",
+    "wind_direction_10m", "precipitation", "pressure_msl", "visibility",
+]
+CALENDAR_COLS = ["hour", "dayofweek"]
+
+HOURLY_LAGS = [int(x) for x in os.getenv("HOURLY_LAGS", "24,48,168").split(",") if x.strip()]
+HOURLY_HORIZON = int(os.getenv("HOURLY_HORIZON", str(min(HOURLY_LAGS))))
+HOURLY_MODEL_PATH = os.path.join("models", "hourly_rf.joblib")
+HOURLY_RF_PARAMS = {"n_estimators": 200, "min_samples_leaf": 3, "random_state": 42}
+
+
+def to_hourly_frame(hourly):
+    """01 抓到的小时表（已带 city / station_id）→ 写入小时 FG 的格式：时间去时区、date 列保留（水位用）、数值列 float32"""
+    out = hourly.copy()
+    out["time"] = pd.to_datetime(out["time"], utc=True).dt.tz_localize(None)
+    out["date"] = out["time"].dt.normalize()
+    num = [c for c in out.columns if c not in KEYS + ["date"] and pd.api.types.is_numeric_dtype(out[c])]
+    out[num] = out[num].astype(np.float32)
+    return out.dropna(subset=KEYS).drop_duplicates(KEYS, keep="last").reset_index(drop=True)
+
+
+def add_lags(df, col=TARGET, lags=None):
+    """为每行加 {col}_lag{k}h = 同站点 k 小时前的 col（按时间对齐，那一小时不存在时为 NaN），见 lag_features"""
+    lags = HOURLY_LAGS if lags is None else lags
+    out = lag_features.add_features(df, col, lags=lags, time_col="time", freq="h", suffix="h")
+    names = lag_features.feature_names(col, lags=lags, suffix="h")
+    out[names] = out[names].astype(np.float32)
+    return out
+
+
+def add_calendar(df):
+    out = df.copy()
+    t = pd.to_datetime(out["time"])
+    out["hour"] = t.dt.hour.astype(np.float32)
+    out["dayofweek"] = t.dt.dayofweek.astype(np.float32)
+    return out
+
+
+def feature_columns(df, lags=None):
+    lags = HOURLY_LAGS if lags is None else lags
+    cols = [c for c in WEATHER_COLS if c in df.columns] + CALENDAR_COLS
+    return cols + [f"{TARGET}_lag{k}h" for k in lags]
+
+
+def build_frame(df, lags=None):
+    """小时 FG 读出的表 → 带日历与滞后特征的表（按站点、时间排序）"""
+    df = df.assign(time=pd.to_datetime(df["time"], utc=True).dt.tz_localize(None))
+    df = df.sort_values(["station_id", "time"], kind="mergesort").reset_index(drop=True)
+    return add_calendar(add_lags(df, lags=lags))
+
+
+def time_split(df, frac=0.8):
+    """每个站点各自按时间前 80% / 后 20%（df 已按站点、时间排序）；向量化，不逐站循环"""
+    g = df.groupby("station_id", sort=False)
+    rank = g.cumcount().to_numpy()
+    size = g["time"].transform("size").to_numpy()
+    train = rank < (size * frac).astype(np.int64)
+    return df[train], df[~train]
+
+
+def train(df, params=None, n_jobs=-1):
+    """
+    df: build_frame 的输出。返回 (bundle, 训练耗时秒, 验证集逐站 MAE dict)。
+    目标或特征缺失（如前 168 小时没有滞后值）的行不参与训练。
+    """
+    from sklearn.ensemble import RandomForestRegressor
+
+    feats = feature_columns(df)
+    table = pooled_model.station_table(df["station_id"].unique())
+    df = pooled_model.add_station_features(df.dropna(subset=feats + [TARGET]), table)
+    tr, te = time_split(df)
+    features = feats + pooled_model.STATION_FEATURES
+
+    t0 = time.perf_counter()
+    model = RandomForestRegressor(**(params or HOURLY_RF_PARAMS), n_jobs=n_jobs)
+    model.fit(tr[features].to_numpy(dtype=np.float32), tr[TARGET].to_numpy())
+    fit_s = time.perf_counter() - t0
+    model.set_params(n_jobs=None)
+
+    maes = {}
+    if len(te):
+        err = np.abs(model.predict(te[features].to_numpy(dtype=np.float32)) - te[TARGET].to_numpy())
+        maes = {sid: float(err[idx].mean()) for sid, idx in te.groupby("station_id").indices.items()}
+    bundle = {
+        "model": model, "features": features, "stations": table, "pooled": True,
+        "lags": list(HOURLY_LAGS), "horizon": HOURLY_HORIZON, "granularity": "hourly",
+    }
+    return bundle, fit_s, maes
+
+
+def save(bundle, path=HOURLY_MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return forest_io.save_model_bundle(path, bundle)
+
+
+def load(path=HOURLY_MODEL_PATH):
+    return forest_io.load_model_bundle(path)
+
+
+def predict(bundle, frame):
+    """frame: build_frame 的输出（可含多个站点）；所有行一次 predict，返回与 frame 等长的数组"""
+    X = pooled_model.add_station_features(frame, bundle["stations"])
+    return bundle["model"].predict(X[bundle["features"]].to_numpy(dtype=np.float32))
+
+
+def forecast_frame(df, now, horizon=None, lags=None):
+    """
+    [now, now + horizon) 的预测输入；now 为时间戳，或 {station_id: 时间戳}（各站点本地时间不同）。
+    now 及以后的目标值先置空再算滞后，保证滞后特征只来自已发生的小时（FG 里未来小时的 pm2_5 是预报值）。
+    """
+    horizon = HOURLY_HORIZON if horizon is None else horizon
+
+    def at(frame):
+        if isinstance(now, dict):
+            return pd.to_datetime(frame["station_id"].map(now))
+        return pd.Timestamp(now)
+
+    df = df.assign(time=pd.to_datetime(df["time"], utc=True).dt.tz_localize(None))
+    df[TARGET] = df[TARGET].where(df["time"] < at(df))
+    frame = build_frame(df, lags=lags)
+    start = at(frame)
+    keep = (frame["time"] >= start) & (frame["time"] < start + pd.Timedelta(hours=horizon))
+    return frame[keep].reset_index(drop=True)
@@ -0,0 +1,143 @@
+# airquality/http_cache.py
+# Open-Meteo / WAQI 响应的本地磁盘缓存：按 URL + params 内容寻址，每个接口单独 TTL，
+# 超过容量按 LRU（最近访问时间）淘汰。HTTP_CACHE_OFFLINE=1 时完全离线回放，缓存未命中直接报错。
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(".cache", "http"))
+CACHE_MAX_BYTES = int(float(os.getenv("HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024)
+ENABLED = os.getenv("HTTP_CACHE", "1") != "0"
+OFFLINE = os.getenv("HTTP_CACHE_OFFLINE", "0") == "1"
+
+# 各接口的 TTL（秒），按 URL 前缀匹配；可用 HTTP_CACHE_TTL 统一覆盖
+ENDPOINT_TTL = {
+    "https://air-quality-api.open-meteo.com/": 6 * 3600,
+    "https://api.open-meteo.com/": 6 * 3600,
+    "https://api.waqi.info/": 30 * 60,
+}
+DEFAULT_TTL = int(os.getenv("HTTP_CACHE_TTL", "3600"))
+
+# 不参与缓存 key 的参数（密钥不应影响内容寻址，也保证离线回放时无需密钥）
+SECRET_PARAMS = {"token", "apikey", "api_key"}
+
+_evict_lock = threading.Lock()
+
+
+class CacheMiss(RuntimeError):
+    """离线模式下请求不在缓存中"""
+
+
+def ttl_for(url):
+    if "HTTP_CACHE_TTL" in os.environ:
+        return DEFAULT_TTL
+    for prefix, ttl in ENDPOINT_TTL.items():
+        if url.startswith(prefix):
+            return ttl
+    return DEFAULT_TTL
+
+
+def _public_params(params):
+    return {str(k): str(v) for k, v in (params or {}).items() if str(k).lower() not in SECRET_PARAMS}
+
+
+def cache_key(url, params=None):
+    canon = json.dumps([url, sorted(_public_params(params).items())], ensure_ascii=False)
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store(path, url, params, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "params": _public_params(params),
+                   "fetched_at": time.time(), "payload": payload}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def evict(max_bytes=None):
+    """总大小超限时，按 mtime（命中时会 touch）从旧到新删除"""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    with _evict_lock:
+        files = []
+        for root, _, names in os.walk(CACHE_DIR):
+            for n in names:
+                if n.endswith(".json"):
+                    p = os.path.join(root, n)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, p))
+        total = sum(s for _, s, _ in files)
+        removed = 0
+        for _, size, p in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+def _http():
+    import requests  # 离线回放 / 命中缓存时不需要加载 requests
+    return requests
+
+
+def _get(url, params, session, timeout):
+    r = (session or _http()).get(url, params=params, timeout=timeout)
+    if r.status_code == 429 or r.status_code >= 500:
+        r.raise_for_status()  # 限流 / 服务端临时错误：抛 HTTPError，由调用方（fetch）退避重试
+    return r
+
+
+def get_json(url, params=None, session=None, timeout=60, ttl=None, accept=None):
+    """
+    带缓存的 GET → JSON。
+    accept: 可选的校验函数，只有 accept(payload) 为真才写入缓存（错误响应不缓存）。
+    """
+    if not ENABLED:
+        return _get(url, params, session, timeout).json()
+
+    key = cache_key(url, params)
+    path = _entry_path(key)
+    ttl = ttl_for(url) if ttl is None else ttl
+
+    entry = _load(path)
+    if entry is not None and (OFFLINE or time.time() - entry.get("fetched_at", 0) <= ttl):
+        try:
+            os.utime(path)  # LRU：记录最近访问
+        except OSError:
+            pass
+        return entry["payload"]
+
+    if OFFLINE:
+        raise CacheMiss(f"offline mode: no cached response for {url} {_public_params(params)}")
+
+    r = _get(url, params, session, timeout)
+    payload = r.json()
+    if r.ok and (accept is None or accept(payload)):
+        _store(path, url, params, payload)
+        evict()
+    return payload
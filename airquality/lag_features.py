@@ -0,0 +1,120 @@
+# airquality/lag_features.py
+# 时间序列特征（训练与推理共用）：任意滞后、时间窗滚动均值 / 最大值、按时间衰减的指数加权均值。
+# 所有站点一次完成：把 (站点, 时间 // freq) 编成一个 int64 键，对有值的行只排序一次，
+# 滞后与滚动窗口是 searchsorted + 前缀和 / reduceat 的 NumPy 段运算，指数加权用 pandas 分组 ewm，没有逐站 groupby.apply。
+#
+# 语义按“时间”而不是“行号”（缺日期不会错位），且只用当前时刻之前的值（不泄漏当期目标）：
+#   {col}_lag{k}            t - k 个周期的值；那一期没有值时为 NaN
+#   {col}_roll{w}_{stat}    [t - w, t - 1] 个周期内已有值的 mean / max；窗口内不足 min_periods 个值时为 NaN
+#   {col}_ewm{h}            t 之前所有值按 2^(-(t - t_j) / h) 加权的均值（h 为半衰期，单位为周期）
+# 目标列为 NaN 的行（例如待预测的未来日期）照常得到特征，推理时把历史与未来行拼在一起调用即可。
+# suffix 追加在周期数之后（小时表用 "h"：pm2_5_lag24h）。
+
+import numpy as np
+import pandas as pd
+
+STATS = ("mean", "max")
+
+
+def feature_names(col="pm2_5", lags=(), windows=(), stats=STATS, halflives=(), suffix=""):
+    names = [f"{col}_lag{k}{suffix}" for k in lags]
+    names += [f"{col}_roll{w}{suffix}_{s}" for w in windows for s in stats]
+    names += [f"{col}_ewm{h}{suffix}" for h in halflives]
+    return names
+
+
+def period_keys(df, group="station_id", time_col="date", freq="D"):
+    """(分组编号, 距 epoch 的周期数) -> int64 键；同组内相差 k 个周期的两行键也相差 k，不同组相距 2^32"""
+    codes = df[group].astype("category").cat.codes.to_numpy().astype(np.int64)
+    t = pd.to_datetime(df[time_col]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return (codes << 32) + t // _freq_ns(freq)
+
+
+def _freq_ns(freq):
+    return pd.tseries.frequencies.to_offset(freq).nanos
+
+
+def _window_reduce(values, lo, hi, how):
+    """对每行的 values[lo:hi]（已排序的有值序列上的半开区间）做 mean / max；空窗口为 NaN"""
+    cnt = hi - lo
+    if how == "mean":
+        cs = np.concatenate([[0.0], np.cumsum(values)])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(cnt > 0, (cs[hi] - cs[lo]) / cnt, np.nan), cnt
+    if how == "max":
+        if not len(lo):
+            return np.zeros(0), cnt
+        # reduceat 的下标需 < 长度：末尾补一个哨兵；成对下标 [lo, hi] 的偶数位就是各窗口的结果
+        padded = np.append(values, np.nan)
+        idx = np.column_stack([lo, hi]).ravel()
+        red = np.fmax.reduceat(padded, idx)[::2]
+        return np.where(cnt > 0, red, np.nan), cnt
+    raise ValueError(f"unknown window stat: {how}")
+
+
+def _ewm_at_obs(keys, values, halflife, freq="D"):
+    """
+    有值序列（按键排序）上每个观测点（含当期）的时间衰减加权均值。
+    递推 S_i = 2^(-Δt/h) * S_{i-1} + x_i 无法写成数值稳定的前缀和（跨多年时 2^(Δt/h) 溢出），
+    因此用 pandas 的分组 ewm(times=...)：一次 Cython 调用处理所有分组，同样没有 Python 层逐站循环。
+    """
+    if not len(keys):
+        return np.zeros(0)
+    step = _freq_ns(freq)
+    groups = keys >> 32
+    times = ((keys - (groups << 32)) * step).astype("datetime64[ns]")
+    ew = (pd.Series(values)
+          .groupby(groups, sort=False)
+          .ewm(halflife=pd.Timedelta(halflife * step, "ns"), times=times)
+          .mean())
+    return ew.to_numpy()
+
+
+def add_features(df, col="pm2_5", lags=(), windows=(), stats=STATS, halflives=(),
+                 group="station_id", time_col="date", freq="D", suffix="", min_periods=1):
+    """
+    返回 df 的副本（行顺序不变），按 feature_names(...) 的顺序追加特征列。
+    同一 (group, 周期) 有多行时取最后一行的值作为该期的值。
+    """
+    out = df.copy()
+    keys = period_keys(df, group, time_col, freq)
+    vals = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+
+    # 所有行按键排序一次：之后的查询都是有序的（searchsorted / reduceat 顺序访问），结果再按 order 放回原行
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    vals = vals[order]
+
+    # 有值的行即历史序列（同键保留最后一个有值行）
+    has = ~np.isnan(vals)
+    vk, vv = keys[has], vals[has]
+    if len(vk):
+        keep = np.append(vk[1:] != vk[:-1], True)
+        vk, vv = vk[keep], vv[keep]
+
+    def put(name, sorted_values):
+        res = np.empty(len(keys))
+        res[order] = sorted_values
+        out[name] = res
+
+    for k in lags:
+        want = keys - k
+        pos = np.minimum(np.searchsorted(vk, want), max(len(vk) - 1, 0))
+        hit = (vk[pos] == want) if len(vk) else np.zeros(len(keys), dtype=bool)
+        put(f"{col}_lag{k}{suffix}", np.where(hit, vv[pos] if len(vk) else np.nan, np.nan))
+
+    hi = np.searchsorted(vk, keys, side="left")        # 严格早于 t 的最后一个有值行之后
+    for w in windows:
+        lo = np.searchsorted(vk, keys - w, side="left")
+        for s in stats:
+            res, cnt = _window_reduce(vv, lo, hi, s)
+            put(f"{col}_roll{w}{suffix}_{s}", np.where(cnt >= min_periods, res, np.nan))
+
+    if halflives:
+        prev = hi - 1
+        # 上一个有值行必须属于同一组
+        same = (prev >= 0) & ((vk[np.maximum(prev, 0)] >> 32) == (keys >> 32)) if len(vk) else np.zeros(len(keys), bool)
+        for h in halflives:
+            ew = _ewm_at_obs(vk, vv, h, freq)
+            put(f"{col}_ewm{h}{suffix}", np.where(same, ew[np.maximum(prev, 0)] if len(vk) else np.nan, np.nan))
+    return out
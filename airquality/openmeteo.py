@@ -0,0 +1,64 @@
+# airquality/openmeteo.py
+# Open-Meteo 多坐标批量请求：latitude / longitude 传逗号分隔的列表，响应是按输入顺序排列的 payload 列表。
+# 同一批里其余参数（timezone、past_days、变量…）必须相同，调用方按这些参数分组；
+# 拼出的 URL 超过 OPENMETEO_MAX_URL 字符或坐标数超过 OPENMETEO_MAX_LOCATIONS 时自动切成多批。
+# OPENMETEO_BATCH=0 关闭批量，回到逐站点请求。
+
+import os
+from urllib.parse import urlencode
+
+from . import fetch
+
+BATCH = os.getenv("OPENMETEO_BATCH", "1") != "0"
+MAX_URL = int(os.getenv("OPENMETEO_MAX_URL", "2000"))
+MAX_LOCATIONS = int(os.getenv("OPENMETEO_MAX_LOCATIONS", "50"))
+
+
+def _with_coords(params, coords):
+    return {
+        **params,
+        "latitude": ",".join(str(lat) for lat, _ in coords),
+        "longitude": ",".join(str(lon) for _, lon in coords),
+    }
+
+
+def build_url(url, params, coords):
+    return url + "?" + urlencode(_with_coords(params, coords))
+
+
+def chunk_coords(url, params, coords, max_url=None, max_locations=None):
+    """按 URL 长度与坐标数上限把坐标切成若干批（保持顺序）"""
+    max_url = max_url or MAX_URL
+    max_locations = max(1, max_locations or MAX_LOCATIONS)
+    chunks, cur = [], []
+    for c in coords:
+        trial = cur + [c]
+        if cur and (len(trial) > max_locations or len(build_url(url, params, trial)) > max_url):
+            chunks.append(cur)
+            cur = [c]
+        else:
+            cur = trial
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def get_many(url, params, coords, session=None, timeout=60, accept=None, label=""):
+    """
+    coords: [(lat, lon), ...]；params 不含 latitude / longitude。
+    返回与 coords 等长、顺序一致的 payload 列表；每批只发一个请求（经 fetch.get_json：缓存 + 限流 + 重试）。
+    某批响应的坐标数不符（例如返回了错误对象）时抛 ValueError，由调用方决定是否逐站点回退。
+    """
+    out = []
+    for chunk in chunk_coords(url, params, coords):
+        def ok(payload, n=len(chunk)):
+            items = payload if isinstance(payload, list) else [payload]
+            return len(items) == n and (accept is None or all(accept(p) for p in items))
+
+        payload = fetch.get_json(url, _with_coords(params, chunk), session=session, timeout=timeout,
+                                 accept=ok, label=label or f"{len(chunk)} locations")
+        items = payload if isinstance(payload, list) else [payload]
+        if len(items) != len(chunk):
+            raise ValueError(f"expected {len(chunk)} locations from {url}, got {len(items)}: {str(payload)[:200]}")
+        out.extend(items)
+    return out
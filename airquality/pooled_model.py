@@ -0,0 +1,88 @@
+# airquality/pooled_model.py
+# 跨站点的单一混合模型：所有站点数据训练一个森林，额外加入站点编号与经纬度特征，
+# 保存为一个文件 models/pooled_rf.joblib；03 可直接用它给任意已知站点预测。
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from . import forest_io
+from .stations import stations
+
+POOLED_MODEL_PATH = os.path.join("models", "pooled_rf.joblib")
+STATION_FEATURES = ["station_code", "station_lat", "station_lon"]
+RF_PARAMS = {"n_estimators": 400, "random_state": 42}
+
+
+def station_table(station_ids, stations_list=None):
+    """{station_id: {code, lat, lon}}；编号按 station_id 排序，保证可复现"""
+    meta = {st["station_id"]: st for st in (stations_list or stations)}
+    table = {}
+    for code, sid in enumerate(sorted(set(station_ids))):
+        st = meta.get(sid, {})
+        table[sid] = {"code": code, "lat": st.get("lat", np.nan), "lon": st.get("lon", np.nan)}
+    return table
+
+
+def add_station_features(df, table):
+    """按 station_id 加入站点编号 / 经纬度；未知站点直接报错（模型没见过）"""
+    unknown = sorted(set(df["station_id"]) - set(table))
+    if unknown:
+        raise KeyError(f"pooled model has no station(s): {unknown}")
+    out = df.copy()
+    sid = out["station_id"]
+    out["station_code"] = sid.map({k: v["code"] for k, v in table.items()}).astype(np.int64)
+    out["station_lat"] = sid.map({k: v["lat"] for k, v in table.items()}).astype(np.float64)
+    out["station_lon"] = sid.map({k: v["lon"] for k, v in table.items()}).astype(np.float64)
+    return out
+
+
+def time_split(df, frac=0.8):
+    """每个站点各自按时间 80/20 切分后拼接，与逐站训练的切分完全一致"""
+    tr, te = [], []
+    for _, g in df.groupby("station_id"):
+        g = g.sort_values("date")
+        split = int(len(g) * frac)
+        tr.append(g.iloc[:split])
+        te.append(g.iloc[split:])
+    return pd.concat(tr), pd.concat(te)
+
+
+def train_pooled(df, feat_cols, params=None, n_jobs=None):
+    """返回 (bundle, 训练耗时秒, 验证集逐站 MAE dict)"""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error
+
+    table = station_table(df["station_id"].unique())
+    df = add_station_features(df, table)
+    tr, te = time_split(df)
+    features = list(feat_cols) + STATION_FEATURES
+
+    t0 = time.perf_counter()
+    model = RandomForestRegressor(**(params or RF_PARAMS), n_jobs=n_jobs)
+    model.fit(tr[features], tr["pm2_5"])
+    fit_s = time.perf_counter() - t0
+    model.set_params(n_jobs=None)
+
+    maes = {}
+    if len(te):
+        pred = model.predict(te[features])
+        for sid, idx in te.groupby("station_id").indices.items():
+            maes[sid] = float(mean_absolute_error(te["pm2_5"].iloc[idx], pred[idx]))
+    bundle = {"model": model, "features": features, "stations": table, "pooled": True}
+    return bundle, fit_s, maes
+
+
+def save_pooled(bundle, path=POOLED_MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    forest_io.save_model_bundle(path, bundle)
+    return path
+
+
+def predict_pooled(bundle, station_id, frame):
+    """frame: 该站点的天气特征行（不需要 station_id 列）"""
+    X = frame.copy()
+    X["station_id"] = station_id
+    X = add_station_features(X, bundle["stations"])
+    return bundle["model"].predict(X[bundle["features"]])
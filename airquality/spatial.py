@@ -0,0 +1,197 @@
+# airquality/spatial.py
+# 跨站点空间特征：邻近站点的天气 / PM2.5 按反距离加权（IDW）汇总成本站特征。
+#   1) 邻居索引只建一次：分块计算 haversine 距离 + argpartition 取每站 SPATIAL_K 个最近邻
+#      （不含自己、距离 <= SPATIAL_MAX_KM），权重 1 / d^SPATIAL_POWER 归一化；之后每天的计算只查这张 (n, k) 表；
+#   2) 每个要汇总的列铺成 (站点, 天) 稠密网格，一次 fancy-index 取出 (站点, k, 天) 的邻居值，
+#      按非空邻居的权重重新归一化求和 —— 每天的工作量 O(n·k)，与站点数线性；
+#   3) 结果按 (站点, 日期) 取回原表的行：nbr_<天气列>（同日，预报时也可得）、nbr_pm2_5_lag<k>（k 天前的邻居标签）。
+# 02 / 03 在 SPATIAL_FEATURES=1 时启用；SPATIAL_LAGS 默认 1,2,3。
+
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+ENABLED = os.getenv("SPATIAL_FEATURES", "0") == "1"
+K = int(os.getenv("SPATIAL_K", "4"))
+MAX_KM = float(os.getenv("SPATIAL_MAX_KM", "50"))
+POWER = float(os.getenv("SPATIAL_POWER", "2"))
+LAGS = [int(x) for x in os.getenv("SPATIAL_LAGS", "1,2,3").split(",") if x.strip()]
+# 要汇总的天气列；留空 = 天气表里全部数值列
+WEATHER_COLS = [c.strip() for c in os.getenv("SPATIAL_WEATHER_COLS", "").split(",") if c.strip()]
+PREFIX = "nbr_"
+CHUNK = 256   # 每次处理的站点数，限制 (站点, k, 天) / (站点, n) 临时数组的内存
+
+EARTH_RADIUS_KM = 6371.0088
+_DAY = np.int64(86400 * 10**9)
+_index_memo = {}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """球面距离（km），参数为度，支持广播"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def config():
+    """影响特征取值的配置（进训练表快照的 salt）"""
+    return {"k": K, "max_km": MAX_KM, "power": POWER, "lags": LAGS, "weather_cols": WEATHER_COLS}
+
+
+def weather_columns(w_df, label_col="pm2_5"):
+    """天气表里参与邻居汇总的列（02 训练与 03 预测用同一规则）"""
+    if WEATHER_COLS:
+        return [c for c in WEATHER_COLS if c in w_df.columns]
+    skip = {label_col, "city", "station_id", "date"}
+    return [c for c in w_df.select_dtypes(include=[np.number]).columns
+            if c not in skip and not c.startswith(PREFIX)]
+
+
+def build_index(stations_list, k=None, max_km=None, power=None):
+    """
+    站点清单 -> 邻居索引 dict：
+      station_ids (n,)、pos {station_id: 行号}、neighbors (n, k) 行号（不足 k 个用 -1 补）、dist_km (n, k)、weights (n, k)。
+    同一组坐标与参数在进程内只建一次。
+    """
+    k = K if k is None else k
+    max_km = MAX_KM if max_km is None else max_km
+    power = POWER if power is None else power
+    pts = [(st["station_id"], float(st["lat"]), float(st["lon"])) for st in stations_list
+           if st.get("lat") is not None and st.get("lon") is not None]
+    memo_key = hashlib.sha1(repr((sorted(pts), k, max_km, power)).encode("utf-8")).hexdigest()
+    if memo_key in _index_memo:
+        return _index_memo[memo_key]
+
+    ids = np.array([p[0] for p in pts], dtype=object)
+    n = len(ids)
+    neighbors = np.full((n, k), -1, dtype=np.int64)
+    dist = np.full((n, k), np.inf)
+    if n > 1 and k > 0:
+        lat = np.array([p[1] for p in pts])
+        lon = np.array([p[2] for p in pts])
+        kk = min(k, n - 1)
+        for s in range(0, n, CHUNK):
+            d = haversine_km(lat[s:s + CHUNK, None], lon[s:s + CHUNK, None], lat[None, :], lon[None, :])
+            rows = np.arange(d.shape[0])
+            d[rows, s + rows] = np.inf                         # 不含自己（同址的其他站点距离为 0，仍算邻居）
+            idx = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+            dk = np.take_along_axis(d, idx, axis=1)
+            order = np.argsort(dk, axis=1, kind="stable")
+            idx, dk = np.take_along_axis(idx, order, axis=1), np.take_along_axis(dk, order, axis=1)
+            keep = dk <= max_km
+            neighbors[s:s + CHUNK, :kk] = np.where(keep, idx, -1)
+            dist[s:s + CHUNK, :kk] = np.where(keep, dk, np.inf)
+
+    # 距离为 0（同址）时用 1 m 代替，避免除零
+    w = np.where(neighbors >= 0, 1.0 / np.maximum(dist, 1e-3) ** power, 0.0)
+    total = w.sum(axis=1, keepdims=True)
+    weights = np.divide(w, total, out=np.zeros_like(w), where=total > 0)
+
+    index = {
+        "station_ids": ids,
+        "pos": {sid: i for i, sid in enumerate(ids)},
+        "neighbors": neighbors,
+        "dist_km": dist,
+        "weights": weights,
+    }
+    _index_memo[memo_key] = index
+    return index
+
+
+def neighbor_table(index):
+    """邻居索引 -> 长表（station_id, rank, neighbor_id, dist_km, weight），便于检查"""
+    ids, nb = index["station_ids"], index["neighbors"]
+    rows, ranks = np.nonzero(nb >= 0)
+    return pd.DataFrame({
+        "station_id": ids[rows],
+        "rank": ranks,
+        "neighbor_id": ids[nb[rows, ranks]],
+        "dist_km": index["dist_km"][rows, ranks],
+        "weight": index["weights"][rows, ranks],
+    })
+
+
+def _days(dates):
+    return pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]").astype(np.int64) // _DAY
+
+
+def _grid(frame, col, index, day0, n_days, group, time_col):
+    """(站点, 天) 稠密网格；索引外站点 / 窗口外日期丢弃，同一格多行取最后一行"""
+    out = np.full((len(index["station_ids"]), n_days), np.nan)
+    rows = frame[group].map(index["pos"]).to_numpy(dtype=np.float64)
+    days = _days(frame[time_col]) - day0
+    vals = pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=np.float64)
+    ok = ~np.isnan(rows) & (days >= 0) & (days < n_days)
+    out[rows[ok].astype(np.int64), days[ok]] = vals[ok]
+    return out
+
+
+def idw(grid, index):
+    """(站点, 天) -> 每站邻居的 IDW 均值 (站点, 天)；只用非空邻居并重新归一化，全空为 NaN"""
+    nb, w = index["neighbors"], index["weights"]
+    out = np.full(grid.shape, np.nan)
+    for s in range(0, len(nb), CHUNK):
+        nbc, wc = nb[s:s + CHUNK], w[s:s + CHUNK]
+        vals = grid[np.maximum(nbc, 0)]                       # (c, k, 天)
+        wv = np.where(np.isnan(vals) | (nbc < 0)[:, :, None], 0.0, wc[:, :, None])
+        total = wv.sum(axis=1)
+        acc = (wv * np.nan_to_num(vals)).sum(axis=1)
+        out[s:s + CHUNK] = np.divide(acc, total, out=np.full(total.shape, np.nan), where=total > 0)
+    return out
+
+
+def _ffill(mat):
+    """沿时间轴前向填充（每行独立），向量化"""
+    idx = np.where(~np.isnan(mat), np.arange(mat.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    out = mat[np.arange(mat.shape[0])[:, None], idx]
+    return out
+
+
+def feature_names(weather_cols, lags=None, label_col="pm2_5"):
+    lags = LAGS if lags is None else lags
+    return [f"{PREFIX}{c}" for c in weather_cols] + [f"{PREFIX}{label_col}_lag{k}" for k in lags]
+
+
+def add_features(df, index, weather_cols, labels=None, label_col="pm2_5", lags=None,
+                 group="station_id", time_col="date", fill_forward=False):
+    """
+    df: 至少含 group / time_col / weather_cols 的表（所有站点一起传入，邻居的天气来自同一张表）；
+    labels: 含 group / time_col / label_col 的标签表（可比 df 覆盖更多站点、更早日期）。
+    返回 df 的副本，追加 nbr_<天气列> 与 nbr_<label>_lag<k>；邻居都缺值时为 NaN。
+    fill_forward=True 时邻居标签滞后按时间前向填充（预测未来日期时邻居标签还不存在，沿用最近一天）。
+    """
+    lags = LAGS if lags is None else lags
+    out = df.copy()
+    if out.empty:
+        for c in feature_names(weather_cols, lags, label_col):
+            out[c] = np.nan
+        return out
+
+    row_days = _days(out[time_col])
+    day0 = int(row_days.min()) - max(lags or [0])
+    if labels is not None and len(labels):
+        day0 = min(day0, int(_days(labels[time_col]).min()))
+    n_days = int(row_days.max()) - day0 + 1
+    rows = out[group].map(index["pos"]).to_numpy(dtype=np.float64)
+    known = ~np.isnan(rows)
+    r, d = rows[known].astype(np.int64), row_days[known] - day0
+
+    def take(mat, shift=0):
+        col = np.full(len(out), np.nan)
+        col[known] = mat[r, d - shift]
+        return col
+
+    for c in weather_cols:
+        out[f"{PREFIX}{c}"] = take(idw(_grid(out, c, index, day0, n_days, group, time_col), index))
+    if lags:
+        if labels is None or label_col not in labels.columns:
+            raise KeyError(f"spatial lags need a labels frame with '{label_col}'")
+        mat = idw(_grid(labels, label_col, index, day0, n_days, group, time_col), index)
+        if fill_forward:
+            mat = _ffill(mat)
+        for k in lags:
+            out[f"{PREFIX}{label_col}_lag{k}"] = take(mat, k)
+    return out
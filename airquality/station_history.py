@@ -0,0 +1,267 @@
+# airquality/station_history.py
+# 站点历史 CSV（*-air-quality.csv）-> 按站点分区的列式数据集，之后各阶段只读这里，不再解析原始 CSV。
+#   <STATION_HISTORY_DIR>/station_id=<sid>/data.parquet   每站一个文件：city, station_id, date + 全部污染物（float32）
+#   <STATION_HISTORY_DIR>/_manifest.json                  每站的来源 CSV（路径、mtime、size）、行数、导入时间
+# 解析：显式 dtype（污染物 float32，日期按 STATION_CSV_DATE_FORMAT）、表头去空格、空白值 -> NaN；
+#       按日期排序，同一天多行取均值；缺的污染物列补 NaN，所有分区列一致。
+# 每次导入同时给出校验报告（每站一行）：坏日期、重复日期、非数值、缺天、各污染物空值 / 负值、缺列。
+# 多站点用进程池并行解析（INGEST_WORKERS，默认 CPU 数）；入口见 ingest_station_history.py。
+
+import os
+import glob
+import json
+import time
+import ntpath
+from urllib.parse import quote, unquote
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.getenv("STATION_HISTORY_DIR", ".station_history")
+DATE_FORMAT = os.getenv("STATION_CSV_DATE_FORMAT", "%Y/%m/%d")
+WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+PARTITION_KEY = "station_id"
+
+# 规范化后的表头 -> 数据集列名
+POLLUTANTS = ["pm2_5", "pm10", "o3", "no2", "so2", "co"]
+COLUMN_ALIASES = {
+    "pm25": "pm2_5", "pm2.5": "pm2_5", "pm2_5": "pm2_5", "pm 2.5": "pm2_5", "pm-2.5": "pm2_5", "pm₂.₅": "pm2_5",
+    "pm10": "pm10", "o3": "o3", "no2": "no2", "so2": "so2", "co": "co",
+}
+TIME_ALIASES = ["date", "time", "timestamp", "datetime", "日期", "时间"]
+
+_memo = {}
+
+
+# ===================== 来源 CSV =====================
+def resolve_csv(path, search_dirs=None):
+    """stations.py 里的路径不存在时（如 Windows 绝对路径），按文件名在当前目录 / 仓库根目录找"""
+    if path and os.path.isfile(path):
+        return path
+    name = ntpath.basename(path or "")
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for d in search_dirs or [os.getcwd(), repo]:
+        cand = os.path.join(d, name)
+        if name and os.path.isfile(cand):
+            return cand
+    raise FileNotFoundError(f"station CSV not found: {path}")
+
+
+def _source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return {"csv": os.path.abspath(csv_path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+# ===================== 解析 + 校验 =====================
+def parse_csv(csv_path, city, station_id):
+    """
+    单个站点 CSV -> (日度表, 校验报告 dict)。可在子进程里执行。
+    表：city, station_id, date, *POLLUTANTS，按 date 升序、每天一行。
+    """
+    header = pd.read_csv(csv_path, nrows=0, skipinitialspace=True, encoding="utf-8", encoding_errors="ignore")
+    names = {c: str(c).strip().lower() for c in header.columns}
+    tcol = next((c for c, n in names.items() if n in TIME_ALIASES), None)
+    cols = {c: COLUMN_ALIASES[n] for c, n in names.items() if n in COLUMN_ALIASES}
+    if tcol is None or "pm2_5" not in cols.values():
+        raise ValueError(f"[{station_id}] 找不到日期/PM2.5 列。列名(规范化后)={list(names.values())}")
+
+    read_kw = dict(usecols=[tcol, *cols], skipinitialspace=True, encoding="utf-8", encoding_errors="ignore")
+    non_numeric = 0
+    try:
+        raw = pd.read_csv(csv_path, dtype={tcol: str, **{c: np.float32 for c in cols}}, **read_kw)
+    except ValueError:
+        # 个别单元格不是数字：退回字符串读取后逐列转换，并计数
+        raw = pd.read_csv(csv_path, dtype=str, **read_kw)
+        for c in cols:
+            s = raw[c].str.strip().replace("", np.nan)
+            v = pd.to_numeric(s, errors="coerce")
+            non_numeric += int((v.isna() & s.notna()).sum())
+            raw[c] = v.astype(np.float32)
+    raw = raw.rename(columns={tcol: "date", **cols})
+    rows_raw = int(len(raw))
+
+    dates = pd.to_datetime(raw["date"].str.strip(), format=DATE_FORMAT, errors="coerce")
+    if dates.isna().all() and len(dates):
+        dates = pd.to_datetime(raw["date"].str.strip(), format="mixed", errors="coerce")
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    raw["date"] = dates.dt.normalize()
+    bad_dates = int(raw["date"].isna().sum())
+    raw = raw.dropna(subset=["date"])
+    dup_dates = int(raw["date"].duplicated().sum())
+
+    present = [p for p in POLLUTANTS if p in raw.columns]
+    out = raw.groupby("date", sort=True)[present].mean().reset_index()
+    for p in POLLUTANTS:
+        out[p] = out[p].astype(np.float32) if p in out.columns else np.float32(np.nan)
+    out.insert(0, "station_id", station_id)
+    out.insert(0, "city", city)
+    out = out[["city", "station_id", "date", *POLLUTANTS]]
+
+    span = int((out["date"].max() - out["date"].min()).days) + 1 if len(out) else 0
+    report = {
+        "station_id": station_id,
+        "city": city,
+        "source": os.path.basename(csv_path),
+        "rows_raw": rows_raw,
+        "rows": int(len(out)),
+        "date_min": out["date"].min().date().isoformat() if len(out) else None,
+        "date_max": out["date"].max().date().isoformat() if len(out) else None,
+        "missing_days": span - int(len(out)),
+        "bad_dates": bad_dates,
+        "duplicate_dates": dup_dates,
+        "was_sorted": bool(raw["date"].is_monotonic_increasing),
+        "non_numeric": non_numeric,
+        "missing_columns": ",".join(p for p in POLLUTANTS if p not in present),
+    }
+    for p in POLLUTANTS:
+        report[f"{p}_null"] = int(out[p].isna().sum())
+        report[f"{p}_negative"] = int((out[p] < 0).sum())
+    report["status"] = "fail" if out["pm2_5"].isna().all() else (
+        "warn" if bad_dates or non_numeric or report["pm2_5_negative"] else "ok")
+    return out, report
+
+
+# ===================== 写 / 读数据集 =====================
+def _partition_file(root, station_id):
+    return os.path.join(root, f"{PARTITION_KEY}={quote(str(station_id), safe='')}", "data.parquet")
+
+
+def _manifest_path(root):
+    return os.path.join(root, "_manifest.json")
+
+
+def load_manifest(root=None):
+    path = _manifest_path(root or ROOT)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(root, manifest):
+    os.makedirs(root, exist_ok=True)
+    tmp = _manifest_path(root) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, _manifest_path(root))
+
+
+def _write_partition(root, station_id, df):
+    path = _partition_file(root, station_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def _parse_job(csv_path, city, station_id):
+    t0 = time.perf_counter()
+    df, report = parse_csv(csv_path, city, station_id)
+    report["parse_seconds"] = round(time.perf_counter() - t0, 4)
+    return df, report
+
+
+def ingest(stations_list, root=None, workers=None):
+    """
+    导入 stations_list 中有 sensor_csv 的站点（并行解析），写分区 + 更新 manifest。
+    返回校验报告 DataFrame（每站一行）；解析失败的站点 status=fail，不覆盖已有分区。
+    """
+    root = root or ROOT
+    jobs = []
+    for st in stations_list:
+        if not st.get("sensor_csv"):
+            continue
+        try:
+            jobs.append((resolve_csv(st["sensor_csv"]), st["city"], st["station_id"]))
+        except FileNotFoundError as e:
+            print(f"[warn] {st['station_id']}: {e}")
+    workers = max(1, min(workers or WORKERS, len(jobs)))
+
+    results = {}
+    if workers <= 1:
+        for job in jobs:
+            try:
+                results[job[2]] = _parse_job(*job)
+            except Exception as e:
+                results[job[2]] = e
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {job[2]: pool.submit(_parse_job, *job) for job in jobs}
+            for sid, fut in futures.items():
+                try:
+                    results[sid] = fut.result()
+                except Exception as e:
+                    results[sid] = e
+
+    manifest = load_manifest(root)
+    reports = []
+    for csv_path, city, sid in jobs:
+        res = results[sid]
+        if isinstance(res, Exception):
+            print(f"[fail] {sid}: {res}")
+            reports.append({"station_id": sid, "city": city, "source": os.path.basename(csv_path),
+                            "status": "fail", "error": str(res)})
+            continue
+        df, report = res
+        _write_partition(root, sid, df)
+        manifest[sid] = {**_source_stamp(csv_path), "city": city, "rows": int(len(df)), "ingested_at": time.time()}
+        _memo.pop((os.path.abspath(root), sid), None)
+        reports.append(report)
+    if jobs:
+        _save_manifest(root, manifest)
+    return pd.DataFrame(reports)
+
+
+def partitions(root=None):
+    out = {}
+    for d in glob.glob(os.path.join(root or ROOT, f"{PARTITION_KEY}=*")):
+        f = os.path.join(d, "data.parquet")
+        if os.path.isfile(f):
+            out[unquote(os.path.basename(d).split("=", 1)[1])] = f
+    return out
+
+
+def read(station_ids=None, columns=None, root=None):
+    """读数据集（按站点裁剪分区）；columns 为 None 时返回全部列"""
+    parts = partitions(root)
+    if station_ids is not None:
+        wanted = {station_ids} if isinstance(station_ids, str) else set(station_ids)
+        parts = {k: v for k, v in parts.items() if k in wanted}
+    frames = [pd.read_parquet(f, columns=columns) for _, f in sorted(parts.items())]
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(columns=columns or ["city", "station_id", "date", *POLLUTANTS])
+    return pd.concat(frames, ignore_index=True)
+
+
+def is_stale(st, root=None):
+    """分区不存在，或来源 CSV 的 mtime / size 与导入时不同"""
+    root = root or ROOT
+    entry = load_manifest(root).get(st["station_id"])
+    if entry is None or not os.path.isfile(_partition_file(root, st["station_id"])):
+        return True
+    try:
+        stamp = _source_stamp(resolve_csv(st["sensor_csv"]))
+    except (FileNotFoundError, TypeError):
+        return False   # 原始 CSV 不在本机：以已导入的数据为准
+    return (stamp["mtime_ns"], stamp["size"]) != (entry.get("mtime_ns"), entry.get("size"))
+
+
+def load_station(st, root=None):
+    """单站点历史（全部污染物）；未导入或 CSV 已变化时先导入该站点。进程内记忆。"""
+    root = root or ROOT
+    key = (os.path.abspath(root), st["station_id"])
+    stale = is_stale(st, root)
+    if key in _memo and not stale:
+        return _memo[key].copy()
+    if stale:
+        report = ingest([st], root=root, workers=1)
+        if report.empty or (report["status"] == "fail").all():
+            raise ValueError(f"[{st['station_id']}] station history ingestion failed")
+        print(f"[info] {st['station_id']}: station history (re)ingested -> {_partition_file(root, st['station_id'])}")
+    df = read(st["station_id"], root=root)
+    _memo[key] = df
+    return df.copy()
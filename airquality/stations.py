@@ -0,0 +1,62 @@
+# airquality/stations.py
+# 站点清单（01 写特征、混合模型的站点特征共用）
+
+# ===================== 站点清单 =====================
+# 可保留瑞典站 se-0001（无标签），并新增香港屯门站（有 CSV 标签）
+stations = [
+    {
+        "city": "SE_City_1",
+        "station_id": "se-0001",
+        "lat": 62.99,
+        "lon": 17.64,
+        "timezone": "Europe/Stockholm",
+        "sensor_csv": None,  # 无标签
+    },
+    {
+        "city": "HongKong",
+        "station_id": "hk-tuen-mun",
+        "lat": 22.394984,
+        "lon": 113.973140,
+        "timezone": "Asia/Hong_Kong",
+        "sensor_csv": r"D:\ID2223\tuen-mun-air-quality.csv",
+    },
+    {
+        "city": "HongKong",
+        "station_id": "hk-yuen-long",
+        "lat": 22.446221,          # 新站：元朗
+        "lon": 114.035288,
+        "timezone": "Asia/Hong_Kong",
+        "sensor_csv": r"D:\ID2223\yuen-long-air-quality.csv",  # 你的新CSV
+    },
+    {
+        "city": "HongKong",
+        "station_id": "hk-tsuen-wan",
+        "lat": 22.37167,
+        "lon": 114.11347,
+        "timezone": "Asia/Hong_Kong",
+        "sensor_csv": r"D:\ID2223\tsuen-wan-air-quality.csv",  # 你的新CSV
+    },
+    {
+        "city": "HongKong",
+        "station_id": "hk-Kwai-Chung",
+        "lat": 22.35104,
+        "lon": 114.13080,
+        "timezone": "Asia/Hong_Kong",
+        "sensor_csv": r"D:\ID2223\kwai-chung-air-quality.csv",  # 你的新CSV
+    },
+    {
+        "city": "HongKong",
+        "station_id": "hk-tung-chung",
+        "lat": 22.28924,
+        "lon": 113.94137,
+        "timezone": "Asia/Hong_Kong",
+        "sensor_csv": r"D:\ID2223\tung-chung-air-quality.csv",  # 你的新CSV
+    },
+]
+
+
+def station_by_id(station_id, stations_list=None):
+    for st in stations_list or stations:
+        if st["station_id"] == station_id:
+            return st
+    raise KeyError(f"unknown station_id: {station_id}")
@@ -0,0 +1,97 @@
+# airquality/train_scheduler.py
+# 多站点训练调度：在给定 CPU 预算内分配「站点级」与「树级」并行
+#   站点数 >= CPU 预算：进程池每个 worker 训一个站点，每个森林 n_jobs=1
+#   站点数 <  CPU 预算：worker 数 = 站点数，剩余核分给每个森林的 n_jobs（树级并行）
+# TRAIN_CPUS 控制预算（默认全部 CPU）；TRAIN_CPUS=1 即原来的串行训练。
+# TUNED_PARAMS=outputs/tuned_params.json（tune.py 的输出）时，各站点使用调参结果，未调参的站点仍用 RF_PARAMS。
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import forest_io
+from .dag import mp_context
+
+TRAIN_CPUS = int(os.getenv("TRAIN_CPUS", "0")) or (os.cpu_count() or 1)
+
+RF_PARAMS = {"n_estimators": 400, "random_state": 42}
+TUNED_PARAMS = os.getenv("TUNED_PARAMS", "")
+
+
+def tuned_params(path=None):
+    """{station_id: params}；未设置 TUNED_PARAMS 或文件不存在时为空"""
+    path = path or TUNED_PARAMS
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def params_for(station_id, tuned=None):
+    tuned = tuned_params() if tuned is None else tuned
+    if station_id in tuned:
+        return {**RF_PARAMS, **tuned[station_id]}
+    return dict(RF_PARAMS)
+
+
+def plan(n_tasks, cpu_budget=None):
+    """返回 (进程数, 每个模型的 n_jobs)"""
+    cpu_budget = max(1, cpu_budget or TRAIN_CPUS)
+    if n_tasks <= 0:
+        return 0, 1
+    workers = min(n_tasks, cpu_budget)
+    return workers, max(1, cpu_budget // workers)
+
+
+def make_task(station_id, tr, te, feat_cols, model_path, rows, params=None, extra=None):
+    """一个站点的训练任务（可 pickle，传给子进程）"""
+    return {
+        "station_id": station_id,
+        "X_tr": tr[feat_cols], "y_tr": tr["pm2_5"],
+        "X_te": te[feat_cols], "y_te": te["pm2_5"],
+        "features": list(feat_cols),
+        "model_path": model_path,
+        "rows": rows,
+        "params": dict(params or RF_PARAMS),
+        "extra": dict(extra or {}),
+    }
+
+
+def fit_task(task, n_jobs=1):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error
+
+    t0 = time.perf_counter()
+    model = RandomForestRegressor(**task["params"], n_jobs=n_jobs)
+    model.fit(task["X_tr"], task["y_tr"])
+    fit_s = time.perf_counter() - t0
+
+    mae = float("nan")
+    if len(task["X_te"]):
+        mae = float(mean_absolute_error(task["y_te"], model.predict(task["X_te"])))
+
+    # 保存前把 n_jobs 复位，推理端不继承训练时的并行度
+    model.set_params(n_jobs=None)
+    forest_io.save_model_bundle(task["model_path"], {"model": model, "features": task["features"], **task["extra"]})
+    return {
+        "station_id": task["station_id"],
+        "rows": task["rows"],
+        "feats": len(task["features"]),
+        "mae": mae,
+        "model_path": task["model_path"],
+        "fit_seconds": fit_s,
+    }
+
+
+def run(tasks, cpu_budget=None):
+    """按 plan 训练所有任务；结果顺序与 tasks 一致"""
+    workers, n_jobs = plan(len(tasks), cpu_budget)
+    if workers <= 1:
+        return [fit_task(t, n_jobs) for t in tasks]
+
+    print(f"[info] training {len(tasks)} station(s): processes={workers}, n_jobs/model={n_jobs}")
+    # run_pipeline 的 train 阶段在线程里调用：不 fork 多线程进程
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context()) as pool:
+        futures = [pool.submit(fit_task, t, n_jobs) for t in tasks]
+        return [f.result() for f in futures]
@@ -0,0 +1,83 @@
+# airquality/training_cache.py
+# 训练表快照：join / dropna / 去重 / 排序后的训练表存成本地 Parquet，上游数据没变就直接读快照。
+# 快照键 = 各上游 FG 的 (名称, 版本, 最新提交 或 最大 event_time + 行数)（FG.data_version()）+ 构建配置 salt。
+#   .cache/training/<名称>_<键前 16 位>.parquet  + 同名 .json（键的组成、行数、生成时间）
+# 02 / 04 / featureview / backtest / tune 共用；同名快照只保留最近 TRAINING_CACHE_KEEP 份。
+# TRAINING_CACHE=0 关闭（每次都重新读 FG 并 join）。
+
+import os
+import json
+import glob
+import time
+import hashlib
+
+import pandas as pd
+
+CACHE_DIR = os.getenv("TRAINING_CACHE_DIR", os.path.join(".cache", "training"))
+ENABLED = os.getenv("TRAINING_CACHE", "1") != "0"
+KEEP = int(os.getenv("TRAINING_CACHE_KEEP", "3"))
+FORMAT = 1   # 快照内容的构建方式变化时加一，旧快照自动失效
+
+
+def _versioned(v):
+    return v.get("commit") is not None or v.get("max_event_time") is not None
+
+
+def snapshot_key(name, versions, salt=None):
+    payload = json.dumps({"name": name, "format": FORMAT, "upstream": versions, "salt": salt},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _prune(cache_dir, name, keep):
+    snaps = sorted(glob.glob(os.path.join(cache_dir, f"{name}_*.parquet")), key=os.path.getmtime, reverse=True)
+    for old in snaps[max(1, keep):]:
+        for f in (old, old[:-len(".parquet")] + ".json"):
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+
+def load_or_build(name, fgs, build, salt=None, cache_dir=None):
+    """
+    fgs: 上游特征组（需有 data_version()）；build(): 快照不存在时生成训练表。
+    上游版本信息不足（既无提交也无 event_time）时不缓存，直接 build()。
+    """
+    if not ENABLED:
+        return build()
+    cache_dir = cache_dir or CACHE_DIR
+    versions = [fg.data_version() for fg in fgs]
+    if not all(_versioned(v) for v in versions):
+        print(f"[warn] {name}: upstream has no commit / event-time info, snapshot cache skipped")
+        return build()
+
+    key = snapshot_key(name, versions, salt)
+    path = os.path.join(cache_dir, f"{name}_{key[:16]}.parquet")
+    if os.path.isfile(path):
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)   # 最近使用的快照在清理时保留
+            print(f"[info] {name}: snapshot hit ({len(df)} rows) -> {path}")
+            return df
+        except Exception as e:
+            print(f"[warn] {name}: snapshot unreadable ({e}), rebuilding")
+
+    t0 = time.perf_counter()
+    df = build()
+    secs = time.perf_counter() - t0
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        with open(path[:-len(".parquet")] + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "name": name, "key": key, "format": FORMAT, "upstream": versions, "salt": salt,
+                "rows": int(len(df)), "build_seconds": round(secs, 3), "created_at": time.time(),
+            }, f, ensure_ascii=False, indent=2, default=str)
+        _prune(cache_dir, name, KEEP)
+        print(f"[info] {name}: snapshot saved ({len(df)} rows, built in {secs:.2f}s) -> {path}")
+    except Exception as e:
+        print(f"[warn] {name}: cannot write snapshot {path}: {e}")
+    return df
@@ -0,0 +1,177 @@
+# airquality/tuning.py
+# 逐站点超参搜索（随机森林）：在时间顺序的 walk-forward 折上做 successive halving。
+#   第 0 轮：从网格里随机抽 TUNE_TRIALS 组参数，只在最近 1 折上评估；
+#   每轮按验证 MAE 保留前 1/TUNE_ETA，评估折数乘以 TUNE_ETA（最多 TUNE_FOLDS 折），直到只剩 1 组或折数用满。
+#   已评估过的 (参数, 折) 不重复训练；同一轮内所有站点的所有 (参数, 折) 一起丢进进程池并行。
+# 每个 trial 记录：验证 MAE、训练耗时、预测延迟（一次 PREDICT_BATCH 行，同 03 的批量）、模型文件大小（joblib）。
+# 折与排序数组复用 airquality/backtest.py。
+
+import io
+import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import backtest, train_scheduler
+
+SEARCH_SPACE = {
+    "n_estimators": [50, 100, 200, 400],
+    "max_depth": [None, 8, 16],
+    "max_features": [1.0, 0.5, "sqrt"],
+    "min_samples_leaf": [1, 3, 5],
+}
+N_TRIALS = int(os.getenv("TUNE_TRIALS", "27"))
+ETA = int(os.getenv("TUNE_ETA", "3"))
+N_FOLDS = int(os.getenv("TUNE_FOLDS", str(backtest.N_FOLDS)))
+PREDICT_BATCH = 21   # 03 每站一次预测的行数（14 天回测 + 7 天预报）
+SEED = 42
+
+
+def sample_configs(space=None, n_trials=None, seed=SEED):
+    """网格里不放回随机抽 n_trials 组（网格更小时取全部），顺序固定可复现"""
+    space = SEARCH_SPACE if space is None else space
+    n_trials = N_TRIALS if n_trials is None else n_trials
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    rng = np.random.default_rng(seed)
+    idx = rng.permutation(len(grid))[:n_trials] if n_trials < len(grid) else np.arange(len(grid))
+    return [grid[i] for i in sorted(idx)]
+
+
+def _artifact_bytes(model, features):
+    import joblib
+    buf = io.BytesIO()
+    joblib.dump({"model": model, "features": features}, buf)
+    return buf.tell()
+
+
+def eval_fold(arrays, config, fold):
+    """一个 (站点, 参数, 折)：训练 + 验证；可在子进程里执行"""
+    from sklearn.ensemble import RandomForestRegressor
+
+    X, y = arrays["X"], arrays["y"]
+    tr_stop, te_stop = fold
+    t0 = time.perf_counter()
+    model = RandomForestRegressor(**config, random_state=SEED, n_jobs=1).fit(X[:tr_stop], y[:tr_stop])
+    fit_s = time.perf_counter() - t0
+
+    mae = float(np.mean(np.abs(model.predict(X[tr_stop:te_stop]) - y[tr_stop:te_stop])))
+    batch = X[max(0, te_stop - PREDICT_BATCH):te_stop]
+    lat = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        model.predict(batch)
+        lat.append(time.perf_counter() - t0)
+    return {
+        "mae": mae,
+        "fit_seconds": fit_s,
+        "predict_ms": float(np.median(lat)) * 1e3,
+        "artifact_bytes": _artifact_bytes(model, arrays["features"]),
+    }
+
+
+def _pareto(df, cols=("mae", "fit_seconds", "predict_ms", "artifact_bytes")):
+    """同一组内不被其他行在所有指标上同时“不差且至少一项更好”支配的行"""
+    v = df[list(cols)].to_numpy(dtype=np.float64)
+    le = (v[:, None, :] <= v[None, :, :]).all(axis=2)
+    lt = (v[:, None, :] < v[None, :, :]).any(axis=2)
+    dominated = (le & lt).any(axis=0)
+    return pd.Series(~dominated, index=df.index)
+
+
+def search(station_frames, feat_cols, configs=None, eta=None, n_folds=None, horizon_days=None, cpu_budget=None):
+    """
+    station_frames: {station_id: DataFrame}。
+    返回 trials 表：每个 (站点, 轮次, 参数) 一行，指标为该轮所用各折的平均值；kept 表示进入下一轮，
+    pareto 表示在同一 (站点, 轮次) 内按 (MAE, 训练耗时, 预测延迟, 文件大小) 不被支配。
+    """
+    configs = sample_configs() if configs is None else configs
+    eta = max(2, eta or ETA)
+    n_folds = N_FOLDS if n_folds is None else n_folds
+    workers = max(1, cpu_budget or train_scheduler.TRAIN_CPUS)
+
+    arrays = {sid: backtest.station_arrays(sid, g, feat_cols) for sid, g in station_frames.items()}
+    # 折从最近往前排：第 0 轮只用最近 1 折
+    fold_lists = {sid: backtest.folds(a["days"], n_folds, horizon_days)[::-1] for sid, a in arrays.items()}
+    state = {sid: {"alive": list(range(len(configs))), "res": 1} for sid, fl in fold_lists.items() if fl}
+    for sid in set(arrays) - set(state):
+        print(f"[skip] {sid}: not enough rows for {n_folds} fold(s)")
+
+    cache = {}   # (sid, config_id, fold_idx) -> 指标
+    rows = []
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        rung = 0
+        while state:
+            todo = [
+                (sid, c, f)
+                for sid, st in state.items()
+                for c in st["alive"]
+                for f in range(min(st["res"], len(fold_lists[sid])))
+                if (sid, c, f) not in cache
+            ]
+            print(f"[info] rung {rung}: {len(todo)} fit(s) across {len(state)} station(s), workers={workers}")
+            if pool is None:
+                for sid, c, f in todo:
+                    cache[(sid, c, f)] = eval_fold(arrays[sid], configs[c], fold_lists[sid][f])
+            else:
+                futures = {
+                    (sid, c, f): pool.submit(eval_fold, arrays[sid], configs[c], fold_lists[sid][f])
+                    for sid, c, f in todo
+                }
+                for key, fut in futures.items():
+                    cache[key] = fut.result()
+
+            for sid in list(state):
+                st = state[sid]
+                used = min(st["res"], len(fold_lists[sid]))
+                scored = []
+                for c in st["alive"]:
+                    m = pd.DataFrame([cache[(sid, c, f)] for f in range(used)]).mean()
+                    scored.append((c, m))
+                scored.sort(key=lambda t: t[1]["mae"])
+                last = len(scored) == 1 or used >= len(fold_lists[sid])
+                keep = set() if last else {c for c, _ in scored[:max(1, int(np.ceil(len(scored) / eta)))]}
+                for c, m in scored:
+                    rows.append({"station_id": sid, "rung": rung, "folds": used, "config_id": c,
+                                 **configs[c], **m.to_dict(), "kept": c in keep})
+                if last:
+                    del state[sid]
+                else:
+                    st["alive"] = [c for c, _ in scored if c in keep]
+                    st["res"] = min(len(fold_lists[sid]), st["res"] * eta)
+            rung += 1
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    trials = pd.DataFrame(rows)
+    if not trials.empty:
+        trials["pareto"] = False
+        for idx in trials.groupby(["station_id", "rung"]).groups.values():
+            trials.loc[idx, "pareto"] = _pareto(trials.loc[idx])
+    return trials
+
+
+def best_params(trials):
+    """每个站点最后一轮 MAE 最低的参数 -> {station_id: params}"""
+    out = {}
+    for sid, g in trials.groupby("station_id"):
+        top = g[g["rung"] == g["rung"].max()].sort_values("mae").iloc[0]
+        out[sid] = {k: _plain(top[k]) for k in SEARCH_SPACE}
+    return out
+
+
+def _plain(v):
+    """numpy / NaN -> 可 JSON 化的 Python 值（max_depth=None 在表里是 NaN）"""
+    if isinstance(v, float) and np.isnan(v):
+        return None
+    if isinstance(v, (np.integer,)):
+        return int(v)
+    if isinstance(v, (np.floating,)):
+        v = float(v)
+    if isinstance(v, float) and v.is_integer() and v > 1:
+        return int(v)
+    return v
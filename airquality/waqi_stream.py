@@ -0,0 +1,314 @@
+# airquality/waqi_stream.py
+# 常驻的 WAQI 近实时采集：asyncio 定时轮询各站点 feed，读数先缓存在内存，按条数 / 时间阈值微批写出。
+#   轮询：每 WAQI_POLL_SECONDS 秒一轮，所有站点并发（asyncio.to_thread 调 fetch.get_json，沿用共享连接池、WAQI 并发上限
+#         与退避重试）；同一站点同一读数时间只保留一次（WAQI 大约每小时更新一次）；
+#   微批：缓冲区达到 WAQI_FLUSH_ROWS 条，或最早一条已等待 WAQI_FLUSH_SECONDS 秒时写出；退出（Ctrl+C / SIGTERM）前再写一次；
+#   写出：WAQI_STREAM_SINK=fg（特征组 waqi_readings_hourly v1，整个进程只登录一次）| log（本地只追加 JSON Lines）| both。
+#         写特征组时不为每个微批启动离线物化作业，每 WAQI_MATERIALIZE_EVERY 批及退出时才启动；写失败的批留在缓冲区下次重试。
+#   溢出：退出前最后一次写出仍失败时，剩余读数追加到 WAQI_STREAM_SPILL（JSON Lines），下次启动时先放回缓冲区重写；
+#         溢出文件也写不了时报告丢弃条数，daily_pipeline 以非零状态退出。
+# 入口：python daily_pipeline.py --stream
+
+import os
+import json
+import time
+import signal
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from . import fetch
+
+POLL_SECONDS = float(os.getenv("WAQI_POLL_SECONDS", "900"))
+FLUSH_ROWS = int(os.getenv("WAQI_FLUSH_ROWS", "50"))
+FLUSH_SECONDS = float(os.getenv("WAQI_FLUSH_SECONDS", "3600"))
+SINK = os.getenv("WAQI_STREAM_SINK", "fg").lower()
+LOG_PATH = os.getenv("WAQI_STREAM_LOG", os.path.join(".stream", "waqi_readings.jsonl"))
+MATERIALIZE_EVERY = int(os.getenv("WAQI_MATERIALIZE_EVERY", "12"))
+SPILL_PATH = os.getenv("WAQI_STREAM_SPILL", os.path.join(".stream", "waqi_unflushed.jsonl"))
+
+READINGS_FG = ("waqi_readings_hourly", 1)
+FEED_URL = "https://api.waqi.info/feed/@{api_id}/"
+# WAQI iaqi 字段 -> 列名；站点没有的字段为 NaN，列集合固定
+IAQI = {"pm25": "pm2_5", "pm10": "pm10", "o3": "o3", "no2": "no2", "so2": "so2", "co": "co",
+        "t": "temperature", "h": "humidity", "p": "pressure", "w": "wind"}
+COLUMNS = ["station_id", "api_id", "time", "aqi", *IAQI.values(), "polled_at"]
+
+
+def parse_feed(payload, station):
+    """一次 feed 响应 -> 一行读数 dict；status 不是 ok 或没有时间时返回 None"""
+    if not isinstance(payload, dict) or payload.get("status") != "ok":
+        return None
+    data = payload.get("data") or {}
+    time_str = (data.get("time") or {}).get("s")
+    if not time_str:
+        return None
+    iaqi = data.get("iaqi") or {}
+    row = {
+        "station_id": station["station_id"],
+        "api_id": int(station["api_id"]),
+        "time": pd.Timestamp(time_str).isoformat(),   # 站点当地时间（同 get_pm25_today）
+        "aqi": _num(data.get("aqi")),
+        "polled_at": pd.Timestamp.now(tz="UTC").isoformat(),
+    }
+    for key, col in IAQI.items():
+        row[col] = _num((iaqi.get(key) or {}).get("v"))
+    return row
+
+
+def to_frame(rows):
+    """读数 dict 列表 -> 固定列、数值 float32 的 DataFrame"""
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df["time"] = pd.to_datetime(df["time"])
+    df["polled_at"] = pd.to_datetime(df["polled_at"], utc=True).dt.tz_localize(None)
+    df["api_id"] = df["api_id"].astype(np.int64)
+    for c in ["aqi", *IAQI.values()]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype(np.float32)
+    return df
+
+
+class ReadingBuffer:
+    """内存缓冲：按 (站点, 读数时间) 去重，判断是否到了写出阈值"""
+
+    def __init__(self, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows = []
+        self.first_at = None
+        self.last_time = {}   # station_id -> 最新读数时间（ISO 字符串，同一时区可直接比较）
+        self.duplicates = 0
+
+    def add(self, rows):
+        added = 0
+        for row in rows:
+            sid = row["station_id"]
+            if self.last_time.get(sid, "") >= row["time"]:
+                self.duplicates += 1
+                continue
+            self.last_time[sid] = row["time"]
+            self.rows.append(row)
+            added += 1
+        if added and self.first_at is None:
+            self.first_at = time.monotonic()
+        return added
+
+    def due(self, now=None):
+        if not self.rows:
+            return False
+        now = time.monotonic() if now is None else now
+        return len(self.rows) >= self.flush_rows or now - self.first_at >= self.flush_seconds
+
+    def drain(self):
+        rows, self.rows, self.first_at = self.rows, [], None
+        return rows
+
+    def restore(self, rows):
+        """写出失败：放回缓冲区头部，下次再写"""
+        self.rows = rows + self.rows
+        if self.rows and self.first_at is None:
+            self.first_at = time.monotonic()
+
+
+class LogSink:
+    """本地只追加日志：每个微批追加若干 JSON 行并 fsync"""
+
+    name = "log"
+
+    def __init__(self, path=LOG_PATH):
+        self.path = path
+
+    def write(self, rows, final=False):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class FeatureGroupSink:
+    """特征组：第一次写出时登录并取 FG，之后每个微批一次 insert"""
+
+    name = "fg"
+
+    def __init__(self, fs=None, materialize_every=MATERIALIZE_EVERY):
+        self._fs = fs
+        self._fg = None
+        self.materialize_every = max(1, materialize_every)
+        self.batches = 0
+
+    def _group(self):
+        if self._fg is None:
+            if self._fs is None:
+                from .feature_store import get_feature_store
+                self._fs = get_feature_store()
+            self._fg = self._fs.get_or_create_feature_group(
+                name=READINGS_FG[0],
+                version=READINGS_FG[1],
+                primary_key=["station_id"],
+                event_time="time",
+                description="Near-real-time WAQI station readings (streamed micro-batches)",
+                online_enabled=False,
+            )
+        return self._fg
+
+    def write(self, rows, final=False):
+        self.batches += 1
+        materialize = final or self.batches % self.materialize_every == 0
+        self._group().insert(to_frame(rows), write_options={
+            "wait_for_job": False,
+            "start_offline_materialization": materialize,
+        })
+
+
+def make_sinks(kind=None, fs=None, log_path=None):
+    kind = (kind or SINK).lower()
+    sinks = []
+    if kind in ("fg", "both"):
+        sinks.append(FeatureGroupSink(fs))
+    if kind in ("log", "both"):
+        sinks.append(LogSink(log_path or LOG_PATH))
+    if not sinks:
+        raise ValueError(f"unknown WAQI_STREAM_SINK: {kind} (fg | log | both)")
+    return sinks
+
+
+def flush(buffer, sinks, final=False):
+    """写出缓冲区；任一 sink 失败时整批放回（sink 需按 (站点, 时间) 幂等：FG upsert，日志读取时去重）"""
+    rows = buffer.drain()
+    if not rows:
+        return 0
+    t0 = time.perf_counter()
+    try:
+        for sink in sinks:
+            sink.write(rows, final=final)
+    except Exception as e:
+        buffer.restore(rows)
+        print(f"[warn] flush of {len(rows)} reading(s) failed ({type(e).__name__}: {e}); kept in buffer")
+        return 0
+    print(f"[ok] flushed {len(rows)} reading(s) -> {'+'.join(s.name for s in sinks)} "
+          f"({(time.perf_counter() - t0) * 1e3:.0f}ms)")
+    return len(rows)
+
+
+def spill(buffer, path=None):
+    """最后一次写出失败：缓冲区剩余读数追加到本地溢出文件；返回 (溢出条数, 丢弃条数)"""
+    rows = buffer.drain()
+    if not rows:
+        return 0, 0
+    path = path or SPILL_PATH
+    try:
+        LogSink(path).write(rows)
+    except Exception as e:
+        print(f"[error] cannot spill {len(rows)} unflushed reading(s) to {path} ({type(e).__name__}: {e}); "
+              f"{len(rows)} reading(s) dropped")
+        return 0, len(rows)
+    print(f"[warn] {len(rows)} unflushed reading(s) spilled -> {path} (re-sent on next start)")
+    return len(rows), 0
+
+
+def load_spill(path=None):
+    """读出上次溢出的读数并删除溢出文件（本次退出时仍写不出去会重新溢出）"""
+    path = path or SPILL_PATH
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    os.remove(path)
+    return rows
+
+
+def _fetch_feed(station, token, session):
+    # ttl=0：每轮都取最新读数（响应照样写入 http_cache，HTTP_CACHE_OFFLINE=1 时可离线回放）
+    return fetch.get_json(FEED_URL.format(api_id=station["api_id"]), {"token": token}, session=session,
+                          timeout=30, accept=lambda j: j.get("status") == "ok", label=station["station_id"], ttl=0)
+
+
+async def poll_once(stations, token, session=None):
+    """所有站点并发取一次；返回 (读数列表, 失败列表)"""
+    session = session or fetch.get_session()
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_fetch_feed, st, token, session) for st in stations), return_exceptions=True
+    )
+    rows, failures = [], []
+    for st, res in zip(stations, results):
+        row = None if isinstance(res, BaseException) else parse_feed(res, st)
+        if row is None:
+            failures.append((st["station_id"], res if isinstance(res, BaseException) else "no reading"))
+        else:
+            rows.append(row)
+    return rows, failures
+
+
+async def run(stations, token, sinks=None, poll_seconds=None, max_polls=None, buffer=None, stop=None):
+    """
+    常驻轮询直到 stop 被置位 / 收到 SIGINT、SIGTERM / 达到 max_polls 轮；退出前写出缓冲区。
+    返回统计 dict。
+    """
+    sinks = sinks if sinks is not None else make_sinks()
+    poll_seconds = POLL_SECONDS if poll_seconds is None else poll_seconds
+    buffer = buffer or ReadingBuffer()
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass   # Windows / 非主线程：Ctrl+C 以 KeyboardInterrupt 结束，finally 里照样写出
+
+    stats = {"polls": 0, "readings": 0, "failures": 0, "flushed": 0, "spilled": 0, "dropped": 0}
+    pending = load_spill()
+    if pending:
+        stats["readings"] += buffer.add(pending)
+        print(f"[info] {len(pending)} reading(s) from the last spill put back in the buffer")
+    session = fetch.get_session()
+    start = time.monotonic()
+    try:
+        while not stop.is_set():
+            rows, failures = await poll_once(stations, token, session)
+            stats["polls"] += 1
+            stats["readings"] += buffer.add(rows)
+            stats["failures"] += len(failures)
+            for sid, err in failures:
+                print(f"[warn] {sid}: {err}")
+            print(f"[info] poll {stats['polls']}: {len(rows)} reading(s), buffered={len(buffer.rows)}, "
+                  f"duplicates={buffer.duplicates}")
+            if buffer.due():
+                stats["flushed"] += await asyncio.to_thread(flush, buffer, sinks)
+            if max_polls is not None and stats["polls"] >= max_polls:
+                break
+            # 对齐到固定节拍；某轮超时则跳过错过的节拍
+            elapsed = time.monotonic() - start
+            wait = poll_seconds - elapsed % poll_seconds if poll_seconds > 0 else 0
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        stats["flushed"] += flush(buffer, sinks, final=True)
+        spilled, dropped = spill(buffer)
+        stats["spilled"] += spilled
+        stats["dropped"] += dropped
+    return stats
+
+
+def read_log(path=None):
+    """读本地日志 -> DataFrame（按 (站点, 读数时间) 去重，保留最后一次）"""
+    path = path or LOG_PATH
+    if not os.path.isfile(path):
+        return to_frame([])
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    df = to_frame(rows)
+    return (df.drop_duplicates(["station_id", "time"], keep="last")
+              .sort_values(["station_id", "time"]).reset_index(drop=True))
+
+
+def _num(v):
+    """WAQI 的数值字段（可能是 "-" 或缺失）-> float / None，保证可写成合法 JSON"""
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(v) else v
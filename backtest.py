@@ -0,0 +1,56 @@
+# backtest.py
+# 逐站点 walk-forward 回测（见 airquality/backtest.py）：代替 02 / 04 的单次 80/20 切分，看模型随时间的表现
+#   python backtest.py                      # 02 白名单内的全部站点，BACKTEST_REFIT（默认 warm）
+#   python backtest.py hk-tuen-mun          # 只回测指定站点
+#   python backtest.py --refit=both         # warm 与 full 各跑一遍，对比耗时与误差
+# 训练表与特征同 02（load_training_frame / feature_columns）；逐折指标写到 outputs/backtest_folds.csv，
+# 逐站点汇总写到 outputs/backtest_summary.csv
+
+import os
+import sys
+import importlib
+
+import pandas as pd
+
+from airquality import backtest
+
+OUT_DIR = "outputs"
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    refit = next((a.split("=", 1)[1] for a in argv if a.startswith("--refit=")), backtest.REFIT).lower()
+    station_ids = [a for a in argv if not a.startswith("--")]
+    modes = ["warm", "full"] if refit == "both" else [refit]
+    if any(m not in ("warm", "full") for m in modes):
+        raise SystemExit(f"[error] unknown refit mode: {refit} (warm | full | both)")
+
+    p02 = importlib.import_module("02_train_and_feature_view_multi")
+    df = p02.load_training_frame()
+    if station_ids:
+        df = df[df["station_id"].isin(station_ids)]
+    feat_cols = p02.feature_columns(df)
+    frames = {sid: g for sid, g in df.groupby("station_id")}
+    if not frames:
+        raise SystemExit("[warn] 没有可回测的站点。")
+
+    fold_df = pd.concat([backtest.run(frames, feat_cols, refit=m) for m in modes], ignore_index=True)
+    summary = backtest.summarize(fold_df)
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    fold_path = os.path.join(OUT_DIR, "backtest_folds.csv")
+    summary_path = os.path.join(OUT_DIR, "backtest_summary.csv")
+    fold_df.to_csv(fold_path, index=False)
+    summary.to_csv(summary_path, index=False)
+
+    print(f"\n=== Walk-forward backtest ({backtest.N_FOLDS} folds x {backtest.HORIZON_DAYS} days) ===")
+    print(fold_df[["refit", "station_id", "fold", "test_start", "test_end", "n_train", "n_trees",
+                   "fit_seconds", "mae", "rmse", "bias"]]
+          .to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    print("\n" + summary.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    print(f"[ok] folds saved -> {fold_path}")
+    print(f"[ok] summary saved -> {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
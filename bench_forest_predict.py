@@ -0,0 +1,86 @@
+# bench_forest_predict.py
+# FlatForest（向量化扁平数组推理）与 sklearn RandomForestRegressor.predict 的一致性检查 + 延迟对比
+#   python bench_forest_predict.py                               # 合成数据训练 400 棵树
+#   python bench_forest_predict.py models/hk-tuen-mun_rf.joblib  # 用现有模型
+# 一致性：预测必须与 sklearn 逐位相同（含 NaN 输入），否则以非零状态退出。
+
+import os
+import sys
+import time
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from airquality import forest_io
+
+BATCH_SIZES = [1, 21, 500]   # 21 = 03 每站一次预测（14 天回测 + 7 天预报）
+REPEATS = 30
+
+
+def synthetic_model(n_rows=4000, n_feats=16, seed=0):
+    rng = np.random.default_rng(seed)
+    cols = [f"f{j}" for j in range(n_feats)]
+    X = pd.DataFrame(rng.normal(size=(n_rows, n_feats)), columns=cols)
+    y = 30 + 8 * X["f0"] - 5 * X["f1"] ** 2 + rng.normal(scale=4, size=n_rows)
+    model = RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=-1).fit(X, y)
+    model.set_params(n_jobs=None)
+    return model, cols
+
+
+def _timeit(fn, repeats=REPEATS):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t0) / repeats
+
+
+def check_parity(model, flat, cols, seed=1):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(scale=2, size=(2000, len(cols))), columns=cols)
+    X.iloc[::17, 0] = np.nan   # 缺失值路径（sklearn >= 1.3 支持）
+    try:
+        expected = model.predict(X)
+    except ValueError:          # 旧版 sklearn 不接受 NaN
+        X = X.fillna(0.0)
+        expected = model.predict(X)
+    got = flat.predict(X)
+    return bool(np.array_equal(expected, got)), float(np.max(np.abs(expected - got)))
+
+
+def main():
+    if len(sys.argv) > 1:
+        bundle = joblib.load(sys.argv[1])
+        model, cols = bundle["model"], list(bundle["features"])
+    else:
+        model, cols = synthetic_model()
+
+    compiled = forest_io.compile_forest(model, cols)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_forest_"), "model.aqf")
+    forest_io.save_forest(path, model, cols)
+    mapped = forest_io.load_forest(path)
+
+    ok_c, diff_c = check_parity(model, compiled, cols)
+    ok_m, diff_m = check_parity(model, mapped, cols)
+    print(f"[parity] compiled: exact={ok_c} max|diff|={diff_c:.3g}; mmap: exact={ok_m} max|diff|={diff_m:.3g}")
+
+    rng = np.random.default_rng(2)
+    rows = []
+    for n in BATCH_SIZES:
+        X = pd.DataFrame(rng.normal(size=(n, len(cols))), columns=cols)
+        t_sk = _timeit(lambda: model.predict(X))
+        t_flat = _timeit(lambda: mapped.predict(X))
+        rows.append([n, t_sk * 1e3, t_flat * 1e3, t_sk / t_flat])
+    rep = pd.DataFrame(rows, columns=["batch_rows", "sklearn_ms", "flat_ms", "speedup"])
+    print(f"\n=== predict latency ({model.n_estimators} trees) ===")
+    print(rep.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    if not (ok_c and ok_m):
+        raise SystemExit("[error] FlatForest predictions differ from sklearn")
+
+
+if __name__ == "__main__":
+    main()
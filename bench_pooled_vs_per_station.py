@@ -0,0 +1,129 @@
+# bench_pooled_vs_per_station.py
+# 对比「每站一个森林」与「跨站点混合模型」：训练耗时、模型文件大小、推理延迟、验证集 MAE
+#   python bench_pooled_vs_per_station.py             # 从特征库读训练表（同 02）
+#   python bench_pooled_vs_per_station.py --synthetic # 合成数据，无需特征库
+# 结果写到 outputs/bench_pooled_vs_per_station.csv
+
+import os
+import sys
+import time
+import shutil
+import importlib
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+
+from airquality import pooled_model, train_scheduler
+
+OUT_DIR = "outputs"
+BATCH_ROWS = 21   # 03 每站一次预测的行数（14 天回测 + 7 天预报）
+REPEATS = 20
+
+
+def synthetic_frame(n_stations=5, n_days=1500, n_feats=16, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2021-01-01", periods=n_days, freq="D")
+    frames = []
+    for i in range(n_stations):
+        X = rng.normal(size=(n_days, n_feats))
+        y = 30 + 8 * X[:, 0] - 5 * X[:, 1] + 3 * i + rng.normal(scale=4, size=n_days)
+        f = pd.DataFrame(X, columns=[f"f{j}" for j in range(n_feats)])
+        f["pm2_5"] = y
+        f["city"] = "HongKong"
+        f["station_id"] = f"st-{i:03d}"
+        f["date"] = dates
+        frames.append(f)
+    return pd.concat(frames, ignore_index=True)
+
+
+def feature_columns(df):
+    drop = {"pm2_5", "city", "station_id", "date"}
+    return [c for c in df.select_dtypes(include=[np.number]).columns if c not in drop]
+
+
+def _file_size(obj, tmpdir, name):
+    path = os.path.join(tmpdir, name)
+    joblib.dump(obj, path)
+    return path, os.path.getsize(path)
+
+
+def _latency(fn, repeats=REPEATS):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t0) / repeats
+
+
+def bench(df, n_jobs=None):
+    n_jobs = n_jobs or train_scheduler.TRAIN_CPUS
+    feat_cols = feature_columns(df)
+    params = pooled_model.RF_PARAMS
+    tmpdir = tempfile.mkdtemp(prefix="bench_pooled_")
+    rows = []
+
+    # ---- 每站一个森林 ----
+    fit_s, size, maes, paths, batches = 0.0, 0, {}, {}, {}
+    for sid, g in df.groupby("station_id"):
+        g = g.sort_values("date")
+        split = int(len(g) * 0.8)
+        tr, te = g.iloc[:split], g.iloc[split:]
+        t0 = time.perf_counter()
+        m = RandomForestRegressor(**params, n_jobs=n_jobs).fit(tr[feat_cols], tr["pm2_5"])
+        fit_s += time.perf_counter() - t0
+        m.set_params(n_jobs=None)
+        maes[sid] = float(mean_absolute_error(te["pm2_5"], m.predict(te[feat_cols])))
+        paths[sid], sz = _file_size({"model": m, "features": feat_cols}, tmpdir, f"{sid}_rf.joblib")
+        size += sz
+        batches[sid] = te[feat_cols].tail(BATCH_ROWS)
+
+    loaded = {sid: joblib.load(p) for sid, p in paths.items()}
+    warm = np.mean([_latency(lambda s=sid: loaded[s]["model"].predict(batches[s])) for sid in paths])
+    t0 = time.perf_counter()
+    for sid, p in paths.items():
+        joblib.load(p)["model"].predict(batches[sid])
+    cold_all = time.perf_counter() - t0
+    rows.append(["per_station", len(paths), fit_s, size, cold_all, warm, float(np.mean(list(maes.values())))])
+
+    # ---- 混合模型 ----
+    bundle, pfit_s, pmaes = pooled_model.train_pooled(df, feat_cols, params=params, n_jobs=n_jobs)
+    ppath, psize = _file_size(bundle, tmpdir, "pooled_rf.joblib")
+    warm_p = np.mean([_latency(lambda s=sid: pooled_model.predict_pooled(bundle, s, batches[s])) for sid in paths])
+    t0 = time.perf_counter()
+    b = joblib.load(ppath)
+    for sid in paths:
+        pooled_model.predict_pooled(b, sid, batches[sid])
+    cold_all_p = time.perf_counter() - t0
+    rows.append(["pooled", 1, pfit_s, psize, cold_all_p, warm_p, float(np.mean(list(pmaes.values())))])
+
+    rep = pd.DataFrame(rows, columns=[
+        "mode", "artifacts", "fit_seconds", "artifact_bytes",
+        "cold_load_predict_all_s", "warm_predict_per_station_s", "mean_station_MAE",
+    ])
+    per_station = pd.DataFrame({"per_station_MAE": maes, "pooled_MAE": pmaes})
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return rep, per_station
+
+
+def main():
+    if "--synthetic" in sys.argv:
+        df = synthetic_frame()
+    else:
+        df = importlib.import_module("02_train_and_feature_view_multi").load_training_frame()
+
+    rep, per_station = bench(df)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    path = os.path.join(OUT_DIR, "bench_pooled_vs_per_station.csv")
+    rep.to_csv(path, index=False)
+    print("\n=== Pooled vs per-station ===")
+    print(rep.to_string(index=False))
+    print("\n" + per_station.to_string())
+    print(f"[ok] report saved -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# bench_spatial_features.py
+# 邻近站点 IDW 特征（airquality/spatial.py）的规模测试与正确性：
+#   合成 BENCH_SPATIAL_STATIONS（逗号分隔，逐个规模测一遍）个站点 × BENCH_SPATIAL_YEARS 年，随机缺 BENCH_SPATIAL_GAP 比例的行；
+#   spatial：邻居索引只建一次 + (站点, 天) 网格上的向量化 IDW；
+#   逐日参考：每天对当天有数据的站点两两算 haversine 距离、取 k 近邻再加权（O(n²) / 天，只在前 BENCH_SPATIAL_CHECK_DAYS 天上跑并外推总耗时）。
+# 与参考实现逐列比对（不一致时以非零状态退出）；结果写到 outputs/bench_spatial_features.csv
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from airquality import spatial
+
+OUT_DIR = "outputs"
+SIZES = [int(x) for x in os.getenv("BENCH_SPATIAL_STATIONS", "50,200,800").split(",") if x.strip()]
+N_YEARS = int(os.getenv("BENCH_SPATIAL_YEARS", "3"))
+GAP = float(os.getenv("BENCH_SPATIAL_GAP", "0.05"))
+CHECK_DAYS = int(os.getenv("BENCH_SPATIAL_CHECK_DAYS", "20"))
+WEATHER = ["temperature_2m_mean", "wind_speed_10m_mean"]
+LAGS = [1, 2, 3]
+
+
+def synthetic(n_stations, n_years=N_YEARS, gap=GAP, seed=0):
+    """珠三角大小范围内随机撒点；天气与 PM2.5 随空间平滑变化"""
+    rng = np.random.default_rng(seed)
+    lat = 22.2 + rng.random(n_stations) * 0.8
+    lon = 113.6 + rng.random(n_stations) * 1.0
+    stations_list = [{"station_id": f"st-{i:04d}", "lat": float(lat[i]), "lon": float(lon[i])} for i in range(n_stations)]
+    dates = pd.date_range("2020-01-01", periods=365 * n_years, freq="D")
+    sid = np.repeat([s["station_id"] for s in stations_list], len(dates))
+    day = np.tile(np.arange(len(dates)), n_stations)
+    i = np.repeat(np.arange(n_stations), len(dates))
+    season = np.sin(2 * np.pi * day / 365)
+    df = pd.DataFrame({
+        "station_id": sid,
+        "date": dates[day],
+        "temperature_2m_mean": 24 + 6 * season + lat[i] + rng.normal(scale=1, size=len(day)),
+        "wind_speed_10m_mean": 10 + 3 * np.cos(lon[i]) + rng.gamma(2, 1.5, size=len(day)),
+        "pm2_5": 30 + 10 * season + 5 * (lon[i] - 113.6) + rng.normal(scale=6, size=len(day)),
+    })
+    df = df[rng.random(len(df)) >= gap].reset_index(drop=True)
+    return stations_list, df
+
+
+def reference(stations_list, df, days, k, max_km, power):
+    """逐日：当天所有站点两两距离 -> k 近邻 -> IDW（缺值的邻居不参与，权重重新归一化）"""
+    coords = {s["station_id"]: (s["lat"], s["lon"]) for s in stations_list}
+    all_ids = [s["station_id"] for s in stations_list]
+    lat = np.array([coords[s][0] for s in all_ids])
+    lon = np.array([coords[s][1] for s in all_ids])
+    by_date = {d: g.set_index("station_id") for d, g in df.groupby("date")}
+    rows = []
+    for d in days:
+        today = by_date.get(d)
+        if today is None:
+            continue
+        dist = spatial.haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+        np.fill_diagonal(dist, np.inf)
+        prev = {kk: by_date.get(d - pd.Timedelta(days=kk)) for kk in LAGS}
+        for a, sid in enumerate(all_ids):
+            if sid not in today.index:
+                continue
+            nb = [j for j in np.argsort(dist[a], kind="stable")[:k] if dist[a, j] <= max_km]
+            w = {j: 1.0 / max(dist[a, j], 1e-3) ** power for j in nb}
+            rec = {"station_id": sid, "date": d}
+
+            def agg(frame, col):
+                if frame is None:
+                    return np.nan
+                pairs = [(w[j], frame.at[all_ids[j], col]) for j in nb if all_ids[j] in frame.index]
+                pairs = [(ww, v) for ww, v in pairs if not np.isnan(v)]
+                tot = sum(ww for ww, _ in pairs)
+                return sum(ww * v for ww, v in pairs) / tot if tot > 0 else np.nan
+
+            for c in WEATHER:
+                rec[f"nbr_{c}"] = agg(today, c)
+            for kk in LAGS:
+                rec[f"nbr_pm2_5_lag{kk}"] = agg(prev[kk], "pm2_5")
+            rows.append(rec)
+    return pd.DataFrame(rows)
+
+
+def main():
+    names = spatial.feature_names(WEATHER, LAGS)
+    results, mismatched = [], []
+    for n in SIZES:
+        stations_list, df = synthetic(n)
+        t0 = time.perf_counter()
+        index = spatial.build_index(stations_list)
+        t_index = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fast = spatial.add_features(df, index, WEATHER, labels=df, lags=LAGS)
+        t_fast = time.perf_counter() - t0
+
+        all_days = np.sort(df["date"].unique())
+        check = all_days[max(LAGS):max(LAGS) + CHECK_DAYS]
+        t0 = time.perf_counter()
+        ref = reference(stations_list, df, [pd.Timestamp(d) for d in check], spatial.K, spatial.MAX_KM, spatial.POWER)
+        t_ref = (time.perf_counter() - t0) * len(all_days) / max(1, len(check))
+
+        got = fast.merge(ref[["station_id", "date"]], on=["station_id", "date"]).sort_values(["station_id", "date"])
+        ref = ref.sort_values(["station_id", "date"])
+        bad = [c for c in names if not np.allclose(got[c].to_numpy(), ref[c].to_numpy(), rtol=1e-9, equal_nan=True)]
+        mismatched += [f"{n}:{c}" for c in bad]
+        results.append({
+            "stations": n, "rows": len(df), "features": len(names),
+            "index_seconds": t_index, "features_seconds": t_fast,
+            "rows_per_s": len(df) / t_fast,
+            "per_day_reference_seconds_est": t_ref,
+            "speedup": t_ref / (t_index + t_fast),
+            "checked_rows": len(ref),
+        })
+        print(f"[info] {n} stations: index {t_index * 1e3:.1f}ms, features {t_fast:.2f}s, "
+              f"per-day reference ~{t_ref:.1f}s (estimated from {len(check)} days)")
+
+    rep = pd.DataFrame(results)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    path = os.path.join(OUT_DIR, "bench_spatial_features.csv")
+    rep.to_csv(path, index=False)
+    print("\n=== Spatial neighbor features ===")
+    print(rep.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    print(f"[ok] report saved -> {path}")
+    if mismatched:
+        print(f"[fail] differs from per-day reference: {mismatched}")
+        raise SystemExit(1)
+    print(f"[ok] all {len(names)} features match the per-day reference")
+
+
+if __name__ == "__main__":
+    main()
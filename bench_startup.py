@@ -0,0 +1,125 @@
+# bench_startup.py
+# 各入口脚本的冷启动开销：用 `python -X importtime` 在子进程里 import 入口模块（不执行 main），
+# 统计 import 总耗时 / 进程总耗时，列出最重的顶层依赖，并与预算比较。
+#   python bench_startup.py                    # 全部入口
+#   python bench_startup.py 03_predict_and_plot build_dashboard
+# 超出预算、或启动阶段加载了不该加载的重依赖（hopsworks / sklearn / matplotlib …）时以非零状态退出。
+# STARTUP_BUDGET_SCALE 可整体放宽预算（例如较慢的 CI 机器上设为 2）；结果写到 outputs/bench_startup.csv
+
+import os
+import sys
+import time
+import subprocess
+
+import pandas as pd
+
+OUT_DIR = "outputs"
+REPEATS = int(os.getenv("STARTUP_REPEATS", "3"))
+BUDGET_SCALE = float(os.getenv("STARTUP_BUDGET_SCALE", "1"))
+TOP_N = 5
+
+# 入口模块 -> import 阶段预算（毫秒，取多次运行的最小值）。
+# 下限基本就是 pandas 本身（约 450–550ms）；懒加载前 02 / 03 因为 sklearn、matplotlib 需要 1.9s / 2.7s。
+BUDGETS_MS = {
+    "01_write_feature_groups": 1000,   # requests 在 01 里总会用到，不做懒加载
+    "02_train_and_feature_view_multi": 900,
+    "03_predict_and_plot": 900,
+    "04_lag_vs_baseline": 900,
+    "05_hourly_forecast": 900,
+    "featureview": 900,
+    "daily_pipeline": 800,
+    "build_dashboard": 750,
+    "model_server": 900,
+    "run_pipeline": 900,
+    "backtest": 900,
+    "tune": 900,
+    "ingest_station_history": 900,
+}
+
+# 启动阶段不应出现的模块：只在真正训练 / 画图 / 登录时才加载
+HEAVY = ["hopsworks", "hsfs", "sklearn", "scipy", "matplotlib", "joblib"]
+
+
+def parse_importtime(stderr):
+    """-X importtime 的输出 -> [(模块, self_us, cumulative_us, 层级)]，顺序同输出（子模块在父模块之前）"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cum_us), depth))
+    return rows
+
+
+def measure(module):
+    # 用 __import__ 而不是 importlib.import_module：后者走纯 Python 路径，-X importtime 不记录
+    code = f"__import__({module!r})"
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        err = proc.stderr.strip().splitlines()
+        raise RuntimeError(err[-1] if err else f"exit code {proc.returncode}")
+    return wall, parse_importtime(proc.stderr)
+
+
+def bench(module):
+    runs = [measure(module) for _ in range(max(1, REPEATS))]
+    wall, rows = min(runs, key=lambda r: r[0])
+    pos = max(i for i, r in enumerate(rows) if r[0] == module and r[3] == 0)
+    # 入口模块之前、上一个顶层模块之后的第 1 层即它的直接依赖
+    first = max((i for i in range(pos) if rows[i][3] == 0), default=-1) + 1
+    deps = [r for r in rows[first:pos] if r[3] == 1]
+    loaded = {r[0].split(".")[0] for r in rows}
+    return {
+        "entry": module,
+        "import_ms": rows[pos][2] / 1e3,
+        "wall_ms": wall * 1e3,
+        "budget_ms": BUDGETS_MS.get(module, float("nan")) * BUDGET_SCALE,
+        "heavy_loaded": ",".join(h for h in HEAVY if h in loaded),
+        "heaviest": ", ".join(f"{r[0]}={r[2] / 1e3:.0f}ms" for r in sorted(deps, key=lambda r: -r[2])[:TOP_N]),
+    }
+
+
+def main(modules=None):
+    modules = list(modules or BUDGETS_MS)
+    rows, failed = [], []
+    for m in modules:
+        try:
+            rows.append(bench(m))
+        except Exception as e:
+            failed.append((m, e))
+            print(f"[fail] {m}: {e}")
+
+    if rows:
+        rep = pd.DataFrame(rows)
+        rep["over_budget"] = rep["import_ms"] > rep["budget_ms"]
+        os.makedirs(OUT_DIR, exist_ok=True)
+        path = os.path.join(OUT_DIR, "bench_startup.csv")
+        rep.to_csv(path, index=False)
+        print("\n=== Startup (python -X importtime, best of %d) ===" % max(1, REPEATS))
+        print(rep[["entry", "import_ms", "wall_ms", "budget_ms", "over_budget", "heavy_loaded"]]
+              .to_string(index=False, float_format=lambda v: f"{v:.0f}"))
+        print("\nheaviest imports:")
+        for r in rows:
+            print(f"  {r['entry']}: {r['heaviest']}")
+        print(f"[ok] report saved -> {path}")
+
+        over = rep[rep["over_budget"] | (rep["heavy_loaded"] != "")]
+        for _, r in over.iterrows():
+            print(f"[warn] {r['entry']}: import {r['import_ms']:.0f}ms (budget {r['budget_ms']:.0f}ms)"
+                  + (f", heavy modules at startup: {r['heavy_loaded']}" if r["heavy_loaded"] else ""))
+        if len(over):
+            failed.append(("budget", None))
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or None)
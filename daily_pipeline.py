@@ -1,8 +1,15 @@
+# daily_pipeline.py
+#   python daily_pipeline.py                  # 每天一次（cron）：当天 WAQI PM2.5 快照 + 天气预报写入 v1 特征组
+#   python daily_pipeline.py --stream         # 常驻：定时轮询 WAQI，微批写出逐小时读数（见 airquality/waqi_stream.py）
+#   python daily_pipeline.py --stream --polls=3 --sink=log   # 只轮询 3 轮；sink 覆盖 WAQI_STREAM_SINK
 import os
-import requests
+import sys
 import pandas as pd
 import datetime
-import hopsworks
+from concurrent.futures import ThreadPoolExecutor
+
+from airquality import fetch, openmeteo
+from airquality.feature_store import get_feature_store
 
 # --------------------------
 # 
@@ -18,18 +25,22 @@ STATIONS = [
 # --------------------------
 #  AQICN Token
 # --------------------------
-AQICN_TOKEN = os.environ["AQICN_API_KEY"]  # GitHub Secrets 或 Hopsworks Secrets 导入
-HOPSWORKS_API_KEY = os.environ["HOPSWORKS_API_KEY"]
+AQICN_TOKEN = os.getenv("AQICN_API_KEY", "")  # GitHub Secrets 或 Hopsworks Secrets 导入（离线回放可不设）
 
 FORECAST_DAYS = 7  # 未来 7 天天气预报
 
+# 站点 × 接口并发抓取的线程数；各接口另有并发上限（airquality/fetch.py）。FETCH_WORKERS=1 即串行
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+
 
 # --------------------------
 #  PM2.5（
 # --------------------------
-def get_pm25_today(api_id):
-    url = f"https://api.waqi.info/feed/@{api_id}/?token={AQICN_TOKEN}"
-    r = requests.get(url, timeout=30).json()
+def get_pm25_today(api_id, session=None, label=""):
+    url = f"https://api.waqi.info/feed/@{api_id}/"
+    # token 放在 params 中：不进入缓存 key
+    r = fetch.get_json(url, {"token": AQICN_TOKEN}, session=session, timeout=30,
+                       accept=lambda j: j.get("status") == "ok", label=label)
 
     if r["status"] != "ok":
         raise RuntimeError(f"API error: {r}")
@@ -51,21 +62,36 @@ def get_pm25_today(api_id):
 # --------------------------
 # weather
 # --------------------------
-def get_weather(lat, lon):
+WEATHER_URL = "https://api.open-meteo.com/v1/forecast"
+
+
+def _weather_params():
+    """除经纬度外的天气请求参数（所有站点相同，可合并成一个多坐标请求）"""
     today = datetime.date.today()
     yesterday = today - datetime.timedelta(days=1)
-
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
+    return {
         "timezone": "Asia/Hong_Kong",
         "start_date": yesterday,
         "end_date": today + datetime.timedelta(days=FORECAST_DAYS),
         "daily": "temperature_2m_mean,precipitation_sum,wind_speed_10m_max,wind_direction_10m_dominant",
     }
 
-    r = requests.get(url, params=params).json()
+
+def get_weather(lat, lon, session=None, label=""):
+    params = {"latitude": lat, "longitude": lon, **_weather_params()}
+    r = fetch.get_json(WEATHER_URL, params, session=session, timeout=60, accept=lambda j: "daily" in j, label=label)
+    return _weather_frame(r)
+
+
+def get_weather_many(stations, session=None):
+    """所有站点一个多坐标请求（URL 过长时自动分批），返回 {station_id: df}"""
+    coords = [(st["lat"], st["lon"]) for st in stations]
+    payloads = openmeteo.get_many(WEATHER_URL, _weather_params(), coords, session=session, timeout=60,
+                                  accept=lambda j: "daily" in j, label="batched")
+    return {st["station_id"]: _weather_frame(p) for st, p in zip(stations, payloads)}
+
+
+def _weather_frame(r):
     daily = r["daily"]
 
     df = pd.DataFrame({
@@ -80,31 +106,96 @@ def get_weather(lat, lon):
 
 
 # --------------------------
-# main
+# 并发抓取
 # --------------------------
-def main():
-    print("  Logging in to Hopsworks ...")
-    project = hopsworks.login(api_key_value=HOPSWORKS_API_KEY)
-    fs = project.get_feature_store()
+def fetch_all(stations, max_workers=None):
+    """
+    所有站点的 PM2.5 + 天气同时发出（共享 keep-alive 连接池）。
+    天气默认合并成一个多坐标请求（OPENMETEO_BATCH=0 关闭）；批量请求失败时回退到逐站点请求。
+    单个调用失败（重试用尽）只丢掉该站点的这一部分，不影响其他站点。
+    返回 (pm_rows, weather_rows, failures)。
+    """
+    session = fetch.get_session()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers or FETCH_WORKERS)) as pool:
+        futures = {}
+        # ============= 2. 天气（昨日 + 明天 + 未来7天） =============
+        batch = pool.submit(get_weather_many, stations, session) if openmeteo.BATCH else None
+        for st in stations:
+            sid = st["station_id"]
+            print(f"Fetching: {sid}")
+            # ============= 1. 今日 PM2.5 =============
+            futures[(sid, "pm25")] = pool.submit(get_pm25_today, st["api_id"], session, sid)
+            if batch is None:
+                futures[(sid, "weather")] = pool.submit(get_weather, st["lat"], st["lon"], session, sid)
+
+        pm_rows, weather_rows, failures = [], [], []
+        if batch is not None:
+            try:
+                for sid, df in batch.result().items():
+                    df["station_id"] = sid
+                    weather_rows.append(df)
+            except Exception as e:
+                print(f"[warn] batched weather request failed ({type(e).__name__}: {e}); falling back to per-station calls")
+                for st in stations:
+                    futures[(st["station_id"], "weather")] = pool.submit(
+                        get_weather, st["lat"], st["lon"], session, st["station_id"])
+
+        for (sid, kind), fut in futures.items():
+            try:
+                df = fut.result()
+            except Exception as e:
+                failures.append((sid, kind, f"{type(e).__name__}: {e}"))
+                print(f"[warn] {sid} {kind} failed: {type(e).__name__}: {e}")
+                continue
+            df["station_id"] = sid
+            (pm_rows if kind == "pm25" else weather_rows).append(df)
+    return pm_rows, weather_rows, failures
 
-    weather_rows = []
-    pm_rows = []
 
-    for st in STATIONS:
-        print(f"Fetching: {st['station_id']}")
+# --------------------------
+# 流式采集
+# --------------------------
+def stream(argv):
+    """常驻轮询 WAQI；整个进程只登录一次（写特征组时），Ctrl+C / SIGTERM 时写出剩余读数后退出"""
+    import asyncio
+    from airquality import waqi_stream
+
+    opts = dict(a[2:].split("=", 1) for a in argv if a.startswith("--") and "=" in a)
+    max_polls = int(opts["polls"]) if "polls" in opts else None
+    sinks = waqi_stream.make_sinks(opts.get("sink"))
+    print(f"[info] streaming {len(STATIONS)} station(s): every {waqi_stream.POLL_SECONDS:g}s, "
+          f"flush at {waqi_stream.FLUSH_ROWS} rows / {waqi_stream.FLUSH_SECONDS:g}s -> "
+          f"{'+'.join(s.name for s in sinks)}")
+    try:
+        stats = asyncio.run(waqi_stream.run(STATIONS, AQICN_TOKEN, sinks=sinks, max_polls=max_polls))
+    except KeyboardInterrupt:
+        print("[info] interrupted")
+        return
+    print(f"[ok] polls={stats['polls']}, readings={stats['readings']}, flushed={stats['flushed']}, "
+          f"spilled={stats['spilled']}, failed calls={stats['failures']}")
+    if stats["dropped"]:
+        raise SystemExit(f"[error] {stats['dropped']} reading(s) could not be flushed or spilled and were dropped.")
 
-        # ============= 1. 今日 PM2.5 =============
-        pm_df = get_pm25_today(st["api_id"])
-        pm_df["station_id"] = st["station_id"]
-        pm_rows.append(pm_df)
 
-        # ============= 2. 天气（昨日 + 明天 + 未来7天） =============
-        wx_df = get_weather(st["lat"], st["lon"])
-        wx_df["station_id"] = st["station_id"]
-        weather_rows.append(wx_df)
+# --------------------------
+# main
+# --------------------------
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if "--stream" in argv:
+        return stream(argv)
+
+    print("  Logging in to feature store ...")
+    fs = get_feature_store()
+
+    pm_rows, weather_rows, failures = fetch_all(STATIONS)
 
-    pm_df_all = pd.concat(pm_rows)
-    weather_df_all = pd.concat(weather_rows)
+    print("\n=== Fetch timings ===")
+    print(fetch.summary().to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    if failures:
+        print(f"[warn] {len(failures)} call(s) failed: " + ", ".join(f"{sid}/{kind}" for sid, kind, _ in failures))
+    if not pm_rows and not weather_rows:
+        raise SystemExit("[error] 所有站点抓取失败，未写入任何数据。")
 
     # -------------------------
     # 写入 Feature Store
@@ -129,8 +220,10 @@ def main():
         online_enabled=False
     )
 
-    weather_fg.insert(weather_df_all, write_options={"wait_for_job": True})
-    aq_fg.insert(pm_df_all, write_options={"wait_for_job": True})
+    if weather_rows:
+        weather_fg.insert(pd.concat(weather_rows), write_options={"wait_for_job": True})
+    if pm_rows:
+        aq_fg.insert(pd.concat(pm_rows), write_options={"wait_for_job": True})
 
     print(" Done! Daily pipeline completed.")
 
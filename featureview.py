@@ -2,12 +2,11 @@
 # 使用 Feature View 自动 join 天气与 PM2.5，按站点训练模型
 
 import os
-import joblib
 import numpy as np
 import pandas as pd
-import hopsworks as hs
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_absolute_error
+
+from airquality import train_scheduler, training_cache
+from airquality.feature_store import get_feature_store
 
 # ------------ 配置 ------------
 STATION_WHITELIST = {
@@ -19,83 +18,84 @@ STATION_WHITELIST = {
 }
 MIN_TRAIN_ROWS = 10
 
-# ------------ 登录 Hopsworks ------------
-project = hs.login(
-    api_key_value=os.environ["HOPSWORKS_API_KEY"],
-    project=os.getenv("HOPSWORKS_PROJECT", None),
-)
-fs = project.get_feature_store()
 
-# ------------ 1) 获取 Feature Groups ------------
-fg_aq = fs.get_feature_group("air_quality_daily", version=2)
-fg_w  = fs.get_feature_group("weather_daily_forecast", version=2)
+def load_training_frame():
+    """通过 Feature View（或本地等价 join）生成训练表"""
+    # ------------ 登录 Hopsworks（FEATURE_STORE=local 时使用本地 Parquet） ------------
+    fs = get_feature_store()
 
-# ------------ 2) 定义 Feature View 查询 ------------
-query = (
-    fg_aq.select(["pm2_5", "city", "station_id", "date"])
-         .join(fg_w.select_all(), on=["city", "station_id", "date"])
-)
+    # ------------ 1) 获取 Feature Groups ------------
+    fg_aq = fs.get_feature_group("air_quality_daily", version=2)
+    fg_w  = fs.get_feature_group("weather_daily_forecast", version=2)
 
-# ------------ 3) 创建 Feature View ------------
-fv = fs.get_or_create_feature_view(
-    name="air_quality_fv_multi",
-    version=1,
-    labels=["pm2_5"],
-    query=query,
-    description="PM2.5 labels joined with Open-Meteo features"
-)
+    # ------------ 2~4) Feature View 查询 + 生成训练数据 ------------
+    # 远端：fg_aq.select([...]).join(fg_w.select_all()) 建 Feature View 后 get_training_data()
+    # 本地：等价的 inner join
+    # 两个 FG 都没有新提交时复用本地快照，不再每次在服务端物化新的训练数据集
+    df = training_cache.load_or_build(
+        "feature_view_air_quality_fv_multi_v1", [fg_aq, fg_w],
+        lambda: fs.join(
+            fg_aq, ["pm2_5", "city", "station_id", "date"],
+            fg_w, on=["city", "station_id", "date"],
+            view_name="air_quality_fv_multi",
+            view_version=1,
+            labels=["pm2_5"],
+            description="PM2.5 labels joined with Open-Meteo features",
+        ),
+    )
 
-# ------------ 4) 自动生成训练数据 ------------
-df = fv.get_training_data()
+    df["date"] = pd.to_datetime(df["date"])
+    df = df.dropna().sort_values("date")
 
-df["date"] = pd.to_datetime(df["date"])
-df = df.dropna().sort_values("date")
+    if STATION_WHITELIST:
+        df = df[df["station_id"].isin(STATION_WHITELIST)]
 
-if STATION_WHITELIST:
-    df = df[df["station_id"].isin(STATION_WHITELIST)]
+    print("\n[info] Feature View rows:", len(df))
+    print(df.groupby("station_id")["date"].agg(["min", "max", "count"]))
 
-print("\n[info] Feature View rows:", len(df))
-print(df.groupby("station_id")["date"].agg(["min", "max", "count"]))
+    if len(df) == 0:
+        raise SystemExit("[error] FV 生成的数据为空，请检查 FG 数据时间重叠。")
+    return df
 
-if len(df) == 0:
-    raise SystemExit("[error] FV 生成的数据为空，请检查 FG 数据时间重叠。")
 
-# ------------ 5) 逐站点训练模型 ------------
-os.makedirs("models", exist_ok=True)
-results = []
+def main():
+    df = load_training_frame()
 
-DROP_COLS = ["pm2_5", "city", "station_id", "date"]
+    # ------------ 5) 逐站点训练模型（train_scheduler 分配进程 / 树级并行） ------------
+    os.makedirs("models", exist_ok=True)
+    tasks = []
 
-for st_id, g in df.groupby("station_id"):
+    DROP_COLS = ["pm2_5", "city", "station_id", "date"]
+    tuned = train_scheduler.tuned_params()   # TUNED_PARAMS 指向 tune.py 的输出时按站点取参数
 
-    g = g.sort_values("date")
-    split = int(len(g) * 0.8)
-    tr, te = g.iloc[:split], g.iloc[split:]
+    for st_id, g in df.groupby("station_id"):
 
-    num_cols = tr.select_dtypes(include=[np.number]).columns.tolist()
-    feat_cols = [c for c in num_cols if c not in DROP_COLS]
+        g = g.sort_values("date")
+        split = int(len(g) * 0.8)
+        tr, te = g.iloc[:split], g.iloc[split:]
 
-    if len(tr) < MIN_TRAIN_ROWS or len(feat_cols) == 0:
-        print(f"[skip] {st_id}: 数据不足（rows={len(tr)}, feats={len(feat_cols)}）")
-        continue
+        num_cols = tr.select_dtypes(include=[np.number]).columns.tolist()
+        feat_cols = [c for c in num_cols if c not in DROP_COLS]
 
-    X_tr, y_tr = tr[feat_cols], tr["pm2_5"]
-    X_te, y_te = te[feat_cols], te["pm2_5"]
+        if len(tr) < MIN_TRAIN_ROWS or len(feat_cols) == 0:
+            print(f"[skip] {st_id}: 数据不足（rows={len(tr)}, feats={len(feat_cols)}）")
+            continue
 
-    model = RandomForestRegressor(n_estimators=400, random_state=42)
-    model.fit(X_tr, y_tr)
+        tasks.append(train_scheduler.make_task(st_id, tr, te, feat_cols, f"models/{st_id}_rf.joblib", rows=len(g),
+                                               params=train_scheduler.params_for(st_id, tuned)))
 
-    pred = model.predict(X_te)
-    mae = float(mean_absolute_error(y_te, pred))
+    results = []
+    for r in train_scheduler.run(tasks):
+        print(f"[ok] {r['station_id']}: rows={r['rows']}, feats={r['feats']}, MAE={r['mae']:.2f}")
+        results.append((r["station_id"], r["rows"], r["feats"], r["mae"]))
 
-    joblib.dump({"model": model, "features": feat_cols}, f"models/{st_id}_rf.joblib")
+    # ------------ Summary ------------
+    print("\n=== Summary ===")
+    for st_id, n, k, mae in results:
+        print(f"{st_id}: rows={n}, feats={k}, MAE={mae:.2f}")
 
-    print(f"[ok] {st_id}: rows={len(g)}, feats={len(feat_cols)}, MAE={mae:.2f}")
-    results.append((st_id, len(g), len(feat_cols), mae))
+    print("\n[done] 使用 Feature View 的多站点训练完成。")
 
-# ------------ Summary ------------
-print("\n=== Summary ===")
-for st_id, n, k, mae in results:
-    print(f"{st_id}: rows={n}, feats={k}, MAE={mae:.2f}")
 
-print("\n[done] 使用 Feature View 的多站点训练完成。")
+if __name__ == "__main__":
+    main()
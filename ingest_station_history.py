@@ -0,0 +1,52 @@
+# ingest_station_history.py
+# 一次性（或 CSV 更新后）把全部站点历史 CSV 导入列式数据集（见 airquality/station_history.py），并输出校验报告
+#   python ingest_station_history.py                     # stations.py 里所有有 sensor_csv 的站点
+#   python ingest_station_history.py hk-tuen-mun         # 只导入指定站点
+# 输出：
+#   .station_history/station_id=<sid>/data.parquet       全部污染物（pm2_5 / pm10 / o3 / no2 / so2 / co）
+#   outputs/station_history_report.csv                   每站一行：行数、日期范围、坏日期 / 重复日期 / 非数值 / 缺天 / 各列空值
+# 01 读标签时直接用这个数据集（CSV 未导入或已变化时会自动导入该站点）。INGEST_WORKERS 控制并行解析的进程数。
+
+import os
+import sys
+import time
+
+from airquality import station_history
+from airquality.stations import stations
+
+OUT_DIR = "outputs"
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    station_ids = [a for a in argv if not a.startswith("--")]
+    todo = [st for st in stations if st.get("sensor_csv") and (not station_ids or st["station_id"] in station_ids)]
+    if not todo:
+        raise SystemExit("[warn] 没有可导入的站点 CSV。")
+
+    t0 = time.perf_counter()
+    report = station_history.ingest(todo)
+    secs = time.perf_counter() - t0
+    if report.empty:
+        raise SystemExit("[error] 所有站点 CSV 都找不到。")
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    report_path = os.path.join(OUT_DIR, "station_history_report.csv")
+    report.to_csv(report_path, index=False)
+
+    print(f"\n=== Station history ingestion ({len(report)} station(s), {secs:.2f}s) ===")
+    cols = [c for c in ["station_id", "status", "rows_raw", "rows", "date_min", "date_max", "missing_days",
+                        "bad_dates", "duplicate_dates", "non_numeric", "missing_columns", "pm2_5_null"]
+            if c in report.columns]
+    print(report[cols].to_string(index=False))
+    for _, r in report.iterrows():
+        tag = {"ok": "[ok]", "warn": "[warn]"}.get(r["status"], "[fail]")
+        print(f"{tag} {r['station_id']}: {r['status']}")
+    print(f"[ok] dataset -> {station_history.ROOT}")
+    print(f"[ok] report saved -> {report_path}")
+    if (report["status"] == "fail").any():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# model_server.py
+# 常驻本地预测服务：模型只加载一次，HTTP JSON 接口返回 PM2.5 预测，省掉每次起脚本 + 登录 + 反序列化。
+#   python model_server.py                 # 监听 127.0.0.1:8765
+#   python model_server.py 0.0.0.0 9000
+#
+#   POST /predict  {"station_id": "hk-tuen-mun", "rows": [{"temperature_2m_mean": 27.1, ...}, ...]}
+#     -> {"station_id": ..., "pm2_5_pred": [...], "model": "models/hk-tuen-mun_rf.joblib", "batched_with": 3}
+#   GET  /health   -> 缓存中的模型与命中统计
+#
+# 模型缓存：按站点的 LRU（MODEL_CACHE_SIZE 个），以文件 (mtime, size) 为签名，文件被 02 重新训练覆盖后下次请求自动重载。
+# 微批：并发请求先进队列，等待至多 BATCH_WAIT_MS 毫秒，同一模型的请求拼成一次 predict，再按行数拆回各请求。
+# 模型选择与 03 相同：逐站模型优先，MODEL_MODE=pooled 或逐站文件不存在时用混合模型。
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from airquality import forest_io, pooled_model
+
+MODEL_PATH = "models/{station_id}_rf.joblib"
+MODEL_MODE = os.getenv("MODEL_MODE", "per_station").lower()
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "16"))
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "5"))
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "4096"))
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class ModelNotFound(KeyError):
+    pass
+
+
+def _signature(path):
+    """.joblib 与 .aqf 的 (mtime_ns, size)；任一变化即视为新模型"""
+    sig = []
+    for p in (path, forest_io.flat_path_for(path)):
+        try:
+            st = os.stat(p)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def resolve_model_path(station_id):
+    path = MODEL_PATH.format(station_id=station_id)
+    if MODEL_MODE != "pooled" and any(_signature(path)):
+        return path
+    if any(_signature(pooled_model.POOLED_MODEL_PATH)):
+        return pooled_model.POOLED_MODEL_PATH
+    raise ModelNotFound(f"no model for {station_id}: {path} / {pooled_model.POOLED_MODEL_PATH}")
+
+
+class ModelCache:
+    """按模型路径缓存 bundle 的 LRU；每次取用时比对文件签名，变了就重载"""
+
+    def __init__(self, maxsize=MODEL_CACHE_SIZE):
+        self.maxsize = max(1, maxsize)
+        self._items = OrderedDict()   # path -> (signature, bundle)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.reloads = 0
+
+    def get(self, path):
+        sig = _signature(path)
+        with self._lock:
+            cached = self._items.get(path)
+            if cached is not None and cached[0] == sig:
+                self._items.move_to_end(path)
+                self.hits += 1
+                return cached[1]
+
+        # 锁外加载，慢加载不阻塞其他站点的命中
+        bundle = forest_io.load_model_bundle(path)
+        with self._lock:
+            if cached is not None:
+                self.reloads += 1
+                print(f"[info] model changed on disk, reloaded {path}")
+            else:
+                self.misses += 1
+            self._items[path] = (sig, bundle)
+            self._items.move_to_end(path)
+            while len(self._items) > self.maxsize:
+                old, _ = self._items.popitem(last=False)
+                print(f"[info] evicted {old} from model cache")
+        return bundle
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": list(self._items),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+            }
+
+
+def feature_frame(bundle, frame):
+    """
+    取出模型需要的特征列并转成数值；缺列、非数值或空值直接报错（服务端不静默丢特征，也不让森林对 NaN 照常预测）。
+    """
+    feat_cols = bundle["features"]
+    if bundle.get("pooled"):
+        feat_cols = [c for c in feat_cols if c not in pooled_model.STATION_FEATURES]
+    missing = [c for c in feat_cols if c not in frame.columns]
+    if missing:
+        raise ValueError(f"missing feature(s): {missing}")
+    X = frame[feat_cols].apply(pd.to_numeric, errors="coerce")
+    bad = [c for c in feat_cols if X[c].isna().any()]
+    if bad:
+        raise ValueError(f"non-numeric or empty value(s) in feature(s): {bad}")
+    return X.astype(float)
+
+
+def predict_frame(bundle, station_id, frame):
+    """frame 为该站点的天气特征行"""
+    X = feature_frame(bundle, frame)
+    if bundle.get("pooled"):
+        return pooled_model.predict_pooled(bundle, station_id, X)
+    return bundle["model"].predict(X)
+
+
+class MicroBatcher:
+    """把并发的 predict 请求攒成批：同一 (模型, 站点) 的行拼起来只调用一次 predict"""
+
+    def __init__(self, cache, wait_ms=BATCH_WAIT_MS, max_rows=BATCH_MAX_ROWS):
+        self.cache = cache
+        self.wait = max(0.0, wait_ms) / 1000.0
+        self.max_rows = max(1, max_rows)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, station_id, frame):
+        fut = Future()
+        self._queue.put((station_id, frame, fut))
+        return fut
+
+    def _collect(self):
+        first = self._queue.get()
+        batch, rows = [first], len(first[1])
+        deadline = time.perf_counter() + self.wait
+        while rows < self.max_rows:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[1])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0], []).append(item)
+            for station_id, items in groups.items():
+                self._run_group(station_id, items)
+
+    def _run_group(self, station_id, items):
+        try:
+            path = resolve_model_path(station_id)
+            bundle = self.cache.get(path)
+        except Exception as e:
+            for it in items:
+                it[2].set_exception(e)
+            return
+        # 逐个请求校验特征：某个请求缺列 / 有坏值只让它自己失败，不影响同批的其他请求，也不会被别的请求的列补成 NaN
+        valid = []
+        for _, f, fut in items:
+            try:
+                valid.append((feature_frame(bundle, f), fut))
+            except ValueError as e:
+                fut.set_exception(e)
+        if not valid:
+            return
+        try:
+            frame = pd.concat([X for X, _ in valid], ignore_index=True)
+            pred = np.asarray(predict_frame(bundle, station_id, frame), dtype=float)
+        except Exception as e:
+            for _, fut in valid:
+                fut.set_exception(e)
+            return
+        start = 0
+        for f, fut in valid:
+            fut.set_result({
+                "station_id": station_id,
+                "pm2_5_pred": pred[start:start + len(f)].tolist(),
+                "model": path,
+                "batched_with": len(valid),
+            })
+            start += len(f)
+
+
+def parse_request(payload):
+    """校验请求体，返回 (station_id, DataFrame)"""
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    station_id = payload.get("station_id")
+    rows = payload.get("rows")
+    if not station_id or not isinstance(station_id, str):
+        raise ValueError("'station_id' is required")
+    if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+        raise ValueError("'rows' must be a non-empty list of feature objects")
+    # 不在这里转数值：坏值由 feature_frame 按模型的特征列报 400，而不是悄悄变成 NaN
+    return station_id, pd.DataFrame.from_records(rows)
+
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self._send(200, {"status": "ok", "cache": batcher.cache.stats()})
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/predict":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            t0 = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                station_id, frame = parse_request(json.loads(self.rfile.read(length) or b"null"))
+                result = batcher.submit(station_id, frame).result()
+            except KeyError as e:       # 找不到模型 / 混合模型没见过该站点
+                self._send(404, {"error": str(e.args[0])})
+                return
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            result["latency_ms"] = round((time.perf_counter() - t0) * 1e3, 3)
+            self._send(200, result)
+
+        def log_message(self, fmt, *args):
+            pass  # 默认每个请求打一行 stderr，高并发时太吵
+
+    return Handler
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, cache=None):
+    batcher = MicroBatcher(cache or ModelCache())
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    host = argv[0] if argv else DEFAULT_HOST
+    port = int(argv[1]) if len(argv) > 1 else DEFAULT_PORT
+    server = make_server(host, port)
+    print(f"[info] model server on http://{host}:{server.server_address[1]} "
+          f"(cache={MODEL_CACHE_SIZE}, batch_wait={BATCH_WAIT_MS}ms, mode={MODEL_MODE})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
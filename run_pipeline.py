@@ -0,0 +1,133 @@
+# run_pipeline.py
+# 一条命令跑完整条链路（代替按顺序手动跑 01 → 02 → 03 → build_dashboard）：
+#   ingest(01) → load(一次登录、一次读 FG) → frame → train(02) → window:<站点> → predict:<站点>(03) → dashboard
+# 阶段之间直接传 DataFrame，不再每步重新登录、重读特征库；各站点的 predict 在进程池里并发；
+# 输入内容（上游结果 / 模型文件 / 配置）与上次相同的阶段直接跳过（见 airquality/dag.py）。
+#   python run_pipeline.py                    # 全流程
+#   python run_pipeline.py --no-ingest        # 不抓新数据，只用特征库里已有的
+#   python run_pipeline.py --force            # 忽略指纹，全部重跑
+#   python run_pipeline.py predict:hk-tuen-mun  # 只跑指定阶段（及其上游）
+
+import os
+import sys
+import importlib
+from functools import partial
+
+import pandas as pd
+
+from airquality import dag, forest_io, pooled_model
+from airquality.feature_store import get_feature_store
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "0")) or None
+
+
+def _script(name):
+    """编号脚本不能直接 import（模块名以数字开头）"""
+    return importlib.import_module(name)
+
+
+def _naive_dates(df):
+    if "date" in df.columns:
+        df = df.assign(date=pd.to_datetime(df["date"], utc=True).dt.tz_localize(None))
+    return df
+
+
+def predict_stage(station_id, inputs):
+    """子进程里执行：单站点预测 + CSV + 两张图（同 03 的 run_station）"""
+    w_df, aq_df, today = inputs[f"window:{station_id}"]
+    return _script("03_predict_and_plot").run_station(station_id, w_df, aq_df, today)
+
+
+def build_stages(ingest=True):
+    p01 = _script("01_write_feature_groups")
+    p02 = _script("02_train_and_feature_view_multi")
+    p03 = _script("03_predict_and_plot")
+    dash = _script("build_dashboard")
+
+    fs_holder = {}
+
+    def fs():
+        if "fs" not in fs_holder:
+            fs_holder["fs"] = get_feature_store()
+        return fs_holder["fs"]
+
+    def load(_):
+        aq_df, w_df = p02.read_frames(fs())
+        return _naive_dates(aq_df), _naive_dates(w_df)
+
+    def window(station_id, inputs):
+        aq_all, _ = inputs["load"]
+        w_all = inputs["spatial"]
+        today, start_date, end_date = p03.prediction_window()
+        w_df, aq_df = p03.station_frames(station_id, w_all, aq_all, today, start_date, end_date)
+        return w_df, aq_df, today
+
+    station_ids = list(p03.STATION_IDS)
+    model_paths = {sid: p03.MODEL_PATH.format(station_id=sid) for sid in station_ids}
+    pooled_path = pooled_model.POOLED_MODEL_PATH
+    trained = [pooled_path] if p02.MODEL_MODE == "pooled" else [model_paths[s] for s in station_ids]
+
+    stages = []
+    if ingest:
+        stages.append(dag.Stage("ingest", lambda _: p01.main(fs()), cache=False))
+    stages += [
+        dag.Stage("load", load, deps=["ingest"] if ingest else [], cache=False),
+        dag.Stage("frame", lambda inputs: p02.build_training_frame(*inputs["load"]), deps=["load"], cache=False),
+        # 预测窗口用的天气表（SPATIAL_FEATURES=1 时所有站点一起补邻居特征，只算一次）
+        dag.Stage("spatial", lambda inputs: p03.add_spatial_features(inputs["load"][1], inputs["load"][0]),
+                  deps=["load"], cache=False),
+        dag.Stage(
+            "train", lambda inputs: p02.train(inputs["frame"]), deps=["frame"],
+            # MODEL_FORMAT 决定实际写出 .joblib / .aqf 中的哪些，缺任何一个都要重训
+            outputs=[f for p in trained for f in forest_io.bundle_paths(p)],
+            salt={
+                "mode": p02.MODEL_MODE,
+                "format": forest_io.MODEL_FORMAT,
+                "params": p02.train_scheduler.RF_PARAMS,
+                "tuned": p02.train_scheduler.tuned_params(),
+                "whitelist": sorted(p02.STATION_WHITELIST or []),
+                "min_rows": p02.MIN_TRAIN_ROWS,
+            },
+        ),
+    ]
+
+    outputs = []
+    for sid in station_ids:
+        files = [os.path.join(p03.OUTDIR, f"{sid}_{kind}") for kind in ("predictions.csv", "hindcast.png", "forecast.png")]
+        outputs += files
+        model = model_paths[sid]
+        stages += [
+            dag.Stage(f"window:{sid}", partial(window, sid), deps=["load", "spatial"], cache=False),
+            dag.Stage(
+                f"predict:{sid}", partial(predict_stage, sid), deps=["train", f"window:{sid}"],
+                process=True,
+                files=[model, forest_io.flat_path_for(model), pooled_path, forest_io.flat_path_for(pooled_path)],
+                outputs=files,
+                salt={"mode": p03.MODEL_MODE, "aqi_bands": p03.USE_AQI_BANDS},
+            ),
+        ]
+
+    stages.append(dag.Stage(
+        "dashboard", lambda _: dash.main(), deps=[f"predict:{sid}" for sid in station_ids],
+        files=outputs, outputs=[os.path.join(dash.SITE_DIR, "index.html")],
+    ))
+    return stages
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    force = "--force" in argv
+    ingest = "--no-ingest" not in argv
+    targets = [a for a in argv if not a.startswith("--")] or None
+
+    stages = build_stages(ingest=ingest)
+    _, report = dag.run(stages, targets=targets, force=force, workers=PIPELINE_WORKERS)
+
+    print("\n=== Pipeline ===")
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    if report["status"].isin(["failed", "blocked"]).any():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
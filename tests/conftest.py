@@ -0,0 +1,7 @@
+# tests/conftest.py
+# 仓库根目录加入 sys.path：编号脚本与 airquality 包都从根目录导入（直接运行 pytest 时也可用）
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,57 @@
+# tests/test_backfill_watermark.py
+# 01 的增量回填水位：只保留严格晚于水位的行；水位只前进不后退；天气水位不超过 upto（“昨天”）。
+
+import importlib
+
+import pandas as pd
+import pytest
+
+p01 = importlib.import_module("01_write_feature_groups")
+FG = p01.WEATHER_FG
+
+
+def _rows(station_id, dates, city="hk"):
+    return pd.DataFrame({"city": city, "station_id": station_id, "date": pd.to_datetime(dates)})
+
+
+def test_filter_new_rows_is_strict_and_per_station():
+    state = {"weather_daily_forecast_v2": {"hk|st-a": "2024-01-02"}}
+    df = pd.concat([_rows("st-a", ["2024-01-01", "2024-01-02", "2024-01-03"]),
+                    _rows("st-b", ["2024-01-01"])])
+    out = p01.filter_new_rows(df, state, FG)
+    assert list(zip(out["station_id"], out["date"].dt.day)) == [("st-a", 3), ("st-b", 1)]
+    # 没有该 FG 的水位：全部保留
+    assert len(p01.filter_new_rows(df, {}, FG)) == len(df)
+
+
+def test_advance_watermarks_moves_forward_only_and_respects_upto():
+    state = {}
+    p01.advance_watermarks(state, FG, _rows("st-a", ["2024-01-01", "2024-01-09"]),
+                           upto={"st-a": pd.Timestamp("2024-01-05")})
+    assert p01.get_watermark(state, FG, "hk", "st-a") == pd.Timestamp("2024-01-05")
+
+    p01.advance_watermarks(state, FG, _rows("st-a", ["2024-01-03"]))   # 更早的数据不回退水位
+    assert p01.get_watermark(state, FG, "hk", "st-a") == pd.Timestamp("2024-01-05")
+
+    p01.advance_watermarks(state, FG, _rows("st-a", ["2024-01-07"]))
+    assert p01.get_watermark(state, FG, "hk", "st-a") == pd.Timestamp("2024-01-07")
+    assert p01.get_watermark(state, FG, "hk", "st-b") is None
+
+
+def test_watermarks_round_trip(tmp_path, monkeypatch):
+    path = str(tmp_path / "state" / "wm.json")
+    state = p01.advance_watermarks({}, FG, _rows("st-a", ["2024-01-04"]))
+    p01.save_watermarks(state, path)
+    assert p01.load_watermarks(path) == state
+
+    monkeypatch.setattr(p01, "FULL_BACKFILL", True)
+    assert p01.load_watermarks(path) == {}
+
+
+@pytest.mark.parametrize("days_since, expected", [(0, 1), (3, 3), (1000, 360)])
+def test_incremental_past_days(monkeypatch, days_since, expected):
+    today = pd.Timestamp("2024-06-01")
+    monkeypatch.setattr(p01, "_today", lambda st: today)
+    st = {"city": "hk", "station_id": "st-a", "timezone": "Asia/Hong_Kong"}
+    state = {"weather_daily_forecast_v2": {"hk|st-a": (today - pd.Timedelta(days=days_since)).strftime("%Y-%m-%d")}}
+    assert p01._want_past_days(st, state) == expected
@@ -0,0 +1,49 @@
+# tests/test_backtest.py
+# 回测折边界：按日期划分的连续测试窗口、训练集严格早于测试集、缺日期不移动边界、训练行不足的折跳过。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from airquality import backtest
+
+
+def test_folds_are_consecutive_date_windows():
+    days = np.arange(100, 160)                      # 60 个连续日
+    folds = backtest.folds(days, n_folds=3, horizon_days=7)
+    assert folds == [(39, 46), (46, 53), (53, 60)]
+    for tr_stop, te_stop in folds:
+        assert days[tr_stop - 1] < days[tr_stop]     # 训练集都早于测试集
+        assert days[te_stop - 1] - days[tr_stop] < 7
+
+
+def test_folds_use_dates_when_days_are_missing():
+    days = np.array([d for d in range(100, 160) if d not in (150, 151, 152)])
+    (tr1, te1), (tr2, te2) = backtest.folds(days, n_folds=2, horizon_days=7)
+    # 测试窗口仍是 [146, 153) 与 [153, 160)，只是第一个窗口里少了 3 行
+    assert (days[tr1], days[te1 - 1]) == (146, 149)
+    assert (days[tr2], days[te2 - 1]) == (153, 159)
+    assert te1 == tr2
+
+
+def test_folds_skip_short_training_and_empty_windows():
+    days = np.arange(0, 20)
+    assert backtest.folds(days, n_folds=3, horizon_days=7, min_train=10) == [(13, 20)]
+    assert backtest.folds(np.array([], dtype=np.int64), n_folds=3, horizon_days=7) == []
+    gap = np.concatenate([np.arange(0, 30), np.arange(40, 47)])   # 第二个窗口 [33, 40) 没有数据
+    assert backtest.folds(gap, n_folds=3, horizon_days=7) == [(26, 30), (30, 37)]
+
+
+def test_run_station_warm_refit_adds_trees():
+    pytest.importorskip("sklearn")
+    rng = np.random.default_rng(0)
+    g = pd.DataFrame({"date": pd.date_range("2024-01-01", periods=80, freq="D"),
+                      "x": rng.normal(size=80)})
+    g["pm2_5"] = 20 + 3 * g["x"]
+    arrays = backtest.station_arrays("st-a", g.sample(frac=1.0, random_state=0), ["x"])
+    assert np.all(np.diff(arrays["days"]) == 1)
+    rows = backtest.run_station(arrays, params={"n_estimators": 10, "random_state": 0},
+                                refit="warm", add_trees=5, n_folds=3, horizon_days=7)
+    assert [r["n_trees"] for r in rows] == [10, 15, 20]
+    assert [r["test_start"] for r in rows] == ["2024-02-29", "2024-03-07", "2024-03-14"]
+    assert all(r["train_end"] < r["test_start"] for r in rows)
@@ -0,0 +1,64 @@
+# tests/test_daily_agg.py
+# 小时 -> 日度的分段归约与 pandas groupby 结果一致（含 NaN、缺列、风向圆均值）。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from airquality.daily_agg import aggregate_daily, reduce_segments, segment_starts
+
+
+@pytest.fixture()
+def hourly():
+    rng = np.random.default_rng(0)
+    frames = []
+    for sid in ["st-b", "st-a"]:   # 故意不按站点排序
+        t = pd.date_range("2024-01-01", periods=72, freq="h")
+        frames.append(pd.DataFrame({
+            "city": "hk", "station_id": sid, "date": t.normalize(),
+            "pm2_5": rng.gamma(3, 8, size=72),
+            "temperature_2m": rng.normal(25, 3, size=72),
+            "precipitation": rng.exponential(0.5, size=72),
+            "wind_direction_10m": rng.uniform(0, 360, size=72),
+        }))
+    df = pd.concat(frames, ignore_index=True).sample(frac=1.0, random_state=0)
+    df.loc[df.index[:20], "pm2_5"] = np.nan
+    return df
+
+
+def test_matches_pandas_groupby(hourly):
+    out = aggregate_daily(hourly).set_index(["city", "station_id", "date"])
+    ref = hourly.groupby(["city", "station_id", "date"]).agg(
+        pm2_5_mean=("pm2_5", "mean"), pm2_5_max=("pm2_5", "max"),
+        temperature_2m_mean=("temperature_2m", "mean"), precipitation_sum=("precipitation", "sum"))
+    for c in ref.columns:
+        np.testing.assert_allclose(out.loc[ref.index, c].to_numpy(), ref[c].to_numpy(), rtol=1e-12)
+    # 源列缺失 -> 整列 NaN
+    assert out["pm10_mean"].isna().all()
+    assert len(out) == 6
+
+
+def test_circular_mean_wraps_around_north():
+    starts = np.array([0, 2])
+    got = reduce_segments([350.0, 10.0, 90.0, np.nan], starts, "circmean")
+    # 按角度差比较（0° 与 360° 是同一方向）
+    diff = (got - np.array([0.0, 90.0]) + 180.0) % 360.0 - 180.0
+    np.testing.assert_allclose(diff, 0.0, atol=1e-9)
+
+
+def test_all_nan_segments():
+    starts = np.array([0, 2])
+    v = [np.nan, np.nan, 1.0, 3.0]
+    assert np.isnan(reduce_segments(v, starts, "mean")[0])
+    assert np.isnan(reduce_segments(v, starts, "max")[0])
+    assert reduce_segments(v, starts, "sum").tolist() == [0.0, 4.0]   # 与 pandas sum 相同
+    with pytest.raises(ValueError):
+        reduce_segments(v, starts, "median")
+
+
+def test_segment_starts_and_empty():
+    df = pd.DataFrame({"a": [1, 1, 2, 2, 2], "b": [1, 2, 2, 2, 3]})
+    assert segment_starts(df, ["a"]).tolist() == [0, 2]
+    assert segment_starts(df, ["a", "b"]).tolist() == [0, 1, 2, 4]
+    empty = aggregate_daily(pd.DataFrame(columns=["city", "station_id", "date", "pm2_5"]))
+    assert empty.empty and "pm2_5_mean" in empty.columns
@@ -0,0 +1,91 @@
+# tests/test_feature_store.py
+# 本地特征库：upsert、站点 / 日期下推、空结果保留表结构、join、data_version；Hopsworks 包装按 FG 自己的 event_time。
+
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from airquality.feature_store import HopsworksFeatureStore, LocalFeatureStore
+
+
+def _labels(station_id, days, start="2024-01-01", offset=0.0):
+    dates = pd.date_range(start, periods=days, freq="D")
+    return pd.DataFrame({"city": "hk", "station_id": station_id, "date": dates,
+                         "pm2_5": [float(i) + offset for i in range(days)]})
+
+
+@pytest.fixture()
+def fs(tmp_path):
+    return LocalFeatureStore(str(tmp_path))
+
+
+@pytest.fixture()
+def fg(fs):
+    fg = fs.get_or_create_feature_group("air_quality_daily", 2, primary_key=["city", "station_id"])
+    fg.insert(pd.concat([_labels("st-a", 10), _labels("st-b", 10)]))
+    return fg
+
+
+def test_insert_upserts_on_key(fs, fg):
+    fg.insert(_labels("st-a", 2, start="2024-01-10", offset=100.0))   # 1 月 10 日覆盖，1 月 11 日新增
+    df = fs.get_feature_group("air_quality_daily", 2).read(station_ids="st-a")
+    assert len(df) == 11
+    assert df.set_index("date").loc["2024-01-10", "pm2_5"] == 100.0
+    assert df["date"].is_monotonic_increasing
+
+
+def test_read_pushes_down_stations_dates_and_columns(fg):
+    df = fg.read(station_ids=["st-b"], start="2024-01-03", end=pd.Timestamp("2024-01-05", tz="UTC"),
+                 columns=["station_id", "date", "pm2_5"])
+    assert list(df.columns) == ["station_id", "date", "pm2_5"]
+    assert set(df["station_id"]) == {"st-b"}
+    assert df["date"].tolist() == list(pd.date_range("2024-01-03", "2024-01-05"))
+
+
+def test_empty_read_keeps_schema(fs, fg):
+    full = fg.read()
+    empty = fg.read(start="2030-01-01")
+    assert empty.empty
+    assert list(empty.columns) == list(full.columns)
+    assert empty.dtypes.equals(full.dtypes)
+    assert list(fg.read(station_ids=["nope"], columns=["date", "pm2_5"]).columns) == ["date", "pm2_5"]
+
+    # 还没有任何分区时按 _meta.json 里记录的结构
+    other = fs.get_or_create_feature_group("weather_daily_forecast", 2, primary_key=["city", "station_id"])
+    assert other.read().columns.tolist() == []
+    other.insert(_labels("st-a", 1).rename(columns={"pm2_5": "temperature_2m_mean"}))
+    for f in other.partitions().values():
+        os.remove(f)
+    reopened = fs.get_feature_group("weather_daily_forecast", 2)
+    assert reopened.read()["date"].dtype.kind == "M"
+
+
+def test_join_matches_pandas_merge(fs, fg):
+    w = fs.get_or_create_feature_group("weather_daily_forecast", 2, primary_key=["city", "station_id"])
+    w.insert(_labels("st-a", 5, start="2024-01-08").rename(columns={"pm2_5": "temperature_2m_mean"}))
+    df = fs.join(fg, ["city", "station_id", "date", "pm2_5"], w, on=["city", "station_id", "date"])
+    assert len(df) == 3   # 1 月 8–10 日重叠
+    assert {"pm2_5", "temperature_2m_mean"} <= set(df.columns)
+
+
+def test_data_version_changes_on_insert(fs, fg):
+    before = fg.data_version()
+    assert before["rows"] == 20 and before["max_event_time"].startswith("2024-01-10")
+    fg.insert(_labels("st-a", 1, start="2024-02-01"))
+    after = fs.get_feature_group("air_quality_daily", 2).data_version()
+    assert after["commit"] == before["commit"] + 1
+    assert after["rows"] == 21
+
+
+def test_hopsworks_wrapper_uses_fg_event_time():
+    raw = SimpleNamespace(name="weather_hourly_forecast", version=1, event_time="time")
+    store = HopsworksFeatureStore(SimpleNamespace(
+        get_feature_group=lambda name, version: raw,
+        get_or_create_feature_group=lambda **kw: raw,
+    ))
+    assert store.get_feature_group("weather_hourly_forecast", 1).event_time == "time"
+    assert store.get_or_create_feature_group("weather_hourly_forecast", 1, ["station_id"]).event_time == "time"
@@ -0,0 +1,70 @@
+# tests/test_forest_io.py
+# .aqf 森林格式：编译 / mmap 加载 / 整体读入 三种方式的 predict 与 sklearn 逐位一致（含 NaN 输入）。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sklearn")
+joblib = pytest.importorskip("joblib")
+from sklearn.ensemble import RandomForestRegressor
+
+from airquality import forest_io
+
+FEATURES = ["temperature_2m_mean", "wind_speed_10m_mean", "pm2_5_lag1", "pm2_5_lag2"]
+
+
+@pytest.fixture(scope="module")
+def model():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, len(FEATURES))), columns=FEATURES)
+    X.iloc[rng.random(300) < 0.1, 2] = np.nan   # 训练时带缺失值，sklearn 会学到 missing_go_to_left
+    y = 30 + 5 * X["temperature_2m_mean"] + np.nan_to_num(X["pm2_5_lag1"]) + rng.normal(size=300)
+    return RandomForestRegressor(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def X_test():
+    rng = np.random.default_rng(1)
+    X = pd.DataFrame(rng.normal(size=(forest_io.PREDICT_CHUNK + 37, len(FEATURES))), columns=FEATURES)
+    X.iloc[::7, 2] = np.nan
+    X.iloc[::11, 3] = np.nan
+    return X
+
+
+def test_compiled_matches_sklearn(model, X_test):
+    flat = forest_io.compile_forest(model, FEATURES)
+    np.testing.assert_array_equal(flat.predict(X_test), model.predict(X_test))
+    np.testing.assert_array_equal(flat.predict(X_test.iloc[:1]), model.predict(X_test.iloc[:1]))
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_saved_forest_matches_sklearn(model, X_test, tmp_path, use_mmap):
+    path = forest_io.save_forest(str(tmp_path / "model.aqf"), model, FEATURES, {"station_id": "st-1"})
+    flat = forest_io.load_forest(path, use_mmap=use_mmap)
+    assert flat.features == FEATURES
+    assert flat.header["meta"] == {"station_id": "st-1"}
+    # 列顺序打乱也按 features 取列
+    np.testing.assert_array_equal(flat.predict(X_test[FEATURES[::-1]]), model.predict(X_test))
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_bundle_prefers_flat_file(model, X_test, tmp_path, use_mmap):
+    path = str(tmp_path / "model.joblib")
+    bundle = {"model": model, "features": FEATURES, "station_id": "st-1"}
+    written = forest_io.save_model_bundle(path, bundle, fmt="both")
+    assert written == [path, forest_io.flat_path_for(path)]
+
+    loaded = forest_io.load_model_bundle(path, use_mmap=use_mmap)
+    assert isinstance(loaded["model"], forest_io.FlatForest)
+    assert loaded["features"] == FEATURES and loaded["station_id"] == "st-1"
+    np.testing.assert_array_equal(loaded["model"].predict(X_test), model.predict(X_test))
+
+
+def test_joblib_bundle_keeps_sklearn_by_default(model, tmp_path, monkeypatch):
+    path = str(tmp_path / "model.joblib")
+    forest_io.save_model_bundle(path, {"model": model, "features": FEATURES}, fmt="joblib")
+    assert isinstance(forest_io.load_model_bundle(path)["model"], RandomForestRegressor)
+
+    monkeypatch.setattr(forest_io, "FLAT_PREDICT", True)
+    assert isinstance(forest_io.load_model_bundle(path)["model"], forest_io.FlatForest)
@@ -0,0 +1,63 @@
+# tests/test_lag_features.py
+# 滞后 / 滚动 / 指数加权特征按“时间”对齐：缺日期不错位、不泄漏当期、行顺序不变、站点之间互不影响。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from airquality import lag_features
+
+
+@pytest.fixture()
+def frame():
+    # st-a 缺 1 月 3 日；1 月 5 日目标为 NaN（待预测）；st-b 与 st-a 交错、打乱顺序
+    a = pd.DataFrame({"station_id": "st-a",
+                      "date": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-04", "2024-01-05"]),
+                      "pm2_5": [10.0, 20.0, 40.0, np.nan]})
+    b = pd.DataFrame({"station_id": "st-b",
+                      "date": pd.date_range("2024-01-01", periods=4, freq="D"),
+                      "pm2_5": [1.0, 2.0, 3.0, 4.0]})
+    return pd.concat([a, b], ignore_index=True).sample(frac=1.0, random_state=1)
+
+
+def _by(df, sid, col):
+    g = df[df["station_id"] == sid].sort_values("date")
+    return g[col].tolist()
+
+
+def test_lags_align_on_dates_not_rows(frame):
+    out = lag_features.add_features(frame, lags=[1, 2])
+    assert out.index.equals(frame.index)
+    np.testing.assert_array_equal(_by(out, "st-a", "pm2_5_lag1"), [np.nan, 10.0, np.nan, 40.0])
+    np.testing.assert_array_equal(_by(out, "st-a", "pm2_5_lag2"), [np.nan, np.nan, 20.0, np.nan])
+    np.testing.assert_array_equal(_by(out, "st-b", "pm2_5_lag1"), [np.nan, 1.0, 2.0, 3.0])
+
+
+def test_rolling_excludes_current_period(frame):
+    out = lag_features.add_features(frame, windows=[3])
+    # 1 月 5 日：窗口 [1/2, 1/4] 内有 20、40
+    np.testing.assert_array_equal(_by(out, "st-a", "pm2_5_roll3_mean"), [np.nan, 10.0, 15.0, 30.0])
+    np.testing.assert_array_equal(_by(out, "st-a", "pm2_5_roll3_max"), [np.nan, 10.0, 20.0, 40.0])
+    strict = lag_features.add_features(frame, windows=[3], min_periods=2)
+    np.testing.assert_array_equal(_by(strict, "st-a", "pm2_5_roll3_mean"), [np.nan, np.nan, 15.0, 30.0])
+
+
+def test_ewm_uses_time_decay_and_only_past_values(frame):
+    out = lag_features.add_features(frame, halflives=[1])
+    got = _by(out, "st-a", "pm2_5_ewm1")
+    assert np.isnan(got[0]) and got[1] == 10.0
+    # 1 月 4 日：10（3 天前，权重 1/8）与 20（2 天前，权重 1/4）
+    assert got[2] == pytest.approx((10 / 8 + 20 / 4) / (1 / 8 + 1 / 4))
+    # 1 月 5 日：再加上 40（1 天前，权重 1/2）
+    assert got[3] == pytest.approx((10 / 16 + 20 / 8 + 40 / 2) / (1 / 16 + 1 / 8 + 1 / 2))
+    # 其他站点的值不会混进来
+    assert np.isnan(_by(out, "st-b", "pm2_5_ewm1")[0])
+
+
+def test_hourly_suffix_and_names():
+    df = pd.DataFrame({"station_id": "st-a", "time": pd.date_range("2024-01-01", periods=30, freq="h"),
+                       "pm2_5": np.arange(30.0)})
+    out = lag_features.add_features(df, lags=[24], time_col="time", freq="h", suffix="h")
+    assert out["pm2_5_lag24h"].iloc[-1] == 5.0
+    assert lag_features.feature_names(lags=[1], windows=[7], halflives=[3]) == [
+        "pm2_5_lag1", "pm2_5_roll7_mean", "pm2_5_roll7_max", "pm2_5_ewm3"]
@@ -0,0 +1,65 @@
+# tests/test_model_server.py
+# model_server：请求解析不把坏值变成 NaN；微批里每个请求单独校验特征，坏请求不影响、也不借用同批请求的列。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("joblib")
+from sklearn.ensemble import RandomForestRegressor
+
+import model_server
+from airquality import forest_io
+
+FEATURES = ["a", "b", "c"]
+
+
+@pytest.fixture()
+def batcher(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(60, 3)), columns=FEATURES)
+    model = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, X.sum(axis=1))
+    forest_io.save_model_bundle(str(tmp_path / "st-1_rf.joblib"), {"model": model, "features": FEATURES}, fmt="joblib")
+    monkeypatch.setattr(model_server, "MODEL_PATH", str(tmp_path / "{station_id}_rf.joblib"))
+    monkeypatch.setattr(model_server, "MODEL_MODE", "per_station")
+    return model_server.MicroBatcher(model_server.ModelCache(), wait_ms=200)
+
+
+def _submit(batcher, rows):
+    station_id, frame = model_server.parse_request({"station_id": "st-1", "rows": rows})
+    return batcher.submit(station_id, frame)
+
+
+def test_parse_request_keeps_raw_values():
+    _, frame = model_server.parse_request({"station_id": "st-1", "rows": [{"a": "abc", "b": None}]})
+    assert frame.loc[0, "a"] == "abc"
+    with pytest.raises(ValueError):
+        model_server.parse_request({"station_id": "st-1", "rows": [1, 2]})
+    with pytest.raises(ValueError):
+        model_server.parse_request({"station_id": "st-1", "rows": []})
+
+
+def test_incomplete_request_fails_alone_in_batch(batcher):
+    good = _submit(batcher, [{"a": 1.0, "b": 2.0, "c": 3.0}])
+    missing = _submit(batcher, [{"a": 1.0, "c": 3.0}])
+    with pytest.raises(ValueError, match="missing feature"):
+        missing.result(timeout=10)
+    result = good.result(timeout=10)
+    assert len(result["pm2_5_pred"]) == 1 and result["batched_with"] == 1
+
+
+@pytest.mark.parametrize("bad", [None, "abc", float("nan")])
+def test_non_numeric_feature_is_rejected(batcher, bad):
+    good = _submit(batcher, [{"a": 1.0, "b": 2.0, "c": 3.0}, {"a": "4", "b": 5, "c": 6}])
+    broken = _submit(batcher, [{"a": 1.0, "b": bad, "c": 3.0}])
+    with pytest.raises(ValueError, match=r"\['b'\]"):
+        broken.result(timeout=10)
+    assert len(good.result(timeout=10)["pm2_5_pred"]) == 2
+
+
+def test_batched_predictions_match_single_requests(batcher):
+    rows = [{"a": 0.1 * i, "b": -0.2 * i, "c": 0.3} for i in range(4)]
+    alone = [_submit(batcher, [r]).result(timeout=10)["pm2_5_pred"][0] for r in rows]
+    futures = [_submit(batcher, [r]) for r in rows]
+    assert [f.result(timeout=10)["pm2_5_pred"][0] for f in futures] == alone
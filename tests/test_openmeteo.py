@@ -0,0 +1,51 @@
+# tests/test_openmeteo.py
+# Open-Meteo 多坐标请求：按 URL 长度 / 坐标数切批且保持顺序；响应按批拼回；坐标数不符时报错。
+
+import pytest
+
+from airquality import openmeteo
+
+URL = "https://api.open-meteo.com/v1/forecast"
+PARAMS = {"hourly": "temperature_2m", "timezone": "Asia/Hong_Kong", "past_days": 7}
+COORDS = [(22.3 + i / 100, 114.1 + i / 100) for i in range(23)]
+
+
+def test_chunks_respect_location_limit_and_order():
+    chunks = openmeteo.chunk_coords(URL, PARAMS, COORDS, max_url=10**6, max_locations=10)
+    assert [len(c) for c in chunks] == [10, 10, 3]
+    assert [c for chunk in chunks for c in chunk] == COORDS
+
+
+def test_chunks_respect_url_length():
+    max_url = 300
+    chunks = openmeteo.chunk_coords(URL, PARAMS, COORDS, max_url=max_url, max_locations=1000)
+    assert len(chunks) > 1
+    assert all(len(openmeteo.build_url(URL, PARAMS, c)) <= max_url for c in chunks)
+    assert [c for chunk in chunks for c in chunk] == COORDS
+
+
+def test_single_coordinate_longer_than_limit_still_sent():
+    assert openmeteo.chunk_coords(URL, PARAMS, COORDS[:2], max_url=10) == [[COORDS[0]], [COORDS[1]]]
+
+
+def test_get_many_reassembles_batches(monkeypatch):
+    calls = []
+
+    def fake_get_json(url, params, accept=None, **kw):
+        lats = params["latitude"].split(",")
+        calls.append(len(lats))
+        payload = [{"latitude": float(x), "hourly": {}} for x in lats]
+        assert accept(payload)
+        return payload if len(lats) > 1 else payload[0]   # 单坐标时 API 返回对象而不是列表
+
+    monkeypatch.setattr(openmeteo.fetch, "get_json", fake_get_json)
+    monkeypatch.setattr(openmeteo, "MAX_LOCATIONS", 10)
+    out = openmeteo.get_many(URL, PARAMS, COORDS[:21])
+    assert calls == [10, 10, 1]
+    assert [p["latitude"] for p in out] == [lat for lat, _ in COORDS[:21]]
+
+
+def test_get_many_rejects_wrong_count(monkeypatch):
+    monkeypatch.setattr(openmeteo.fetch, "get_json", lambda url, params, **kw: {"error": True, "reason": "x"})
+    with pytest.raises(ValueError):
+        openmeteo.get_many(URL, PARAMS, COORDS[:3])
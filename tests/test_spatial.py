@@ -0,0 +1,62 @@
+# tests/test_spatial.py
+# 邻居索引：k 近邻按距离排序、不含自己、超出 max_km 的不算、权重归一化；IDW 只用非空邻居并重新归一化；
+# 邻居 PM2.5 滞后按日期对齐，fill_forward 时沿用最近一天。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from airquality import spatial
+
+# 沿赤道排开：经度差 0.1° ≈ 11.1 km
+STATIONS = [{"station_id": f"st-{i}", "lat": 0.0, "lon": 0.1 * x} for i, x in enumerate([0, 1, 3, 30])]
+
+
+@pytest.fixture()
+def index():
+    return spatial.build_index(STATIONS, k=2, max_km=50, power=2)
+
+
+def test_haversine_km():
+    assert spatial.haversine_km(0, 0, 0, 1) == pytest.approx(111.19, abs=0.01)
+    assert spatial.haversine_km(22.3, 114.1, 22.3, 114.1) == 0.0
+
+
+def test_index_neighbors_sorted_and_capped(index):
+    nb = spatial.neighbor_table(index)
+    assert nb[nb["station_id"] == "st-0"]["neighbor_id"].tolist() == ["st-1", "st-2"]
+    assert nb[nb["station_id"] == "st-2"]["neighbor_id"].tolist() == ["st-1", "st-0"]
+    assert "st-3" not in set(nb["station_id"]) | set(nb["neighbor_id"])   # 最近的邻居也在 50 km 外
+    assert (nb["station_id"] != nb["neighbor_id"]).all()
+    assert (nb.groupby("station_id")["dist_km"].apply(lambda d: d.is_monotonic_increasing)).all()
+    np.testing.assert_allclose(nb.groupby("station_id")["weight"].sum(), 1.0)
+    # st-0 的两个邻居距离比 1:3 -> 权重比 9:1
+    w = nb[nb["station_id"] == "st-0"]["weight"].to_numpy()
+    np.testing.assert_allclose(w, [0.9, 0.1])
+
+
+def test_index_is_memoized(index):
+    assert spatial.build_index(list(reversed(STATIONS)), k=2, max_km=50, power=2) is index
+
+
+def test_idw_renormalizes_over_present_neighbors(index):
+    grid = np.array([[np.nan], [10.0], [np.nan], [5.0]])
+    out = spatial.idw(grid, index)
+    assert out[0, 0] == 10.0          # st-2 缺值，只剩 st-1
+    assert np.isnan(out[3, 0])        # 没有邻居
+    grid[2, 0] = 20.0
+    assert spatial.idw(grid, index)[0, 0] == pytest.approx(0.9 * 10 + 0.1 * 20)
+
+
+def test_add_features_lags_align_on_dates(index):
+    dates = pd.date_range("2024-01-01", periods=3, freq="D")
+    labels = pd.DataFrame({"station_id": ["st-1"] * 3, "date": dates, "pm2_5": [1.0, 2.0, 3.0]})
+    df = pd.DataFrame({"station_id": "st-0", "date": list(dates) + [dates[-1] + pd.Timedelta(days=2)],
+                       "temperature": [20.0, 21.0, 22.0, 23.0]})
+    out = spatial.add_features(df, index, [], labels=labels, lags=[1])
+    np.testing.assert_array_equal(out["nbr_pm2_5_lag1"], [np.nan, 1.0, 2.0, np.nan])
+    ff = spatial.add_features(df, index, [], labels=labels, lags=[1], fill_forward=True)
+    assert ff["nbr_pm2_5_lag1"].iloc[-1] == 3.0
+    # 索引外的站点得到 NaN，不报错
+    other = spatial.add_features(df.assign(station_id="unknown"), index, ["temperature"], labels=labels, lags=[1])
+    assert other[["nbr_temperature", "nbr_pm2_5_lag1"]].isna().all().all()
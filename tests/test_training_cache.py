@@ -0,0 +1,74 @@
+# tests/test_training_cache.py
+# 训练表快照：键随上游版本 / salt 变化；命中时不重建；上游没有版本信息时不缓存；旧快照按 KEEP 清理。
+
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from airquality import training_cache
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(training_cache, "ENABLED", True)
+
+
+class FakeFG:
+    def __init__(self, commit=1, max_event_time="2024-01-10"):
+        self.version = {"name": "fg", "version": 1, "commit": commit, "max_event_time": max_event_time}
+
+    def data_version(self):
+        return dict(self.version)
+
+
+def test_snapshot_key_depends_on_versions_and_salt():
+    v = [{"name": "fg", "version": 1, "commit": 1}]
+    key = training_cache.snapshot_key("t", v, {"a": 1})
+    assert key == training_cache.snapshot_key("t", [dict(v[0])], {"a": 1})
+    assert key != training_cache.snapshot_key("t", [{**v[0], "commit": 2}], {"a": 1})
+    assert key != training_cache.snapshot_key("t", v, {"a": 2})
+    assert key != training_cache.snapshot_key("u", v, {"a": 1})
+
+
+def test_load_or_build_hits_until_upstream_changes(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return pd.DataFrame({"x": [len(calls)]})
+
+    fg = FakeFG()
+    first = training_cache.load_or_build("t", [fg], build, cache_dir=str(tmp_path))
+    again = training_cache.load_or_build("t", [fg], build, cache_dir=str(tmp_path))
+    assert len(calls) == 1 and again.equals(first)
+
+    fg.version["commit"] = 2
+    changed = training_cache.load_or_build("t", [fg], build, cache_dir=str(tmp_path))
+    assert len(calls) == 2 and changed["x"].tolist() == [2]
+
+    training_cache.load_or_build("t", [fg], build, salt={"whitelist": ["st-a"]}, cache_dir=str(tmp_path))
+    assert len(calls) == 3
+
+
+def test_unversioned_upstream_is_not_cached(tmp_path):
+    calls = []
+    fg = FakeFG(commit=None, max_event_time=None)
+    for _ in range(2):
+        training_cache.load_or_build("t", [fg], lambda: calls.append(1) or pd.DataFrame({"x": [1]}),
+                                     cache_dir=str(tmp_path))
+    assert len(calls) == 2
+    assert not glob.glob(os.path.join(str(tmp_path), "*.parquet"))
+
+
+def test_old_snapshots_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(training_cache, "KEEP", 2)
+    fg = FakeFG()
+    for commit in range(4):
+        fg.version["commit"] = commit
+        training_cache.load_or_build("t", [fg], lambda: pd.DataFrame({"x": [1]}), cache_dir=str(tmp_path))
+    assert len(glob.glob(os.path.join(str(tmp_path), "t_*.parquet"))) == 2
+    assert len(glob.glob(os.path.join(str(tmp_path), "t_*.json"))) == 2
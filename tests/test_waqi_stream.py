@@ -0,0 +1,101 @@
+# tests/test_waqi_stream.py
+# WAQI 常驻采集：feed 解析、缓冲区按 (站点, 读数时间) 去重与写出阈值、写失败放回、退出时溢出 / 下次启动重放。
+
+import asyncio
+import json
+
+import pytest
+
+from airquality import waqi_stream
+
+
+def _row(sid, hour):
+    return {"station_id": sid, "api_id": 1, "time": f"2026-10-17T{hour:02d}:00:00", "aqi": 50.0,
+            "polled_at": "2026-10-17T00:00:00+00:00"}
+
+
+class BadSink:
+    name = "fg"
+
+    def write(self, rows, final=False):
+        raise RuntimeError("down")
+
+
+class ListSink:
+    name = "list"
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows, final=False):
+        self.rows += rows
+
+
+@pytest.fixture()
+def spill_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "spill.jsonl")
+    monkeypatch.setattr(waqi_stream, "SPILL_PATH", path)
+    return path
+
+
+def test_parse_feed_handles_missing_values():
+    payload = {"status": "ok", "data": {"aqi": "-", "time": {"s": "2026-10-17 08:00:00"},
+                                        "iaqi": {"pm25": {"v": 42}, "t": {"v": 24.5}}}}
+    row = waqi_stream.parse_feed(payload, {"station_id": "st-a", "api_id": "7"})
+    assert row["aqi"] is None and row["pm2_5"] == 42.0 and row["no2"] is None
+    json.dumps(row, allow_nan=False)
+    assert waqi_stream.parse_feed({"status": "error"}, {"station_id": "st-a", "api_id": 7}) is None
+
+
+def test_buffer_dedupes_and_triggers_flush():
+    buf = waqi_stream.ReadingBuffer(flush_rows=3, flush_seconds=60)
+    assert buf.add([_row("a", 1), _row("b", 1)]) == 2
+    assert buf.add([_row("a", 1), _row("a", 0)]) == 0      # 重复 / 更早的读数丢弃
+    assert buf.duplicates == 2 and not buf.due()
+    assert buf.due(now=buf.first_at + 60)                  # 时间阈值
+    buf.add([_row("a", 2)])
+    assert buf.due()                                       # 条数阈值
+
+
+def test_failed_flush_keeps_rows_in_order():
+    buf = waqi_stream.ReadingBuffer()
+    buf.add([_row("a", 1)])
+    assert waqi_stream.flush(buf, [BadSink()]) == 0
+    buf.add([_row("a", 2)])
+    sink = ListSink()
+    assert waqi_stream.flush(buf, [sink]) == 2
+    assert [r["time"][11:13] for r in sink.rows] == ["01", "02"] and not buf.rows
+
+
+def _poller(rows_per_poll, polls=1):
+    hours = iter(range(polls))
+
+    async def fake_poll(stations, token, session=None):
+        h = next(hours)
+        return [_row(f"st-{i}", h) for i in range(rows_per_poll)], []
+
+    return fake_poll
+
+
+def test_final_flush_failure_spills_then_replays(spill_path, monkeypatch):
+    monkeypatch.setattr(waqi_stream, "poll_once", _poller(rows_per_poll=2, polls=2))
+    stats = asyncio.run(waqi_stream.run([], "token", sinks=[BadSink()], poll_seconds=0, max_polls=2,
+                                        buffer=waqi_stream.ReadingBuffer(flush_rows=100)))
+    assert (stats["flushed"], stats["spilled"], stats["dropped"]) == (0, 4, 0)
+    with open(spill_path, encoding="utf-8") as f:
+        assert sum(1 for _ in f) == 4
+
+    sink = ListSink()
+    monkeypatch.setattr(waqi_stream, "poll_once", _poller(rows_per_poll=0))
+    stats = asyncio.run(waqi_stream.run([], "token", sinks=[sink], poll_seconds=0, max_polls=1))
+    assert stats["flushed"] == 4 and stats["spilled"] == 0 and len(sink.rows) == 4
+    assert waqi_stream.load_spill() == []
+
+
+def test_unwritable_spill_reports_dropped(tmp_path, monkeypatch):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(waqi_stream, "SPILL_PATH", str(blocker / "spill.jsonl"))
+    monkeypatch.setattr(waqi_stream, "poll_once", _poller(rows_per_poll=3))
+    stats = asyncio.run(waqi_stream.run([], "token", sinks=[BadSink()], poll_seconds=0, max_polls=1))
+    assert (stats["spilled"], stats["dropped"]) == (0, 3)
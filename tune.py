@@ -0,0 +1,67 @@
+# tune.py
+# 逐站点随机森林超参搜索（见 airquality/tuning.py）：时间顺序的折 + successive halving + 进程池并行
+#   python tune.py                    # 02 白名单内的全部站点
+#   python tune.py hk-tuen-mun        # 只调指定站点
+# 输出：
+#   outputs/tuning_trials.csv   每个 (站点, 轮次, 参数) 的 MAE / 训练耗时 / 预测延迟 / 文件大小，kept / pareto 标记
+#   outputs/tuned_params.json   每站点最后一轮 MAE 最低的参数；训练时设 TUNED_PARAMS=outputs/tuned_params.json 生效
+# TUNE_TRIALS / TUNE_ETA / TUNE_FOLDS / BACKTEST_HORIZON_DAYS 控制搜索规模，TRAIN_CPUS 控制并行度
+
+import os
+import sys
+import json
+import time
+import importlib
+
+from airquality import tuning
+
+OUT_DIR = "outputs"
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    station_ids = [a for a in argv if not a.startswith("--")]
+
+    p02 = importlib.import_module("02_train_and_feature_view_multi")
+    df = p02.load_training_frame()
+    if station_ids:
+        df = df[df["station_id"].isin(station_ids)]
+    feat_cols = p02.feature_columns(df)
+    frames = {sid: g for sid, g in df.groupby("station_id")}
+    if not frames:
+        raise SystemExit("[warn] 没有可调参的站点。")
+
+    configs = tuning.sample_configs()
+    print(f"[info] {len(configs)} config(s) x {len(frames)} station(s), eta={tuning.ETA}, folds<={tuning.N_FOLDS}")
+    t0 = time.perf_counter()
+    trials = tuning.search(frames, feat_cols, configs=configs)
+    secs = time.perf_counter() - t0
+    if trials.empty:
+        raise SystemExit("[warn] 没有完成任何 trial。")
+    best = tuning.best_params(trials)
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    trials_path = os.path.join(OUT_DIR, "tuning_trials.csv")
+    params_path = os.path.join(OUT_DIR, "tuned_params.json")
+    trials.to_csv(trials_path, index=False)
+    with open(params_path, "w", encoding="utf-8") as f:
+        json.dump(best, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    full_grid = len(configs) * tuning.N_FOLDS * len(frames)
+    fits = int(trials.groupby(["station_id", "config_id"])["folds"].max().sum())
+    print(f"\n=== Tuning ({secs:.1f}s, {fits} fits vs {full_grid} for every config on every fold) ===")
+    cols = ["station_id", "rung", "folds"] + list(tuning.SEARCH_SPACE) + \
+           ["mae", "fit_seconds", "predict_ms", "artifact_bytes", "pareto"]
+    final = trials[trials["rung"] == trials.groupby("station_id")["rung"].transform("max")]
+    print(final[cols].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print("\ncost/accuracy trade-offs (rung 0, pareto-optimal):")
+    front = trials[(trials["rung"] == 0) & trials["pareto"]].sort_values(["station_id", "mae"])
+    print(front[cols].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    for sid, p in sorted(best.items()):
+        print(f"[ok] {sid}: {p}")
+    print(f"[ok] trials saved -> {trials_path}")
+    print(f"[ok] best params saved -> {params_path} (use with TUNED_PARAMS={params_path})")
+
+
+if __name__ == "__main__":
+    main()